@@ -0,0 +1,28 @@
+"""add (mix_id, timestamp) index to user_activity
+
+Revision ID: a6c3e9f1d2b4
+Revises: f2a9d7c5b3e1
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a6c3e9f1d2b4'
+down_revision: Union[str, Sequence[str], None] = 'f2a9d7c5b3e1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_mix_time', 'user_activity', ['mix_id', 'timestamp'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_mix_time', 'user_activity')
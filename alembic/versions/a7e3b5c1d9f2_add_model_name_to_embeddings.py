@@ -0,0 +1,38 @@
+"""add model_name and text_hash to embeddings
+
+Revision ID: a7e3b5c1d9f2
+Revises: f1c2a9d4b7e3
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7e3b5c1d9f2'
+down_revision: Union[str, Sequence[str], None] = 'f1c2a9d4b7e3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # `embeddings` is created by `Base.metadata.create_all` on app startup;
+    # when it doesn't exist yet it will be created with these columns.
+    if 'embeddings' not in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.add_column('embeddings', sa.Column('model_name', sa.String(), nullable=False, server_default='tfidf'))
+    op.add_column('embeddings', sa.Column('text_hash', sa.String(), nullable=True))
+    op.create_index('ix_embedding_mix_model', 'embeddings', ['mix_id', 'model_name'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if 'embeddings' not in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.drop_index('ix_embedding_mix_model', 'embeddings')
+    op.drop_column('embeddings', 'text_hash')
+    op.drop_column('embeddings', 'model_name')
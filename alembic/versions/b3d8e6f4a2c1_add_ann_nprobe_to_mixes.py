@@ -0,0 +1,28 @@
+"""add ann_nprobe to mixes
+
+Revision ID: b3d8e6f4a2c1
+Revises: a7e3b5c1d9f2
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3d8e6f4a2c1'
+down_revision: Union[str, Sequence[str], None] = 'a7e3b5c1d9f2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('mixes', sa.Column('ann_nprobe', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('mixes', 'ann_nprobe')
@@ -0,0 +1,42 @@
+"""create taste_profiles table
+
+Revision ID: b8d1f4e6a2c7
+Revises: a6c3e9f1d2b4
+Create Date: 2026-10-17 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8d1f4e6a2c7'
+down_revision: Union[str, Sequence[str], None] = 'a6c3e9f1d2b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'taste_profiles',
+        sa.Column('user_id', sa.String(), nullable=False),
+        sa.Column('mix_id', sa.String(), nullable=False),
+        sa.Column('featurizer', sa.String(), nullable=False),
+        sa.Column('content_version', sa.Integer(), nullable=False),
+        sa.Column('items', sa.LargeBinary(), nullable=False),
+        sa.Column('vector', sa.LargeBinary(), nullable=False),
+        sa.Column('weight', sa.Float(), nullable=False),
+        sa.Column('last_content_id', sa.String(), nullable=True),
+        sa.Column('last_event_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now(), nullable=True),
+        sa.ForeignKeyConstraint(['mix_id'], ['mixes.id']),
+        sa.PrimaryKeyConstraint('user_id', 'mix_id', 'featurizer'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('taste_profiles')
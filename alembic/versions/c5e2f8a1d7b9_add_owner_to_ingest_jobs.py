@@ -0,0 +1,30 @@
+"""add owner and heartbeat_at to ingest_jobs
+
+Revision ID: c5e2f8a1d7b9
+Revises: b8d1f4e6a2c7
+Create Date: 2026-10-17 22:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5e2f8a1d7b9'
+down_revision: Union[str, Sequence[str], None] = 'b8d1f4e6a2c7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('ingest_jobs', sa.Column('owner', sa.String(), nullable=True))
+    op.add_column('ingest_jobs', sa.Column('heartbeat_at', sa.Float(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('ingest_jobs', 'heartbeat_at')
+    op.drop_column('ingest_jobs', 'owner')
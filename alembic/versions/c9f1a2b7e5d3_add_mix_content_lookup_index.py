@@ -0,0 +1,28 @@
+"""add (mix_id, content_id) index to mix_contents
+
+Revision ID: c9f1a2b7e5d3
+Revises: b3d8e6f4a2c1
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c9f1a2b7e5d3'
+down_revision: Union[str, Sequence[str], None] = 'b3d8e6f4a2c1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_mix_content_mix_content_id', 'mix_contents', ['mix_id', 'content_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_mix_content_mix_content_id', 'mix_contents')
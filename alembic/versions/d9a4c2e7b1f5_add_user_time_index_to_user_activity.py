@@ -0,0 +1,28 @@
+"""add (user_id, timestamp, id) index to user_activity
+
+Revision ID: d9a4c2e7b1f5
+Revises: c5e2f8a1d7b9
+Create Date: 2026-10-17 23:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd9a4c2e7b1f5'
+down_revision: Union[str, Sequence[str], None] = 'c5e2f8a1d7b9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_user_time_id', 'user_activity', ['user_id', 'timestamp', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_user_time_id', 'user_activity')
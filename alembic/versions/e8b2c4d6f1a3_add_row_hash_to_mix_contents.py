@@ -0,0 +1,29 @@
+"""add row_hash to mix_contents
+
+Revision ID: e8b2c4d6f1a3
+Revises: d4e7a1c3f9b2
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e8b2c4d6f1a3'
+down_revision: Union[str, Sequence[str], None] = 'd4e7a1c3f9b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Existing rows keep NULL; their mix is fully replaced once on the next ingest
+    op.add_column('mix_contents', sa.Column('row_hash', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('mix_contents', 'row_hash')
@@ -0,0 +1,28 @@
+"""add content_version to mixes
+
+Revision ID: f1c2a9d4b7e3
+Revises: e4a476fcecde
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1c2a9d4b7e3'
+down_revision: Union[str, Sequence[str], None] = 'e4a476fcecde'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('mixes', sa.Column('content_version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('mixes', 'content_version')
@@ -0,0 +1,28 @@
+"""add ingest_hash to mixes
+
+Revision ID: f2a9d7c5b3e1
+Revises: e8b2c4d6f1a3
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2a9d7c5b3e1'
+down_revision: Union[str, Sequence[str], None] = 'e8b2c4d6f1a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('mixes', sa.Column('ingest_hash', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('mixes', 'ingest_hash')
@@ -4,12 +4,14 @@ from backend.database import get_db
 from backend import models
 from pydantic import BaseModel
 from typing import Optional
+from backend.utils.response_cache import response_cache
 
 router = APIRouter()
 
 class BusinessRulesRequest(BaseModel):
     """Business rules for filtering and re-ranking recommendations"""
-    max_diversity: Optional[float] = 1.0  # 0-1, how diverse recommendations should be
+    max_diversity: Optional[float] = 1.0  # Legacy, ignored (diversity_weight sets MMR)
+    diversity_weight: Optional[float] = 0.0  # 0-1, MMR redundancy weight; 0 keeps relevance order
     min_content_score: Optional[float] = 0.0  # Minimum score threshold
     max_results: Optional[int] = 10  # Max number of results
     exclude_tags: Optional[list] = []  # Tags to exclude
@@ -17,6 +19,7 @@ class BusinessRulesRequest(BaseModel):
     boost_tags: Optional[list] = []  # Tags to boost in scoring
     max_from_same_tag: Optional[int] = 3  # Max recommendations from same tag
     random_sample: Optional[bool] = False  # Add randomness to recommendations
+    random_seed: Optional[int] = None  # Fixed seed makes random_sample reproducible
     pinned_content_ids: Optional[list] = []  # Content IDs to pin at top of results
 
 
@@ -51,6 +54,7 @@ def set_business_rules(mix_id: str, rules: dict = Body(...), db: Session = Depen
         existing_rules.rules = rules_dict
         db.commit()
         db.refresh(existing_rules)
+        response_cache.invalidate_rules(mix_id)
         return existing_rules
     else:
         # Create new rules
@@ -58,6 +62,7 @@ def set_business_rules(mix_id: str, rules: dict = Body(...), db: Session = Depen
         db.add(new_rules)
         db.commit()
         db.refresh(new_rules)
+        response_cache.invalidate_rules(mix_id)
         return new_rules
 
 
@@ -75,6 +80,7 @@ def get_business_rules(mix_id: str, db: Session = Depends(get_db)):
             "mix_id": mix_id,
             "rules": {
                 "max_diversity": 1.0,
+                "diversity_weight": 0.0,
                 "min_content_score": 0.0,
                 "max_results": 10,
                 "exclude_tags": [],
@@ -82,6 +88,7 @@ def get_business_rules(mix_id: str, db: Session = Depends(get_db)):
                 "boost_tags": [],
                 "max_from_same_tag": 3,
                 "random_sample": False,
+                "random_seed": None,
                 "pinned_content_ids": []
             }
         }
@@ -101,5 +108,6 @@ def delete_business_rules(mix_id: str, db: Session = Depends(get_db)):
     
     db.delete(rules)
     db.commit()
+    response_cache.invalidate_rules(mix_id)
     
     return {"message": "Rules deleted successfully"}
@@ -10,7 +10,7 @@ router = APIRouter()
 # Pydantic schema for incoming request
 class MixCreateRequest(BaseModel):
     title: str
-    quality_level: int = 2  # Default to Level 2 (1, 2, or 3)
+    quality_level: int = 2  # Default to Level 2 (1, 2, 3 or 4)
     user_id: str = None  # Owner of this mix (Supabase user ID)
 
 # DB dependency
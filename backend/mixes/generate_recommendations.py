@@ -1,333 +1,423 @@
 from fastapi import APIRouter, HTTPException, Depends
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import pandas as pd, json
-from backend.paths import mix_csv_path, mix_mapping_path
+from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from backend.database import get_db
-from backend.models import MixContent, Embedding
+from typing import List, Optional
 import numpy as np
-from io import BytesIO
-
-# Initialize sentence transformer for Level 3 (lazy load on first use)
-_sentence_transformer_model = None
-
-def get_sentence_transformer():
-    """Lazy load the sentence transformer model on first use"""
-    global _sentence_transformer_model
-    if _sentence_transformer_model is None:
-        try:
-            from sentence_transformers import SentenceTransformer
-            print("DEBUG: Loading sentence-transformers model for Level 3...")
-            _sentence_transformer_model = SentenceTransformer('all-MiniLM-L6-v2')
-            print("DEBUG: Sentence-transformers model loaded successfully")
-        except Exception as e:
-            print(f"ERROR: Failed to load sentence-transformers: {e}")
-            raise
-    return _sentence_transformer_model
+from backend import settings
+from backend.database import get_db
+from backend.models import Mix, BusinessRules
+from backend.utils.als import get_serving_model
+from backend.utils.apply_rules import apply_plan, get_rules_plan
+from backend.utils.cooccurrence import CoOccurrence, get_cooccurrence
+from backend.utils.executors import run_blocking
+from backend.utils.featurize import featurizer_for_level, get_mix_features
+from backend.utils.log import log_event
+from backend.utils.metrics import request_timer, stage
+from backend.utils.model_cache import MixFeatures
+from backend.utils.neighbors import lookup_neighbors
+from backend.utils.response_cache import response_cache
+from backend.utils.scoring import candidate_scores, similarity_rows, top_k_indices, vector_scores
+from backend.utils.taste import UserTaste, get_user_tastes
+
+# (seed similarity weight, collaborative boost weight, co-occurrence weight) per hybrid level:
+# Level 2 - 30% TF-IDF + 70% collaborative boost (collaborative dominates),
+#           plus 50% of the item co-occurrence with the user's watched items
+# Level 3 - 80% semantic understanding + 20% collaborative boost (semantic dominates),
+#           plus 20% co-occurrence
+HYBRID_WEIGHTS = {2: (0.3, 0.7, 0.5), 3: (0.8, 0.2, 0.2)}
+# Level 4 - ranked by the mix's trained ALS model; requests it can't rank
+#           (seeded ones, users it wasn't trained on, untrained mixes) get the Level 2 blend
+HYBRID_WEIGHTS[4] = HYBRID_WEIGHTS[2]
+
+# Seeds scored per matrix-matrix product in the batch endpoint (bounds the
+# size of the dense seeds x items similarity block)
+BATCH_BLOCK_ROWS = 256
+
+# `based_on` of responses ranked by a user's ALS factors
+FACTORS_BASIS = "user_factors"
 
 
 router = APIRouter()
+
+
+class RecommendationQuery(BaseModel):
+    user_id: Optional[str] = None
+    content_id: Optional[str] = None
+
+
+class BatchRecommendationsRequest(BaseModel):
+    mix_id: str
+    requests: List[RecommendationQuery]
+    top_k: int = 5
+    quality_level: Optional[int] = None
+
+
 @router.get("/generate-recommendations")
 async def generate_recommendations(mix_id: str, user_id: str = None, content_id: str = None, top_k: int = 5, quality_level: int = None, db: Session = Depends(get_db)):
+    # DB queries and scoring block, so they run on the executor pool
+    return await run_blocking(recommend, db, mix_id, user_id, content_id, top_k, quality_level)
+
+
+def recommend(db: Session, mix_id: str, user_id: Optional[str], content_id: Optional[str], top_k: int, quality_level: Optional[int]) -> dict:
+    """Recommendations for one seed / user (see `generate_recommendations`).
+
+    Identical requests are answered from the response cache until the mix's
+    content, its business rules or the user's activity change. Responses
+    drawn by an unseeded `random_sample` are not cached, so every request
+    gets a fresh draw.
+    """
     mix_id = mix_id.strip()
-    
-    # Fetch mix from DB to get default quality level
-    mix = db.query(MixContent).filter(MixContent.mix_id == mix_id).first()
-    if not mix:
-        # Try to get from Mix table if no content yet
-        from backend.models import Mix
-        mix = db.query(Mix).filter(Mix.id == mix_id).first()
-    
-    # Use provided quality_level or default to mix's quality_level
-    if quality_level is None and mix:
-        from backend.models import Mix
+
+    # The key carries the current versions, so it must be built before computing
+    cache_key = response_cache.make_key(mix_id, content_id, user_id, quality_level, top_k)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        with request_timer(mix_id) as timer:
+            timer.quality_level = quality_level
+            timer.cache = "response"
+        return cached
+
+    rules = load_rules(db, mix_id)
+    response = compute_recommendations(db, mix_id, user_id, content_id, top_k, quality_level, rules)
+    if not samples_randomly(rules):
+        response_cache.put(cache_key, response)
+    return response
+
+
+def compute_recommendations(db: Session, mix_id: str, user_id: Optional[str], content_id: Optional[str], top_k: int, quality_level: Optional[int], rules: Optional[dict]) -> dict:
+    """Uncached body of `recommend`."""
+    with request_timer(mix_id) as timer:
+        # Use provided quality_level or default to mix's quality_level
         mix_obj = db.query(Mix).filter(Mix.id == mix_id).first()
-        if mix_obj:
-            quality_level = int(mix_obj.quality_level)
-        else:
-            quality_level = 2
-    elif quality_level is None:
-        quality_level = 2
-    
-    csv_path = mix_csv_path(mix_id)
-    mapping_path = mix_mapping_path(mix_id)
-    # Prefer canonical data from the DB (MixContent). This makes the DB the
-    # single source of truth for recommendations. If the DB has no rows for
-    # the mix, fall back to CSV + mapping on disk (legacy behavior).
-    rows = (
-        db.query(MixContent)
-        .filter(MixContent.mix_id == mix_id)
-        .all()
-    )
-
-    if rows:
-        df = pd.DataFrame([
-            {
-                "content_id": r.content_id,
-                "title": r.title,
-                "description": r.description,
-                "tags": r.tags,
-            }
-            for r in rows
-        ])
-    else:
-        df = None
-
-        # Try CSV + mapping on disk (legacy flow)
-        # Prefer mapping stored in DB (if migrated), otherwise fall back to file
-        from backend.models import FieldMapping
-
-        mapping = None
-        try:
-            fm = db.query(FieldMapping).filter(FieldMapping.mix_id == mix_id).one_or_none()
-            if fm:
-                mapping = fm.mappings
-        except Exception:
-            mapping = None
-
-        if mapping is None and mapping_path.exists():
-            try:
-                with open(mapping_path) as f:
-                    mapping = json.load(f)["mappings"]
-            except Exception as e:
-                raise HTTPException(400, detail=f"Invalid mapping JSON: {e}")
-
-        if mapping is not None and csv_path.exists():
-            try:
-                df = pd.read_csv(csv_path)
-            except Exception as e:
-                raise HTTPException(400, detail=f"Failed reading CSV: {e}")
-
-            df = df.rename(columns=mapping)
-        else:
-            # No DB rows and no csv/mapping -> not found
-            raise HTTPException(404, detail=f"Mix data or mapping not found. csv={csv_path}, mapping={mapping_path}")
+        quality_level = resolve_quality_level(mix_obj, quality_level)
+        timer.quality_level = quality_level
 
-    if "content_id" not in df.columns:
-        raise HTTPException(400, detail="Mapped column 'content_id' is required but missing after rename.")
+        # Get more items than top_k so business rules can filter/reorder
+        # (pinning, exclude tags, etc. need more options to work with)
+        expanded_k = max(100, top_k * 5)  # Get at least 100 or 5x top_k items
 
-    # Build the text field for similarity - include title, description, AND tags/genre
-    # This ensures the LLM embeddings understand genre relationships
-    title = df["title"] if "title" in df.columns else pd.Series([""] * len(df))
-    desc = df["description"] if "description" in df.columns else pd.Series([""] * len(df))
-    tags = df["tags"] if "tags" in df.columns else pd.Series([""] * len(df))
-    
-    # Repeat tags 3x to give genre more weight in the embedding
-    tags_weighted = tags.fillna("").apply(lambda x: f"{x} {x} {x}" if x else "")
-    df["text"] = title.fillna("") + " " + desc.fillna("") + " " + tags_weighted
-    
-    print(f"DEBUG: Sample text for embedding: {df['text'].iloc[0][:200] if len(df) > 0 else 'empty'}")
+        # Seed-only requests don't depend on any user, so they're answered from
+        # the neighbour table precomputed at ingest when it's fresh (unless tag
+        # rules have to filter the whole catalog first)
+        if user_id is None and content_id is not None and not filters_tags(rules):
+            with timer.stage("neighbor_lookup"):
+                recommendations = lookup_neighbors(db, mix_id, featurizer_for_level(quality_level), content_id, expanded_k)
+            if recommendations is not None:
+                timer.cache = "neighbors"
+                return finish_recommendations(db, mix_id, user_id, content_id, quality_level, top_k, recommendations, rules)
 
-    if df.empty:
-        raise HTTPException(400, detail="No content available")
-    if (df["text"].str.strip() == "").all():
-        raise HTTPException(400, detail="All text rows are empty after mapping.")
+        # Featurized catalog for this mix (content_id index, feature matrix, tags).
+        # Served from the process-wide model cache unless the mix's content
+        # version changed since it was last featurized.
+        features = get_mix_features(db, mix_id, quality_level)
 
-    # Handle tiny datasets
-    if len(df) == 1 and content_id is None:
-        return {"mix_id": mix_id, "based_on": "first_item", "recommendations": []}
+        # Handle tiny datasets
+        if len(features.df) == 1 and content_id is None:
+            return {"mix_id": mix_id, "based_on": "first_item", "recommendations": []}
+
+        # The user's taste profile (latest activity, watched items, taste
+        # vector) drives the seed and the Level 2/3 boost
+        with timer.stage("taste"):
+            taste = (get_user_tastes(db, mix_id, features, featurizer_for_level(quality_level), [user_id])[user_id]
+                     if user_id else None)
+
+        # Level 4: a user the trained factor model knows is ranked by it
+        if quality_level == 4 and taste is not None and content_id is None:
+            with timer.stage("factor_model"):
+                serving = get_serving_model(db, mix_id, features)
+            if serving is not None and serving.knows(user_id):
+                allowed = get_rules_plan(db, mix_id, rules, features)[0].allowed if rules else None
+                with timer.stage("factors"):
+                    recommendations = rank_by_factors(features, serving.user_scores([user_id])[0], expanded_k,
+                                                      taste, allowed)
+                return finish_recommendations(db, mix_id, user_id, None, quality_level, top_k, recommendations, rules,
+                                              features, based_on=FACTORS_BASIS)
+
+        # What other users watched alongside the user's items (Level 2/3)
+        cooccurrence = None
+        if taste is not None and quality_level in HYBRID_WEIGHTS:
+            with timer.stage("cooccurrence"):
+                cooccurrence = get_cooccurrence(db, mix_id, features)
 
-    # Compute similarity based on quality level
-    if quality_level == 3:
-        # Level 3: Use semantic embeddings (sentence-transformers)
-        print("DEBUG Level 3: Computing semantic embeddings...")
-        model = get_sentence_transformer()
-        texts = df["text"].fillna("").tolist()
-        embeddings = model.encode(texts, show_progress_bar=False)
-        sim = cosine_similarity(embeddings)
-        print(f"DEBUG Level 3: Computed {len(embeddings)} semantic embeddings")
-    else:
-        # Level 1 & 2: Use TF-IDF
-        # Clear old embeddings and recompute fresh to ensure tags/genre are included
-        # This is important after algorithm updates that change the text field
-        print(f"DEBUG Level {quality_level}: Computing TF-IDF with genre-weighted text...")
-        
-        # Always recompute TF-IDF to ensure we use the latest text (with tags)
-        tfidf_sparse = TfidfVectorizer().fit_transform(df["text"])
-        try:
-            tfidf = tfidf_sparse.toarray()
-        except Exception:
-            # fallback: convert each row
-            tfidf = np.vstack([row.toarray().ravel() for row in tfidf_sparse])
-        sim = cosine_similarity(tfidf)
-        
-        print(f"DEBUG Level {quality_level}: Computed TF-IDF for {len(df)} items")
-
-    if content_id is None:
-        # If user_id provided, get their most recent watching activity
-        if user_id:
-            from backend.models import UserActivity
-            recent_activity = db.query(UserActivity).filter(
-                UserActivity.user_id == user_id,
-                UserActivity.mix_id == mix_id
-            ).order_by(UserActivity.timestamp.desc()).first()
-            
-            if recent_activity:
-                content_id = recent_activity.content_id
-        
-        # If still no content_id, use first item
         if content_id is None:
-            seed_idx = 0
+            # If user_id provided, seed from their most recent watching activity
+            if taste is not None:
+                content_id = taste.last_content_id
+
+            # If still no content_id (or it's no longer in the catalog), use first item
+            seed_idx = features.index.get(str(content_id), 0) if content_id is not None else 0
         else:
-            idx = df.index[df["content_id"] == content_id]
-            if len(idx) == 0:
-                seed_idx = 0
-            else:
-                seed_idx = int(idx[0])
-    else:
-        idx = df.index[df["content_id"] == content_id]
-        if len(idx) == 0:
-            raise HTTPException(404, detail="Content ID not found")
-        seed_idx = int(idx[0])
-
-    scores = sim[seed_idx]
-    order = scores.argsort()[::-1]
-    order = [i for i in order if i != seed_idx]
-    
-    # Get more items than top_k so business rules can filter/reorder
-    # (pinning, exclude tags, etc. need more options to work with)
-    expanded_k = max(100, top_k * 5)  # Get at least 100 or 5x top_k items
-    k = max(0, min(expanded_k, len(order)))
-    print(f"DEBUG: top_k={top_k}, expanded_k={expanded_k}, k={k}, len(order)={len(order)}")
-    top_indices = order[:k]
+            seed_idx = features.index.get(str(content_id))
+            if seed_idx is None:
+                raise HTTPException(404, detail="Content ID not found")
 
-    cols = [c for c in ["content_id", "title", "description", "tags"] if c in df.columns]
-    recommendations = df.iloc[top_indices][cols].to_dict(orient="records")
-    
-    # Add scores to recommendations based on quality level
-    if quality_level == 2 and user_id:
-        # Level 2: Collaborative Filtering - boost items similar to what user watched
-        from backend.models import UserActivity
-        
-        # Get items the user has already watched
-        watched_items = db.query(UserActivity.content_id).filter(
-            UserActivity.user_id == user_id,
-            UserActivity.mix_id == mix_id
-        ).all()
-        watched_content_ids = set(r[0] for r in watched_items)
-        print(f"DEBUG Level 2: watched_content_ids = {watched_content_ids}")
-        
-        # For each watched item, find its similarity to use as a boost signal
-        watched_scores = {}
-        for watched_id in watched_content_ids:
-            watched_idx = df.index[df["content_id"] == watched_id]
-            if len(watched_idx) > 0:
-                watched_idx = int(watched_idx[0])
-                watched_sims = sim[watched_idx]  # Similarity of watched item to ALL items
-                watched_scores[watched_id] = watched_sims
-        
-        # Apply collaborative filtering: boost items similar to watched items
-        # Also filter out watched items completely
-        filtered_recommendations = []
-        for i, idx in enumerate(top_indices):
-            tfidf_score = float(scores[idx])
-            content_id_val = df.iloc[idx]["content_id"]
-            
-            if content_id_val in watched_content_ids:
-                # Skip watched items entirely - don't include in results
-                print(f"DEBUG Level 2: {content_id_val} is watched, filtering out")
+        # include/exclude tag rules as an item mask, applied before top-k
+        allowed = get_rules_plan(db, mix_id, rules, features)[0].allowed if rules else None
+
+        # Level 3: semantic embeddings (sentence-transformers)
+        # Level 1 & 2: TF-IDF with genre-weighted text
+        # Only the seed's similarity row is computed, not the full N x N matrix.
+        with timer.stage("similarity"):
+            scores = seed_similarity(features, mix_obj, seed_idx, expanded_k, allowed)
+
+        with timer.stage("hybrid"):
+            recommendations = rank_for_seed(features, quality_level, seed_idx, scores, expanded_k, top_k,
+                                            taste, cooccurrence)
+
+        return finish_recommendations(db, mix_id, user_id, content_id, quality_level, top_k, recommendations, rules, features)
+
+
+@router.post("/generate-recommendations/batch")
+async def generate_recommendations_batch(request: BatchRecommendationsRequest, db: Session = Depends(get_db)):
+    """Recommendations for many (user_id, content_id) pairs of one mix."""
+    return await run_blocking(recommend_batch, db, request)
+
+
+def recommend_batch(db: Session, request: BatchRecommendationsRequest) -> dict:
+    """Recommendations for many (user_id, content_id) pairs of one mix.
+
+    The mix is loaded and featurized once, every user's taste profile is
+    fetched in one query (missing ones rebuilt from one history query), and
+    all seed rows - or, at Level 4, the factor rows of the users the model
+    knows - are scored with matrix-matrix products over the shared item
+    matrix. Business rules are applied to each result. Results come back in request order; a request whose
+    content_id isn't in the mix gets an `error` entry instead of failing
+    the whole batch.
+    """
+    mix_id = request.mix_id.strip()
+    top_k = request.top_k
+
+    with request_timer(mix_id) as timer:
+        mix_obj = db.query(Mix).filter(Mix.id == mix_id).first()
+        quality_level = resolve_quality_level(mix_obj, request.quality_level)
+        timer.quality_level = quality_level
+        features = get_mix_features(db, mix_id, quality_level)
+
+        with timer.stage("taste"):
+            user_ids = [q.user_id for q in request.requests if q.user_id]
+            tastes = get_user_tastes(db, mix_id, features, featurizer_for_level(quality_level), user_ids)
+            rules = load_rules(db, mix_id)
+        cooccurrence = None
+        if user_ids and quality_level in HYBRID_WEIGHTS:
+            with timer.stage("cooccurrence"):
+                cooccurrence = get_cooccurrence(db, mix_id, features)
+
+        expanded_k = max(100, top_k * 5)
+        allowed = get_rules_plan(db, mix_id, rules, features)[0].allowed if rules else None
+
+        # Level 4: unseeded requests of users the trained model knows
+        factor_scores = {}
+        serving = None
+        if quality_level == 4 and user_ids:
+            with timer.stage("factor_model"):
+                serving = get_serving_model(db, mix_id, features)
+        if serving is not None:
+            with timer.stage("factors"):
+                factor_users = sorted({q.user_id for q in request.requests
+                                       if q.content_id is None and serving.knows(q.user_id)})
+                for start in range(0, len(factor_users), BATCH_BLOCK_ROWS):
+                    block_users = factor_users[start:start + BATCH_BLOCK_ROWS]
+                    block = serving.user_scores(block_users)
+                    if allowed is not None:
+                        block[:, ~allowed] = -np.inf
+                    factor_scores.update(zip(block_users, block))
+
+        # Resolve every other request to a seed row (same rules as the single endpoint)
+        seeds = []
+        for q in request.requests:
+            if q.content_id is None and q.user_id in factor_scores:
+                seeds.append((None, None))
                 continue
+            taste = tastes.get(q.user_id) if q.user_id else None
+            content_id = q.content_id
+            if content_id is None:
+                if taste is not None:
+                    content_id = taste.last_content_id
+                seed_idx = features.index.get(str(content_id), 0) if content_id is not None else 0
             else:
-                # Sum similarity of this item to all watched items (collaborative boost)
-                collab_boost = sum(watched_sims[idx] for watched_sims in watched_scores.values())
-                # Normalize by number of watched items to keep score stable
-                if watched_content_ids:
-                    collab_boost = collab_boost / len(watched_content_ids)
-                
-                # 30% TF-IDF + 70% collaborative boost (collaborative dominates)
-                hybrid_score = (tfidf_score * 0.3) + (collab_boost * 0.7)
-                print(f"DEBUG Level 2: {content_id_val} TF-IDF={tfidf_score:.4f}, collab_boost={collab_boost:.4f}, hybrid={hybrid_score:.4f}")
-            
-            rec = recommendations[i].copy()
-            rec["score"] = float(hybrid_score)
-            filtered_recommendations.append(rec)
-        
-        recommendations = filtered_recommendations
-        
-        # RE-SORT by new hybrid scores (create different ranking than Level 1)
-        recommendations = sorted(recommendations, key=lambda x: x.get("score", 0), reverse=True)
-        print(f"DEBUG Level 2: After re-sort = {[r.get('content_id') for r in recommendations[:5]]}")
-    elif quality_level == 3 and user_id:
-        # Level 3: Semantic similarity + collaborative boost (premium level)
-        from backend.models import UserActivity
-        
-        # Get items the user has already watched
-        watched_items = db.query(UserActivity.content_id).filter(
-            UserActivity.user_id == user_id,
-            UserActivity.mix_id == mix_id
-        ).all()
-        watched_content_ids = set(r[0] for r in watched_items)
-        print(f"DEBUG Level 3: watched_content_ids = {watched_content_ids}")
-        
-        # For each watched item, get its semantic similarity to all items (collaborative signal)
-        watched_scores = {}
-        for watched_id in watched_content_ids:
-            watched_idx = df.index[df["content_id"] == watched_id]
-            if len(watched_idx) > 0:
-                watched_idx = int(watched_idx[0])
-                watched_sims = sim[watched_idx]  # Semantic similarity of watched item to ALL items
-                watched_scores[watched_id] = watched_sims
-        
-        # Apply semantic similarity + collaborative boost + user history
-        # Also filter out watched items completely
-        filtered_recommendations = []
-        for i, idx in enumerate(top_indices):
-            semantic_score = float(scores[idx])
-            content_id_val = df.iloc[idx]["content_id"]
-            
-            if content_id_val in watched_content_ids:
-                # Skip watched items entirely - don't include in results
-                print(f"DEBUG Level 3: {content_id_val} is watched, filtering out")
+                seed_idx = features.index.get(str(content_id))
+            seeds.append((content_id, seed_idx))
+
+        seed_rows = sorted({idx for _, idx in seeds if idx is not None})
+        seed_scores = {}
+        with timer.stage("similarity"):
+            if features.ann is not None:
+                for idx in seed_rows:
+                    seed_scores[idx] = seed_similarity(features, mix_obj, idx, expanded_k, allowed)
+            else:
+                for start in range(0, len(seed_rows), BATCH_BLOCK_ROWS):
+                    block_rows = seed_rows[start:start + BATCH_BLOCK_ROWS]
+                    block = similarity_rows(features.matrix, block_rows)
+                    if allowed is not None:
+                        block[:, ~allowed] = -np.inf
+                    seed_scores.update(zip(block_rows, block))
+
+        results = []
+        for q, (content_id, seed_idx) in zip(request.requests, seeds):
+            based_on = None
+            if q.content_id is None and q.user_id in factor_scores:
+                with timer.stage("factors"):
+                    recommendations = rank_by_factors(features, factor_scores[q.user_id], expanded_k,
+                                                      tastes[q.user_id])
+                based_on = FACTORS_BASIS
+            elif seed_idx is None:
+                results.append({"user_id": q.user_id, "content_id": q.content_id, "error": "Content ID not found"})
+                continue
+            elif len(features.df) == 1 and q.content_id is None:
+                results.append({"mix_id": mix_id, "based_on": "first_item", "recommendations": []})
                 continue
             else:
-                # Boost items semantically similar to watched items (collaborative signal)
-                collab_boost = sum(watched_sims[idx] for watched_sims in watched_scores.values())
-                # Normalize by number of watched items
-                if watched_content_ids:
-                    collab_boost = collab_boost / len(watched_content_ids)
-                
-                # 80% semantic understanding + 20% collaborative boost (semantic dominates)
-                hybrid_score = (semantic_score * 0.8) + (collab_boost * 0.2)
-                print(f"DEBUG Level 3: {content_id_val} semantic={semantic_score:.4f}, collab_boost={collab_boost:.4f}, hybrid={hybrid_score:.4f}")
-            
-            rec = recommendations[i].copy()
-            rec["score"] = float(hybrid_score)
-            filtered_recommendations.append(rec)
-        
-        recommendations = filtered_recommendations
-        
-        # RE-SORT by new hybrid scores (create premium ranking with both signals)
-        recommendations = sorted(recommendations, key=lambda x: x.get("score", 0), reverse=True)
-        print(f"DEBUG Level 3: After re-sort = {[r.get('content_id') for r in recommendations[:5]]}")
-    elif quality_level == 3:
-        # Level 3 without user_id: Just use semantic similarity scores
-        print(f"DEBUG Level 3: Using semantic embeddings scores (no user history)")
-        for i, idx in enumerate(top_indices):
-            recommendations[i]["score"] = float(scores[idx])
-    else:
-        # Level 1: Just use TF-IDF scores
-        for i, idx in enumerate(top_indices):
-            recommendations[i]["score"] = float(scores[idx])
-    
-    # Apply business rules if they exist
-    from backend.models import BusinessRules
+                with timer.stage("hybrid"):
+                    recommendations = rank_for_seed(features, quality_level, seed_idx, seed_scores[seed_idx], expanded_k,
+                                                    top_k, tastes.get(q.user_id) if q.user_id else None, cooccurrence)
+            if rules:
+                with timer.stage("business_rules"):
+                    recommendations = apply_business_rules(db, mix_id, quality_level, recommendations, rules, features)
+            results.append(build_response(mix_id, q.user_id, content_id, quality_level, recommendations[:top_k],
+                                          based_on))
+
+        return {"mix_id": mix_id, "quality_level": quality_level, "results": results}
+
+
+def resolve_quality_level(mix_obj: Optional[Mix], quality_level: Optional[int]) -> int:
+    """Requested quality level, else the mix's default, else Level 2."""
+    if quality_level is not None:
+        return quality_level
+    if mix_obj:
+        return int(mix_obj.quality_level)
+    return 2
+
+
+def load_rules(db: Session, mix_id: str) -> Optional[dict]:
     rules_config = db.query(BusinessRules).filter(BusinessRules.mix_id == mix_id).first()
-    
-    if rules_config:
-        recommendations = apply_business_rules(recommendations, rules_config.rules)
+    return rules_config.rules if rules_config else None
+
+
+def samples_randomly(rules: Optional[dict]) -> bool:
+    """Do the rules draw a different random sample on every request (no seed)?"""
+    return bool(rules and rules.get("random_sample") and rules.get("random_seed") is None)
+
+
+def filters_tags(rules: Optional[dict]) -> bool:
+    """Do the rules restrict the catalog by tag (include/exclude)?"""
+    return bool(rules and (rules.get("include_tags") or rules.get("exclude_tags")))
+
+
+def seed_similarity(features: MixFeatures, mix_obj: Optional[Mix], seed_idx: int, expanded_k: int,
+                    allowed: Optional[np.ndarray] = None) -> np.ndarray:
+    """Similarity of the seed to every item; items outside ``allowed`` score -inf."""
+    if features.ann is not None:
+        # Large mix: the IVF index proposes candidates, which are scored exactly
+        nprobe = (mix_obj.ann_nprobe if mix_obj and mix_obj.ann_nprobe else settings.ANN_DEFAULT_NPROBE)
+        candidates = features.ann.search(features.matrix[seed_idx], expanded_k + 1, nprobe=nprobe)
+        if allowed is not None:
+            candidates = candidates[allowed[candidates]]
+            if len(candidates) < expanded_k:
+                # Restrictive filter: score every allowed item exactly instead
+                candidates = np.flatnonzero(allowed)
+        return candidate_scores(features.matrix, seed_idx, candidates)
+
+    scores = similarity_rows(features.matrix, [seed_idx])[0]
+    if allowed is not None:
+        scores[~allowed] = -np.inf
+    return scores
+
+
+def rank_for_seed(features: MixFeatures, quality_level: int, seed_idx: int, scores: np.ndarray, expanded_k: int,
+                  top_k: int, taste: Optional[UserTaste], cooccurrence: Optional[CoOccurrence] = None) -> List[dict]:
+    """Turn a seed's similarity row into scored candidate records (before business rules).
+
+    ``taste`` is the requesting user's profile (None without a user) and
+    ``cooccurrence`` the mix's item co-occurrence.
+    """
+    df = features.df
+    top_indices = top_k_indices(scores, expanded_k, exclude=[seed_idx])
+    top_indices = top_indices[np.isfinite(scores[top_indices])]
+    candidate_scores = scores[top_indices]
+
+    if quality_level in HYBRID_WEIGHTS and taste is not None:
+        # Level 2: Collaborative Filtering - boost items similar to what user watched
+        # Level 3: Semantic similarity + collaborative boost (premium level)
+        seed_weight, collab_weight, cooccurrence_weight = HYBRID_WEIGHTS[quality_level]
+
+        # Filter out watched items completely
+        watched = np.isin(top_indices, taste.items)
+        top_indices = top_indices[~watched]
+        candidate_scores = candidate_scores[~watched]
+
+        # Mean similarity of each candidate to the watched items (collaborative
+        # boost): the candidates' rows against the user's taste vector
+        if taste.weight:
+            collab_boost = vector_scores(features.matrix, top_indices, taste.mean())
+        else:
+            collab_boost = np.zeros(len(top_indices), dtype=np.float32)
+
+        # Mean co-occurrence of each candidate with the watched items (other
+        # users' behaviour; zero until someone else watched them too)
+        if cooccurrence is not None:
+            cooccurrence_boost = cooccurrence.scores(taste.items, top_indices)
+        else:
+            cooccurrence_boost = np.zeros(len(top_indices), dtype=np.float32)
+
+        hybrid = seed_weight * candidate_scores + collab_weight * collab_boost + cooccurrence_weight * cooccurrence_boost
+
+        # RE-SORT by new hybrid scores (stable, so equal scores keep similarity order)
+        order = np.argsort(-hybrid, kind="stable")
+        top_indices = top_indices[order]
+        candidate_scores = hybrid[order]
+        log_event("hybrid_rerank", quality_level=quality_level, watched_filtered=int(watched.sum()),
+                  top=df["content_id"].iloc[top_indices[:5]].tolist())
+
+    log_event("candidates", top_k=top_k, expanded_k=expanded_k, k=len(top_indices), n_items=len(scores))
+    return candidate_records(df, top_indices, candidate_scores)
+
+
+def rank_by_factors(features: MixFeatures, scores: np.ndarray, expanded_k: int, taste: UserTaste,
+                    allowed: Optional[np.ndarray] = None) -> List[dict]:
+    """Candidate records of a Level 4 user from their ALS scores (watched items excluded)."""
+    if allowed is not None:
+        scores[~allowed] = -np.inf
+    top_indices = top_k_indices(scores, expanded_k, exclude=taste.items.tolist())
+    top_indices = top_indices[np.isfinite(scores[top_indices])]
+    return candidate_records(features.df, top_indices, scores[top_indices])
+
+
+def candidate_records(df, top_indices: np.ndarray, scores: np.ndarray) -> List[dict]:
+    """Catalog records of the candidate rows, each with its score."""
+    cols = [c for c in ["content_id", "title", "description", "tags"] if c in df.columns]
+    recommendations = df.iloc[top_indices][cols].to_dict(orient="records")
+    for rec, score in zip(recommendations, scores.tolist()):
+        rec["score"] = float(score)
+    return recommendations
+
+
+def finish_recommendations(db: Session, mix_id: str, user_id: Optional[str], content_id: Optional[str],
+                           quality_level: int, top_k: int, recommendations: List[dict],
+                           rules: Optional[dict], features: Optional[MixFeatures] = None,
+                           based_on: Optional[str] = None) -> dict:
+    """Apply the mix's business rules, cut to top_k and build the response."""
+    # Apply business rules if they exist
+    with stage("business_rules"):
+        if rules:
+            recommendations = apply_business_rules(db, mix_id, quality_level, recommendations, rules, features)
     
     # NOW limit to top_k after rules are applied
     recommendations = recommendations[:top_k]
     
+    return build_response(mix_id, user_id, content_id, quality_level, recommendations, based_on)
+
+
+def build_response(mix_id: str, user_id: Optional[str], content_id: Optional[str], quality_level: int, recommendations: List[dict],
+                   based_on: Optional[str] = None) -> dict:
     # Quality level affects the response
     # 1 = Traditional ML (just return top_k)
     # 2 = Hybrid (return with scores)
     # 3 = LLM Embeddings (would require additional processing)
+    # 4 = Matrix factorisation (ALS) for users the trained model knows, else Hybrid
     response = {
         "mix_id": mix_id,
         "user_id": user_id,
-        "based_on": content_id or "first_item",
+        "based_on": based_on or content_id or "first_item",
         "quality_level": quality_level,
         "recommendations": recommendations
     }
@@ -336,7 +426,9 @@ async def generate_recommendations(mix_id: str, user_id: str = None, content_id:
     if quality_level == 3:
         response["method"] = "LLM Embeddings"
         response["note"] = "Using advanced semantic understanding"
-    elif quality_level == 2:
+    elif quality_level == 4 and based_on == FACTORS_BASIS:
+        response["method"] = "Matrix Factorization (ALS)"
+    elif quality_level in (2, 4):
         response["method"] = "Hybrid ML"
     else:
         response["method"] = "Traditional ML"
@@ -344,81 +436,20 @@ async def generate_recommendations(mix_id: str, user_id: str = None, content_id:
     return response
 
 
-def apply_business_rules(recommendations, rules):
-    """Apply business rules to filter and re-rank recommendations"""
-    print(f"DEBUG apply_business_rules: input rules = {rules}")
-    print(f"DEBUG apply_business_rules: input recommendations = {[r.get('content_id') for r in recommendations]}")
-    
-    filtered = recommendations.copy()
-    
-    # Filter by minimum score threshold
-    if rules.get("min_content_score", 0) > 0:
-        filtered = [r for r in filtered if r.get("score", 0) >= rules["min_content_score"]]
-    
-    # Filter by excluded tags
-    exclude_tags = rules.get("exclude_tags", [])
-    if exclude_tags:
-        filtered = [r for r in filtered if not any(tag in r.get("tags", "") for tag in exclude_tags)]
-    
-    # Filter to only included tags (if specified)
-    include_tags = rules.get("include_tags", [])
-    if include_tags:
-        filtered = [r for r in filtered if any(tag in r.get("tags", "") for tag in include_tags)]
-    
-    # Enforce max from same tag
-    max_from_same_tag = rules.get("max_from_same_tag", 3)
-    tag_counts = {}
-    final = []
-    for rec in filtered:
-        tags = rec.get("tags", "").split(",") if rec.get("tags") else []
-        added = False
-        for tag in tags:
-            tag = tag.strip()
-            if tag not in tag_counts:
-                tag_counts[tag] = 0
-            if tag_counts[tag] < max_from_same_tag:
-                tag_counts[tag] += 1
-                if rec not in final:
-                    final.append(rec)
-                added = True
-                break
-        if not added and not tags:
-            # Item has no tags, add it
-            if rec not in final:
-                final.append(rec)
-    
-    filtered = final
-    
-    # Boost tags in scoring
-    boost_tags = rules.get("boost_tags", [])
-    if boost_tags:
-        for rec in filtered:
-            if any(tag in rec.get("tags", "") for tag in boost_tags):
-                rec["score"] = min(1.0, rec.get("score", 0) * 1.2)  # Boost by 20%
-    
-    # Pin content IDs at the top
-    pinned_ids = rules.get("pinned_content_ids", [])
-    print(f"DEBUG: pinned_ids = {pinned_ids}")
-    if pinned_ids:
-        pinned = []
-        unpinned = []
-        for rec in filtered:
-            content_id = rec.get("content_id")
-            print(f"DEBUG: checking {content_id} in {pinned_ids} = {content_id in pinned_ids}")
-            if rec.get("content_id") in pinned_ids:
-                pinned.append(rec)
-            else:
-                unpinned.append(rec)
-        print(f"DEBUG: pinned items = {[r.get('content_id') for r in pinned]}")
-        print(f"DEBUG: unpinned items = {[r.get('content_id') for r in unpinned]}")
-        # Pinned items first, then others
-        filtered = pinned + unpinned
-        print(f"DEBUG: after pinning, filtered = {[r.get('content_id') for r in filtered]}")
-    
-    # Limit results
-    max_results = rules.get("max_results", 10)
-    filtered = filtered[:max_results]
-    
-    return filtered
+def apply_business_rules(db: Session, mix_id: str, quality_level: int, recommendations: List[dict], rules: dict,
+                         features: Optional[MixFeatures] = None) -> List[dict]:
+    """Apply business rules to filter and re-rank recommendations.
 
+    The rules are compiled once per rules / content version (see
+    `backend.utils.apply_rules`) and run as masks over the candidates.
+    `diversity_weight` re-ranks with MMR over the mix's cached feature matrix.
+    """
+    log_event("apply_business_rules", rules=rules, input=[r.get("content_id") for r in recommendations])
 
+    if features is None and float(rules.get("diversity_weight") or 0) > 0:
+        features = get_mix_features(db, mix_id, quality_level)
+    plan, tag_index = get_rules_plan(db, mix_id, rules, features)
+    filtered = apply_plan(plan, tag_index, recommendations, features)
+    if plan.pinned:
+        log_event("pinned", pinned=[r.get("content_id") for r in filtered if str(r.get("content_id")) in plan.pinned])
+    return filtered
@@ -6,6 +6,7 @@ from sqlalchemy.orm import Session
 
 from backend.database import get_db
 from backend import models
+from backend.utils.response_cache import response_cache
 
 router = APIRouter()
 
@@ -13,6 +14,7 @@ router = APIRouter()
 class UpdateMixRequest(BaseModel):
     quality_level: int = None
     title: str = None
+    ann_nprobe: int = None  # ANN clusters scanned per query for large mixes (recall vs latency)
 
 
 @router.get("/{mix_id}")
@@ -28,13 +30,14 @@ def get_mix(mix_id: str, db: Session = Depends(get_db)):
         "title": mix.title,
         "status": mix.status,
         "quality_level": mix.quality_level,
+        "ann_nprobe": mix.ann_nprobe,
         "created_at": mix.created_at,
     }
 
 
 @router.put("/{mix_id}/update")
 def update_mix(mix_id: str, request: UpdateMixRequest, db: Session = Depends(get_db)):
-    """Update a mix's title and/or quality level."""
+    """Update a mix's title, quality level and/or ANN probe count."""
     mix = db.query(models.Mix).filter(models.Mix.id == mix_id).first()
     
     if not mix:
@@ -42,20 +45,29 @@ def update_mix(mix_id: str, request: UpdateMixRequest, db: Session = Depends(get
     
     # Update quality level if provided
     if request.quality_level is not None:
-        if request.quality_level not in [1, 2, 3]:
-            raise HTTPException(status_code=400, detail="Quality level must be 1, 2, or 3")
+        if request.quality_level not in [1, 2, 3, 4]:
+            raise HTTPException(status_code=400, detail="Quality level must be 1, 2, 3 or 4")
         mix.quality_level = str(request.quality_level)
     
     # Update title if provided
     if request.title is not None:
         mix.title = request.title
+
+    # Update ANN recall/latency knob if provided (only used by large mixes)
+    if request.ann_nprobe is not None:
+        if request.ann_nprobe < 1:
+            raise HTTPException(status_code=400, detail="ann_nprobe must be at least 1")
+        mix.ann_nprobe = request.ann_nprobe
     
     db.commit()
     db.refresh(mix)
+    # Requests without an explicit quality_level follow the mix default
+    response_cache.invalidate_content(mix_id)
     
     return {
         "mix_id": mix.id,
         "title": mix.title,
         "quality_level": mix.quality_level,
+        "ann_nprobe": mix.ann_nprobe,
         "updated": True
     }
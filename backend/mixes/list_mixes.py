@@ -1,13 +1,14 @@
 # This route returns all saved mixes from the database
 
-from typing import Optional
+from typing import Literal, Optional
 from datetime import datetime
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query, Response
 from sqlalchemy.orm import Session
 
 from backend.database import get_db
-from backend import models
+from backend import models, settings
+from backend.utils.pagination import NEXT_CURSOR_HEADER, fetch_page, ndjson_response
 
 # Create a router to group related routes
 router = APIRouter()
@@ -16,12 +17,16 @@ router = APIRouter()
 # GET route to return a list of mixes with optional filters
 @router.get("/")
 def list_mixes(
+    response: Response,
     user_id: Optional[str] = None,
     title: Optional[str] = None,
     q: Optional[str] = None,
     status: Optional[str] = None,
     created_after: Optional[datetime] = None,
     created_before: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(settings.PAGE_DEFAULT_LIMIT, ge=1, le=settings.PAGE_MAX_LIMIT),
+    format: Literal["json", "ndjson"] = "json",
     db: Session = Depends(get_db),
 ):
     """List mixes with optional filters:
@@ -31,6 +36,9 @@ def list_mixes(
     - q: space-separated keywords; all keywords must be present in title (AND)
     - status: exact match on mix status
     - created_after / created_before: ISO datetimes to filter by created_at
+
+    Newest first, `limit` per page; pass the `X-Next-Cursor` response header
+    back as `cursor` for the next page. `format=ndjson` streams every match.
     """
     qry = db.query(models.Mix)
     
@@ -50,23 +58,30 @@ def list_mixes(
             qry = qry.filter(models.Mix.title.ilike(f"%{kw}%"))
 
     if status:
-        q = q.filter(models.Mix.status == status)
+        qry = qry.filter(models.Mix.status == status)
 
     if created_after:
-        q = q.filter(models.Mix.created_at >= created_after)
+        qry = qry.filter(models.Mix.created_at >= created_after)
 
     if created_before:
-        q = q.filter(models.Mix.created_at <= created_before)
-
-    mixes = qry.all()
-
-    # Return a simplified list of mix info
-    return [
-        {
-            "mix_id": mix.id,
-            "title": mix.title,
-            "status": mix.status,
-            "created_at": mix.created_at,
-        }
-        for mix in mixes
-    ]
\ No newline at end of file
+        qry = qry.filter(models.Mix.created_at <= created_before)
+
+    keys = [models.Mix.created_at, models.Mix.id]
+    if format == "ndjson":
+        return ndjson_response(db, qry, keys, cursor, mix_summary)
+
+    mixes, next_cursor = fetch_page(db, qry, keys, cursor, limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+
+    return [mix_summary(mix) for mix in mixes]
+
+
+def mix_summary(mix: models.Mix) -> dict:
+    """A simplified view of a mix for listings."""
+    return {
+        "mix_id": mix.id,
+        "title": mix.title,
+        "status": mix.status,
+        "created_at": mix.created_at,
+    }
\ No newline at end of file
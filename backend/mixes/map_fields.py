@@ -1,20 +1,42 @@
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
-from typing import Dict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import functools
+import hashlib
+import multiprocessing
 import os
 import json
+import logging
+import time
 import pandas as pd
 
+from backend import settings
 from backend.database import get_db
+from backend.utils.apply_rules import rebuild_tag_index
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from backend.models import MixContent, FieldMapping
-from backend.models import Embedding
-from sklearn.feature_extraction.text import TfidfVectorizer
-import numpy as np
-from io import BytesIO
+from backend.models import Embedding, MixContent, FieldMapping, Mix
+from backend.utils.bulk_load import bulk_insert, delete_embeddings, embedding_columns, sync_mix_content
+from backend.utils.embeddings import TFIDF_MODEL_NAME, sparse_rows_to_bytes, sync_sentence_embeddings
+from backend.utils.executors import run_blocking
+from backend.utils.featurize import (HashingTfidf, iter_mix_frames, load_mix_frame, prepare_frame,
+                                     rebuild_ann_index, rebuild_catalog_snapshot)
+from backend.mixes.upload_content import csv_sha256
+from backend.utils import jobs
+from backend.utils.jobs import job_progress, job_stage, record_stages, submit_job
+from backend.utils.log import log_event
+from backend.utils.model_cache import invalidate_mix, model_cache
+from backend.utils.response_cache import response_cache
+from backend.utils.taste import rebuild_tastes
+from backend.utils.neighbors import rebuild_neighbors
+from backend.utils.parse_csv import iter_mapped_chunks
 
 REQUIRED_FIELDS = {"title", "description", "image_url", "content_id", "tags"}
 
+# Catalog columns the ingest-time TF-IDF vectors are built from
+TFIDF_COLUMNS = ["content_id", "title", "description"]
+
 router = APIRouter()
 
 
@@ -25,6 +47,27 @@ class FieldMappingRequest(BaseModel):
 
 @router.post("/map-fields")
 async def map_fields(request: FieldMappingRequest, db: Session = Depends(get_db)):
+    """Validate the mapping and queue `apply_field_mapping` as a background job.
+
+    Returns the job id right away; poll `GET /mixes/jobs/{job_id}` for progress.
+    """
+    validate_mapping(request)
+    # Submitting may run the job inline (JOB_WORKERS=0); keep it off the event loop
+    job = await run_blocking(submit_job, db, "map_fields", request.mix_id, apply_field_mapping, request)
+    return {"message": "Field mapping queued", "job_id": job.id, "status": job.status}
+
+
+def validate_mapping(request: FieldMappingRequest) -> None:
+    """Reject mappings that leave a required internal field unmapped."""
+    missing = REQUIRED_FIELDS - set(request.mappings.values())
+    if missing:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Missing required internal fields: {', '.join(sorted(missing))}"
+        )
+
+
+def apply_field_mapping(request: FieldMappingRequest, db: Session) -> dict:
     """Save field mapping and, if a CSV exists for the mix, apply the mapping
     to populate the `mix_contents` table so downstream endpoints (like
     generate-recommendations) can read canonical data from the DB.
@@ -32,132 +75,152 @@ async def map_fields(request: FieldMappingRequest, db: Session = Depends(get_db)
     Behavior:
     - Validate that all required internal fields are present in the mapping.
     - Save mapping JSON to `mappings/{mix_id}.json`.
-    - If `uploads/{mix_id}.csv` exists, read it, rename columns using the
-      provided mapping, delete any existing `mix_contents` rows for the mix,
-      and insert the mapped rows into the DB.
+    - Sync the CSV into the DB and rebuild embeddings and indexes (see
+      `ingest_mix`). Failures raise, so the job reports them instead of
+      claiming success.
     """
-    mapped_fields = set(request.mappings.values())
-    missing = REQUIRED_FIELDS - mapped_fields
-
-    if missing:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Missing required internal fields: {', '.join(missing)}"
-        )
+    validate_mapping(request)
 
     mapping_dir = "mappings"
     os.makedirs(mapping_dir, exist_ok=True)
     mapping_path = os.path.join(mapping_dir, f"{request.mix_id}.json")
 
-    with open(mapping_path, "w") as f:
-        json.dump(request.dict(), f, indent=2)
+    with job_stage("mapping"):
+        with open(mapping_path, "w") as f:
+            json.dump(request.dict(), f, indent=2)
 
-    # Persist mapping into DB (upsert)
-    try:
-        existing = db.query(FieldMapping).filter(FieldMapping.mix_id == request.mix_id).one_or_none()
-        if existing:
-            existing.mappings = request.mappings
-        else:
-            fm = FieldMapping(mix_id=request.mix_id, mappings=request.mappings)
-            db.add(fm)
-        db.commit()
-    except Exception:
-        db.rollback()
+        # Persist mapping into DB (upsert)
+        try:
+            existing = db.query(FieldMapping).filter(FieldMapping.mix_id == request.mix_id).one_or_none()
+            if existing:
+                existing.mappings = request.mappings
+            else:
+                fm = FieldMapping(mix_id=request.mix_id, mappings=request.mappings)
+                db.add(fm)
+            db.commit()
+        except Exception:
+            db.rollback()
 
-    # If a CSV has been uploaded for this mix, apply the mapping to populate DB
-    uploads_dir = "uploads"
-    csv_path = os.path.join(uploads_dir, f"{request.mix_id}.csv")
-    inserted = 0
+    result = ingest_mix(db, request.mix_id, request.mappings)
+    return {"message": "Field mapping saved", "path": mapping_path, **result}
+
+
+def ingest_mix(db: Session, mix_id: str, mappings: Dict[str, str]) -> dict:
+    """Apply ``mappings`` to `uploads/{mix_id}.csv` and bring the mix's rows,
+    embeddings and indexes up to date.
+
+    - Rows are synced by diff: only rows whose content changed are inserted,
+      updated or deleted.
+    - Embeddings and indexes are rebuilt unless no row changed and the
+      stored vectors cover the catalog.
+    - Once everything succeeded the CSV + mapping fingerprint is recorded on
+      the mix, so `rebuild-all` can skip it while neither changes.
+    Without a CSV, embeddings are rebuilt from the rows already in the DB.
+    """
+    csv_path = os.path.join("uploads", f"{mix_id}.csv")
+    fingerprint = None
+    diff = None
     if os.path.exists(csv_path):
+        fingerprint = ingest_fingerprint(csv_path, mappings)
+        # Cleared until this ingest completes, so a failed one is never skipped
+        set_ingest_hash(db, mix_id, None)
+
+        # Stream the CSV through the mapping into the DB a chunk at a time;
+        # committed together with the embeddings below
         try:
-            df = pd.read_csv(csv_path)
+            with job_stage("sync_rows"):
+                diff = sync_mix_content(db, mix_id, functools.partial(iter_mapped_chunks, csv_path, mappings))
+        except HTTPException:
+            db.rollback()
+            raise
         except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Failed reading CSV: {e}")
-
-        # Rename user columns to internal fields
+            db.rollback()
+            raise HTTPException(status_code=500, detail=f"Failed loading mix content: {e}")
+
+    # Nothing to re-embed or re-index when no row changed and the stored
+    # vectors cover the catalog (e.g. the same CSV was mapped again)
+    changed = diff is None or diff.changed or not tfidf_embeddings_current(db, mix_id)
+    summary = diff.summary() if diff is not None else {"rows_inserted": 0}
+    if not changed:
+        db.commit()
+        set_ingest_hash(db, mix_id, fingerprint)
+        log_event("ingest_unchanged", level=logging.INFO, mix_id=mix_id, rows=diff.unchanged)
+        return {**summary, "content_changed": False, "embeddings_generated": True}
+
+    # Automatically rebuild embeddings after mapping, in the same transaction
+    # as the rows so a mix never ends up with content but stale vectors.
+    # TF-IDF weights depend on the whole corpus, so any change refits it.
+    embedded = 0
+    try:
+        with job_stage("tfidf_embeddings"):
+            embedded = replace_tfidf_embeddings(db, mix_id, functools.partial(
+                iter_mix_frames, db, mix_id, TFIDF_COLUMNS, settings.CSV_CHUNK_ROWS))
+            db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Failed loading mix content: {e}")
+
+    # Level 3 mixes: encode sentence embeddings now so requests don't have to
+    # (only items whose text changed are re-encoded). A failure is reported
+    # after the indexes below are refreshed, since the rows and TF-IDF
+    # vectors are already committed.
+    sentence_error = None
+    if embedded and is_level3_mix(db, mix_id):
         try:
-            df = df.rename(columns=request.mappings)
-        except Exception:
-            pass
-
-        # Ensure content_id exists after rename
-        if "content_id" not in df.columns:
-            raise HTTPException(status_code=400, detail="Mapped column 'content_id' is required but missing after rename.")
-
-        # Remove existing rows for this mix to avoid duplicates
-        db.query(MixContent).filter(MixContent.mix_id == request.mix_id).delete()
-
-        # Insert new rows
-        for _, row in df.iterrows():
-            entry = MixContent(
-                mix_id=request.mix_id,
-                title=row.get("title"),
-                description=row.get("description"),
-                image_url=row.get("image_url"),
-                content_id=row.get("content_id"),
-                tags=row.get("tags"),
-            )
-            db.add(entry)
-            inserted += 1
+            with job_stage("sentence_embeddings"):
+                sync_sentence_embeddings(db, mix_id, prepare_frame(load_mix_frame(db, mix_id)))
+        except Exception as e:
+            db.rollback()
+            sentence_error = e
 
-        db.commit()
+    # Content changed: drop cached features so the next request re-featurizes,
+    # then refresh the tag index and neighbour lists (sentence lists are
+    # patched for the changed items only), large mixes' IVF indexes and the
+    # users' taste profiles
+    with job_stage("indexes"):
+        invalidate_mix(db, mix_id)
+        refresh_catalog_snapshot(db, mix_id)
+        refresh_tag_index(db, mix_id)
+        refresh_ann_indexes(db, mix_id)
+        refresh_neighbors(db, mix_id)
+        rebuild_tastes(db, mix_id)
 
-    # Automatically rebuild embeddings after mapping
-    try:
-        # Re-generate embeddings for this mix
-        rows = db.query(MixContent).filter(MixContent.mix_id == request.mix_id).all()
-        if rows:
-            df = pd.DataFrame([
-                {"content_id": r.content_id, "title": r.title, "description": r.description}
-                for r in rows
-            ])
-            
-            title = df["title"] if "title" in df.columns else pd.Series([""] * len(df))
-            desc = df["description"] if "description" in df.columns else pd.Series([""] * len(df))
-            df["text"] = title.fillna("") + " " + desc.fillna("")
-            
-            if not df.empty:
-                # compute TF-IDF
-                tfidf_sparse = TfidfVectorizer().fit_transform(df["text"])
-                try:
-                    tfidf = tfidf_sparse.toarray()
-                except Exception:
-                    tfidf = np.vstack([row.toarray().ravel() for row in tfidf_sparse])
-                
-                # persist embeddings
-                try:
-                    db.query(Embedding).filter(Embedding.mix_id == request.mix_id).delete()
-                    embeddings_inserted = 0
-                    for idx, row in df.iterrows():
-                        vec = tfidf[idx]
-                        buf = BytesIO()
-                        np.save(buf, vec, allow_pickle=False)
-                        emb = Embedding(mix_id=request.mix_id, content_id=row.get("content_id"), vector=buf.getvalue())
-                        db.add(emb)
-                        embeddings_inserted += 1
-                    db.commit()
-                except Exception:
-                    db.rollback()
-    except Exception:
-        # Silently fail on embeddings - mapping already succeeded
-        pass
-
-    return {"message": "Field mapping saved", "path": mapping_path, "rows_inserted": inserted, "embeddings_generated": True}
+    if sentence_error is not None:
+        raise HTTPException(status_code=500, detail=f"Failed computing sentence embeddings: {sentence_error}")
+
+    set_ingest_hash(db, mix_id, fingerprint)
+    return {**summary, "content_changed": True, "embeddings_generated": embedded > 0}
 
 
 @router.post("/rebuild-all")
-async def rebuild_all(db: Session = Depends(get_db)):
+async def rebuild_all(force: bool = False, db: Session = Depends(get_db)):
+    """Queue a background re-import of all mappings + CSVs (see `rebuild_all_mixes`).
+
+    `force=true` re-imports mixes whose CSV and mapping are unchanged too.
+    """
+    job = await run_blocking(submit_job, db, "rebuild_all", None, rebuild_all_mixes, force)
+    return {"message": "Rebuild queued", "job_id": job.id, "status": job.status}
+
+
+def rebuild_all_mixes(force: bool, db: Session) -> dict:
     """Re-import all mappings + CSVs and repopulate the `mix_contents` table.
 
-    This is a convenience admin endpoint to rebuild the SQLite DB from the
-    files under `mappings/` and `uploads/`. It will delete existing rows for
-    each mix and insert fresh mapped rows.
+    This is a convenience admin endpoint to rebuild the DB from the files
+    under `mappings/` and `uploads/`. Mixes whose CSV hash and mapping match
+    their last complete ingest are skipped (unless ``force``); the rest are
+    fanned out over up to `REBUILD_WORKERS` processes (capped at the CPU
+    count), each mix ingested in its own session and transactions (see
+    `ingest_mix`). Progress and per-mix results stream into the job status
+    as mixes finish.
     """
     mapping_dir = "mappings"
     uploads_dir = "uploads"
     results = {}
+    tasks = []
 
-    for fname in os.listdir(mapping_dir):
+    ingested = dict(db.query(Mix.id, Mix.ingest_hash).all())
+    db.commit()
+    for fname in sorted(os.listdir(mapping_dir)):
         if not fname.endswith(".json"):
             continue
         path = os.path.join(mapping_dir, fname)
@@ -175,51 +238,108 @@ async def rebuild_all(db: Session = Depends(get_db)):
                 results[mix_id] = {"skipped": "no csv for mix"}
                 continue
 
-            # read and apply mapping
-            df = pd.read_csv(csv_path)
-            df = df.rename(columns=mappings)
-
-            if "content_id" not in df.columns:
-                results[mix_id] = {"error": "content_id missing after rename"}
+            if not force and ingested.get(mix_id) == ingest_fingerprint(csv_path, mappings):
+                results[mix_id] = {"skipped": "unchanged"}
                 continue
-
-            # replace existing rows
-            db.query(MixContent).filter(MixContent.mix_id == mix_id).delete()
-            inserted = 0
-            for _, row in df.iterrows():
-                entry = MixContent(
-                    mix_id=mix_id,
-                    title=row.get("title"),
-                    description=row.get("description"),
-                    image_url=row.get("image_url"),
-                    content_id=row.get("content_id"),
-                    tags=row.get("tags"),
-                )
-                db.add(entry)
-                inserted += 1
-            db.commit()
-            results[mix_id] = {"inserted": inserted}
+            tasks.append((mix_id, mappings))
 
         except Exception as e:
             results[fname] = {"error": str(e)}
 
-    return {"results": results}
+    # More processes than cores only adds contention
+    workers = min(settings.REBUILD_WORKERS, len(tasks), os.cpu_count() or 1)
+    started = time.perf_counter()
+    job_progress(0, len(tasks), results=dict(results))
+    for done, (mix_id, result) in enumerate(run_rebuilds(tasks, workers), start=1):
+        results[mix_id] = result
+        if result.get("content_changed"):
+            # Workers invalidated their own process; drop this one's entries too
+            model_cache.invalidate(mix_id)
+            response_cache.invalidate_content(mix_id)
+        job_progress(done, len(tasks), results=dict(results))
+
+    return {"results": results, "rebuilt": len(tasks), "workers": workers,
+            "seconds": round(time.perf_counter() - started, 3)}
+
+
+def run_rebuilds(tasks: List[Tuple[str, Dict[str, str]]], workers: int) -> Iterator[Tuple[str, dict]]:
+    """Yield ``(mix_id, result)`` for each task as it finishes."""
+    # Each mix is rebuilt under its job lock, so a map-fields job submitted
+    # for it meanwhile waits instead of racing the rebuild
+    if workers <= 1:
+        for mix_id, mappings in tasks:
+            with jobs.mix_lock(mix_id):
+                result = rebuild_mix_worker(mix_id, mappings)
+            yield mix_id, result
+        return
+
+    # "spawn" avoids forking a process that already runs threads
+    held = []
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=init_rebuild_worker) as pool:
+            futures = {}
+            for mix_id, mappings in tasks:
+                lock = jobs.mix_lock(mix_id)
+                lock.acquire()
+                held.append(lock)
+                futures[pool.submit(rebuild_mix_worker, mix_id, mappings)] = mix_id
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {"error": f"{type(e).__name__}: {e}"}
+                lock = jobs.mix_lock(futures[future])
+                lock.release()
+                held.remove(lock)
+                yield futures[future], result
+    finally:
+        for lock in held:
+            lock.release()
+
+
+def init_rebuild_worker() -> None:
+    # Mixes are already spread over processes; featurize inline in each
+    settings.CPU_POOL_WORKERS = 0
+
+
+def rebuild_mix_worker(mix_id: str, mappings: Dict[str, str]) -> dict:
+    """Ingest one mix in its own session; returns its result with timings."""
+    started = time.perf_counter()
+    db = jobs.session_factory()
+    with record_stages() as stages:
+        try:
+            result = ingest_mix(db, mix_id, mappings)
+        except HTTPException as e:
+            db.rollback()
+            result = {"error": str(e.detail)}
+        except Exception as e:
+            db.rollback()
+            result = {"error": f"{type(e).__name__}: {e}"}
+        finally:
+            db.close()
+    result["seconds"] = round(time.perf_counter() - started, 4)
+    result["stages"] = stages
+    return result
 
 
 @router.post("/rebuild-embeddings/{mix_id}")
 async def rebuild_embeddings(mix_id: str, db: Session = Depends(get_db)):
+    """Queue a background embedding rebuild for a single mix (see `rebuild_mix_embeddings`)."""
+    job = await run_blocking(submit_job, db, "rebuild_embeddings", mix_id, rebuild_mix_embeddings, mix_id)
+    return {"message": "Embedding rebuild queued", "job_id": job.id, "status": job.status}
+
+
+def rebuild_mix_embeddings(mix_id: str, db: Session) -> dict:
     """Re-generate and persist TF-IDF embeddings for a single mix.
 
     This will prefer canonical `mix_contents` rows in the DB; if none exist
-    it will fall back to `uploads/{mix_id}.csv` + mapping.
+    it will fall back to `uploads/{mix_id}.csv` + mapping. Either source is
+    read a chunk at a time.
     """
     # Try DB rows first
-    rows = db.query(MixContent).filter(MixContent.mix_id == mix_id).all()
-    if rows:
-        df = pd.DataFrame([
-            {"content_id": r.content_id, "title": r.title, "description": r.description}
-            for r in rows
-        ])
+    if db.query(MixContent.id).filter(MixContent.mix_id == mix_id).first() is not None:
+        read_chunks = functools.partial(iter_mix_frames, db, mix_id, TFIDF_COLUMNS, settings.CSV_CHUNK_ROWS)
     else:
         mapping_path = os.path.join("mappings", f"{mix_id}.json")
         csv_path = os.path.join("uploads", f"{mix_id}.csv")
@@ -232,44 +352,149 @@ async def rebuild_embeddings(mix_id: str, db: Session = Depends(get_db)):
         except Exception as e:
             raise HTTPException(status_code=400, detail=f"Invalid mapping JSON: {e}")
 
+        read_chunks = functools.partial(iter_mapped_chunks, csv_path, mapping)
+
+    # compute and persist TF-IDF embeddings
+    try:
+        with job_stage("tfidf_embeddings"):
+            inserted = replace_tfidf_embeddings(db, mix_id, read_chunks)
+            if not inserted:
+                raise HTTPException(status_code=400, detail="No content available")
+            db.commit()
+    except HTTPException:
+        db.rollback()
+        raise
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+
+    result = {"mix_id": mix_id, "inserted": inserted}
+
+    # Level 3 mixes also keep sentence embeddings; only changed texts are re-encoded
+    if is_level3_mix(db, mix_id):
         try:
-            df = pd.read_csv(csv_path)
+            with job_stage("sentence_embeddings"):
+                matrix = sync_sentence_embeddings(db, mix_id, prepare_frame(load_mix_frame(db, mix_id)))
+            result["sentence_embeddings"] = len(matrix)
         except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Failed reading CSV: {e}")
+            db.rollback()
+            raise HTTPException(status_code=500, detail=f"Failed computing sentence embeddings: {e}")
+
+    with job_stage("indexes"):
+        invalidate_mix(db, mix_id)
+        refresh_catalog_snapshot(db, mix_id)
+        refresh_tag_index(db, mix_id)
+        result["ann"] = refresh_ann_indexes(db, mix_id)
+        result["neighbors"] = refresh_neighbors(db, mix_id)
+        result["taste_profiles"] = rebuild_tastes(db, mix_id)
+
+    return result
+
+
+def replace_tfidf_embeddings(db: Session, mix_id: str, read_chunks: Callable[[], Iterable[pd.DataFrame]]) -> int:
+    """Fit TF-IDF on title + description and replace the mix's TF-IDF rows (not committed).
+
+    Two passes over ``read_chunks()``: the first fits a `HashingTfidf`'s
+    document frequencies, the second writes each chunk's sparse vectors, so
+    memory is bounded by the chunk size.
+    """
+    tfidf = HashingTfidf()
+    for df in read_chunks():
+        tfidf.partial_fit(tfidf_text(df))
+
+    delete_embeddings(db, mix_id, TFIDF_MODEL_NAME)
+    written = 0
+    for df in read_chunks():
+        vectors = sparse_rows_to_bytes(tfidf.transform(tfidf_text(df)))
+        written += bulk_insert(db, Embedding.__table__,
+                               embedding_columns(mix_id, df["content_id"].tolist(), vectors, TFIDF_MODEL_NAME))
+    return written
+
+
+def tfidf_text(df: pd.DataFrame) -> list:
+    """Title + description, the text the ingest-time TF-IDF vectors are built from."""
+    title = df["title"] if "title" in df.columns else pd.Series([""] * len(df), index=df.index)
+    desc = df["description"] if "description" in df.columns else pd.Series([""] * len(df), index=df.index)
+    return (title.fillna("") + " " + desc.fillna("")).tolist()
+
+
+def ingest_fingerprint(csv_path: str, mappings: Dict[str, str]) -> str:
+    """Identifies the CSV content + mapping an ingest was run from."""
+    mapping_hash = hashlib.sha1(json.dumps(mappings, sort_keys=True).encode("utf-8")).hexdigest()
+    return f"{csv_sha256(csv_path)}:{mapping_hash}"
+
 
-        df = df.rename(columns=mapping)
+def set_ingest_hash(db: Session, mix_id: str, fingerprint: Optional[str]) -> None:
+    db.query(Mix).filter(Mix.id == mix_id).update({"ingest_hash": fingerprint}, synchronize_session=False)
+    db.commit()
 
-    if "content_id" not in df.columns:
-        raise HTTPException(status_code=400, detail="Mapped column 'content_id' is required but missing after rename.")
 
-    title = df["title"] if "title" in df.columns else pd.Series([""] * len(df))
-    desc = df["description"] if "description" in df.columns else pd.Series([""] * len(df))
-    df["text"] = title.fillna("") + " " + desc.fillna("")
+def tfidf_embeddings_current(db: Session, mix_id: str) -> bool:
+    """Whether the mix has catalog rows and a TF-IDF vector for each of them."""
+    rows = db.query(func.count(MixContent.id)).filter(MixContent.mix_id == mix_id).scalar()
+    vectors = (db.query(func.count(Embedding.id))
+                 .filter(Embedding.mix_id == mix_id, Embedding.model_name == TFIDF_MODEL_NAME)
+                 .scalar())
+    return bool(rows) and rows == vectors
 
-    if df.empty:
-        raise HTTPException(status_code=400, detail="No content available")
 
-    # compute TF-IDF
-    tfidf_sparse = TfidfVectorizer().fit_transform(df["text"])
+def is_level3_mix(db: Session, mix_id: str) -> bool:
+    quality_level = db.query(Mix.quality_level).filter(Mix.id == mix_id).scalar()
+    return str(quality_level) == "3"
+
+
+
+def refresh_neighbors(db: Session, mix_id: str) -> dict:
+    """Rebuild the mix's neighbour tables after its content changed.
+
+    Failures are logged, not raised: requests fall back to computing
+    similarities when no fresh table exists.
+    """
+    featurizers = ["tfidf", "sentence"] if is_level3_mix(db, mix_id) else ["tfidf"]
     try:
-        tfidf = tfidf_sparse.toarray()
-    except Exception:
-        tfidf = np.vstack([row.toarray().ravel() for row in tfidf_sparse])
+        return rebuild_neighbors(db, mix_id, featurizers)
+    except Exception as e:
+        db.rollback()
+        log_event("neighbor_rebuild_failed", level=logging.WARNING, mix_id=mix_id, error=str(e))
+        return {}
 
-    # persist embeddings
+
+def refresh_ann_indexes(db: Session, mix_id: str) -> dict:
+    """Rebuild the IVF indexes of a large mix after its content changed.
+
+    Failures are logged, not raised: requests score the mix exactly when no
+    index matches its content.
+    """
+    featurizers = ["tfidf", "sentence"] if is_level3_mix(db, mix_id) else ["tfidf"]
     try:
-        db.query(Embedding).filter(Embedding.mix_id == mix_id).delete()
-        inserted = 0
-        for idx, row in df.iterrows():
-            vec = tfidf[idx]
-            buf = BytesIO()
-            np.save(buf, vec, allow_pickle=False)
-            emb = Embedding(mix_id=mix_id, content_id=row.get("content_id"), vector=buf.getvalue())
-            db.add(emb)
-            inserted += 1
-        db.commit()
+        return {featurizer: rebuild_ann_index(db, mix_id, featurizer) for featurizer in featurizers}
     except Exception as e:
         db.rollback()
-        raise HTTPException(status_code=500, detail=str(e))
+        log_event("ann_rebuild_failed", level=logging.WARNING, mix_id=mix_id, error=str(e))
+        return {}
+
 
-    return {"mix_id": mix_id, "inserted": inserted}
+def refresh_catalog_snapshot(db: Session, mix_id: str) -> None:
+    """Rewrite the mix's columnar catalog snapshot after its content changed.
+
+    Failures are logged, not raised: without a current snapshot the catalog
+    is read from the DB.
+    """
+    try:
+        rebuild_catalog_snapshot(db, mix_id)
+    except Exception as e:
+        db.rollback()
+        log_event("catalog_snapshot_failed", level=logging.WARNING, mix_id=mix_id, error=str(e))
+
+
+def refresh_tag_index(db: Session, mix_id: str) -> None:
+    """Rebuild the mix's inverted tag index after its content changed.
+
+    Failures are logged, not raised: the index is rebuilt from the catalog on
+    first use when no fresh file exists.
+    """
+    try:
+        rebuild_tag_index(db, mix_id)
+    except Exception as e:
+        db.rollback()
+        log_event("tag_index_rebuild_failed", level=logging.WARNING, mix_id=mix_id, error=str(e))
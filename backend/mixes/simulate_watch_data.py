@@ -2,6 +2,8 @@ from fastapi import APIRouter, HTTPException, Depends
 from sqlalchemy.orm import Session
 from backend.database import get_db
 from backend.models import UserActivity, MixContent
+from backend.utils.response_cache import response_cache
+from backend.utils.taste import drop_tastes
 import uuid
 import random
 
@@ -38,6 +40,7 @@ async def simulate_watch_data(payload: dict, db: Session = Depends(get_db)):
         UserActivity.user_id == test_user_id,
         UserActivity.mix_id == mix_id
     ).delete()
+    drop_tastes(db, mix_id, test_user_id)
     db.commit()
     
     # Create watch records
@@ -51,6 +54,7 @@ async def simulate_watch_data(payload: dict, db: Session = Depends(get_db)):
         db.add(activity)
     
     db.commit()
+    response_cache.invalidate_user(mix_id, test_user_id)
     
     watched_content_ids = [item.content_id for item in watched_items]
     print(f"DEBUG simulate_watch_data: Marked {len(watched_items)} items as watched: {watched_content_ids}")
@@ -0,0 +1,24 @@
+# Level 4: train a mix's implicit ALS model in the background
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from backend import settings
+from backend.database import get_db
+from backend.models import Mix
+from backend.utils.als import train_mix_model
+from backend.utils.executors import run_blocking
+from backend.utils.jobs import submit_job
+
+router = APIRouter()
+
+
+@router.post("/train-als/{mix_id}")
+async def train_als(mix_id: str, factors: int = Query(settings.ALS_FACTORS, ge=1, le=1024),
+                    iterations: int = Query(settings.ALS_ITERATIONS, ge=1, le=100),
+                    db: Session = Depends(get_db)):
+    """Queue ALS training on the mix's activity; Level 4 serves the model once it is written."""
+    if db.query(Mix.id).filter(Mix.id == mix_id).first() is None:
+        raise HTTPException(status_code=404, detail="Mix not found")
+    job = await run_blocking(submit_job, db, "train_als", mix_id, train_mix_model, mix_id, factors, iterations)
+    return {"message": "ALS training queued", "job_id": job.id, "status": job.status}
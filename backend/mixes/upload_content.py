@@ -1,30 +1,245 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from typing import BinaryIO, Dict, Optional
+import hashlib
 import os
+import tempfile
+import time
+
+from backend import settings
+from backend.utils.executors import run_blocking
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ModuleNotFoundError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
 
 router = APIRouter()
 
+# Bytes of multipart framing and form fields allowed on top of the file
+# before a request is rejected on its Content-Length alone
+FORM_OVERHEAD_BYTES = 64 * 1024
+
+UPLOAD_FORM_SCHEMA = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "required": ["mix_id", "file"],
+            "properties": {"mix_id": {"type": "string"}, "file": {"type": "string", "format": "binary"}},
+        }}},
+    },
+}
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class MultipartUpload:
+    """Incremental multipart/form-data parser for `upload-content`.
+
+    Form fields are kept in memory; the bytes of the ``file`` part are
+    buffered in ``pending`` and written out (and hashed) by `flush`, so the
+    caller can do the disk I/O off the event loop. The size limit is
+    enforced as the bytes arrive.
+    """
+
+    def __init__(self, content_type: str, out: BinaryIO):
+        kind, params = parse_options_header(content_type)
+        boundary = params.get(b"boundary")
+        if kind != b"multipart/form-data" or not boundary:
+            raise ValueError("Expected a multipart/form-data body")
+        self.out = out
+        self.fields: Dict[str, str] = {}
+        self.has_file = False
+        self.size = 0
+        self.digest = hashlib.sha256()
+        self.pending = bytearray()
+        self._header_field = b""
+        self._header_value = b""
+        self._disposition = b""
+        self._name: Optional[str] = None
+        self._is_file = False
+        self._value = bytearray()
+        self._parser = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    def feed(self, chunk: bytes) -> None:
+        self._parser.write(chunk)
+
+    def finish(self) -> None:
+        self._parser.finalize()
+
+    def flush(self) -> None:
+        """Hash and write the buffered file bytes (blocking)."""
+        data = bytes(self.pending)
+        self.pending.clear()
+        self.digest.update(data)
+        self.out.write(data)
+
+    def _on_part_begin(self) -> None:
+        self._disposition = b""
+        self._name = None
+        self._is_file = False
+        self._value = bytearray()
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        if self._header_field.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._disposition)
+        self._name = options.get(b"name", b"").decode("utf-8")
+        self._is_file = self._name == "file"
+        if self._is_file:
+            if self.has_file:
+                raise ValueError("Only one file can be uploaded")
+            self.has_file = True
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._is_file:
+            self.size += end - start
+            if self.size > settings.UPLOAD_MAX_BYTES:
+                raise UploadTooLarge()
+            self.pending += data[start:end]
+        else:
+            self._value += data[start:end]
+            if len(self._value) > FORM_OVERHEAD_BYTES:
+                raise ValueError(f"Form field {self._name!r} is too large")
+
+    def _on_part_end(self) -> None:
+        if not self._is_file and self._name:
+            self.fields[self._name] = self._value.decode("utf-8")
 
-@router.post("/upload-content")
-async def upload_content(mix_id: str = Form(...), file: UploadFile = File(...)):
-    """Save uploaded CSV to the `uploads/` folder as `{mix_id}.csv`.
+
+@router.post("/upload-content", openapi_extra=UPLOAD_FORM_SCHEMA)
+async def upload_content(request: Request):
+    """Save uploaded CSV (form fields `mix_id` and `file`) to the `uploads/`
+    folder as `{mix_id}.csv`.
 
     Mapping from user columns to internal fields is applied later by
     `/mixes/map-fields`, which will populate the DB. This keeps upload and
     mapping responsibilities separate and avoids inserting rows with
     incorrect column names into the DB.
+
+    The request body is parsed as it arrives and the file part streamed
+    straight into a temp file (writes and hashing on the executor pool), so
+    an upload is never spooled or held in memory first. Bodies whose
+    Content-Length already exceeds the limit are rejected before reading;
+    others are cut off as soon as the file passes `UPLOAD_MAX_BYTES`. The
+    file is moved into place atomically, and re-uploading identical bytes
+    leaves the existing file untouched and reports `unchanged: true`.
     """
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > settings.UPLOAD_MAX_BYTES + FORM_OVERHEAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"File exceeds the {settings.UPLOAD_MAX_BYTES} byte upload limit")
+
+    start = time.perf_counter()
     uploads_dir = "uploads"
     os.makedirs(uploads_dir, exist_ok=True)
-    target_path = os.path.join(uploads_dir, f"{mix_id}.csv")
-
+    fd, tmp_path = tempfile.mkstemp(dir=uploads_dir, suffix=".part")
     try:
-        content = await file.read()
-        # write the uploaded bytes directly to the uploads directory
-        with open(target_path, "wb") as f:
-            f.write(content)
-
-        # report the file size to the client
-        return {"message": "File saved", "path": target_path, "size_bytes": len(content)}
+        with os.fdopen(fd, "wb") as out:
+            upload = MultipartUpload(request.headers.get("content-type", ""), out)
+            async for chunk in request.stream():
+                upload.feed(chunk)
+                if len(upload.pending) >= settings.UPLOAD_CHUNK_BYTES:
+                    await run_blocking(upload.flush)
+            upload.finish()
+            await run_blocking(upload.flush)
 
+        mix_id = upload.fields.get("mix_id", "").strip()
+        if not mix_id or not upload.has_file:
+            raise HTTPException(status_code=422, detail="Form fields 'mix_id' and 'file' are required")
+        target_path = os.path.join(uploads_dir, f"{mix_id}.csv")
+        unchanged = await run_blocking(save_upload, tmp_path, target_path, upload.digest.hexdigest())
+    except UploadTooLarge:
+        raise HTTPException(status_code=413, detail=f"File exceeds the {settings.UPLOAD_MAX_BYTES} byte upload limit")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    seconds = time.perf_counter() - start
+    return {
+        "message": "File unchanged" if unchanged else "File saved",
+        "path": target_path,
+        "size_bytes": upload.size,
+        "sha256": upload.digest.hexdigest(),
+        "unchanged": unchanged,
+        "seconds": round(seconds, 3),
+        "throughput_mb_s": round(upload.size / (1024 * 1024) / seconds, 1) if seconds > 0 else None,
+    }
+
+
+def save_upload(tmp_path: str, target_path: str, sha256: str) -> bool:
+    """Move the fully written ``tmp_path`` to ``target_path`` with its hash
+    sidecar; returns True (and moves nothing) if the bytes are unchanged.
+
+    The sidecar is replaced first and names the file it describes by size
+    and mtime, which ``os.replace`` keeps: a crash between the two renames
+    leaves a sidecar that doesn't match the old CSV, so it is ignored.
+    """
+    if os.path.exists(target_path) and read_upload_hash(target_path) == sha256:
+        return True
+    write_upload_hash(target_path, sha256, os.stat(tmp_path))
+    os.replace(tmp_path, target_path)
+    return False
+
+
+def upload_hash_path(csv_path: str) -> str:
+    return f"{csv_path}.sha256"
+
+
+def read_upload_hash(csv_path: str):
+    """SHA-256 recorded when ``csv_path`` was uploaded, if the sidecar still
+    describes the file on disk (same size and mtime)."""
+    try:
+        with open(upload_hash_path(csv_path)) as f:
+            sha256, size, mtime_ns = f.read().split()
+        stat = os.stat(csv_path)
+    except (OSError, ValueError):
+        return None
+    if (stat.st_size, stat.st_mtime_ns) != (int(size), int(mtime_ns)):
+        return None
+    return sha256
+
+
+def csv_sha256(csv_path: str) -> str:
+    """SHA-256 of ``csv_path``: from the upload sidecar if it describes the
+    file, otherwise hashed from disk in chunks."""
+    recorded = read_upload_hash(csv_path)
+    if recorded:
+        return recorded
+    digest = hashlib.sha256()
+    with open(csv_path, "rb") as f:
+        for chunk in iter(lambda: f.read(settings.UPLOAD_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_upload_hash(csv_path: str, sha256: str, stat: os.stat_result) -> None:
+    """Atomically record ``sha256`` for the file with ``stat`` (size, mtime)."""
+    path = upload_hash_path(csv_path)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(f"{sha256} {stat.st_size} {stat.st_mtime_ns}")
+    os.replace(tmp_path, path)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, JSON, DateTime, ForeignKey, Index, LargeBinary
+from sqlalchemy import Column, String, JSON, DateTime, ForeignKey, Index, LargeBinary, Integer, Float
 from sqlalchemy.dialects.postgresql import UUID as PG_UUID
 from sqlalchemy.sql import func
 from backend.database import Base
@@ -14,6 +14,9 @@ class Mix(Base):
     status = Column(String, nullable=False, index=True)
     filename = Column(String, nullable=True)
     quality_level = Column(String, nullable=False, default="2")  # Default to Level 2
+    content_version = Column(Integer, nullable=False, default=0, server_default="0")  # Bumped whenever mix content is re-ingested
+    ann_nprobe = Column(Integer, nullable=True)  # ANN clusters scanned per query (recall/latency knob); NULL = default
+    ingest_hash = Column(String, nullable=True)  # CSV + mapping fingerprint of the last complete ingest (rebuild-all skips unchanged mixes)
     created_at = Column(DateTime, nullable=False, server_default=func.now(), index=True)
 
 # --- User record (matches Supabase schema) ---
@@ -43,6 +46,10 @@ class UserActivity(Base):
 
 # Composite index for user activity
 Index("ix_user_mix_time", UserActivity.user_id, UserActivity.mix_id, UserActivity.timestamp.desc())
+# Keyset pages of a mix's activity (newest first)
+Index("ix_mix_time", UserActivity.mix_id, UserActivity.timestamp.desc())
+# Keyset pages of a user's activity across mixes, in (timestamp, id) key order
+Index("ix_user_time_id", UserActivity.user_id, UserActivity.timestamp.desc(), UserActivity.id.desc())
 
 # --- Uploaded content tied to a mix (one row per item) ---
 class MixContent(Base):
@@ -56,6 +63,10 @@ class MixContent(Base):
     image_url = Column(String)
     content_id = Column(String)
     tags = Column(String)
+    row_hash = Column(String, nullable=True)  # hash of the mapped fields; re-ingest only touches rows whose hash changed
+
+# Lookups of specific items within a mix (neighbour lists, seeds)
+Index("ix_mix_content_mix_content_id", MixContent.mix_id, MixContent.content_id)
 
 
 # --- Persisted embeddings for items (optional acceleration)
@@ -65,10 +76,17 @@ class Embedding(Base):
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     mix_id = Column(String, ForeignKey("mixes.id"), nullable=False, index=True)
     content_id = Column(String, nullable=False, index=True)
+    # which featurizer produced the vector: "tfidf" or a sentence-transformers model name
+    model_name = Column(String, nullable=False, default="tfidf", server_default="tfidf")
+    # hash of the item text the vector was computed from (used to skip re-encoding)
+    text_hash = Column(String, nullable=True)
     # store vector as compact binary blob (numpy .npy bytes)
     vector = Column(LargeBinary, nullable=False)
     created_at = Column(DateTime, nullable=False, server_default=func.now(), index=True)
 
+# Serving loads every vector of one model for a mix at once
+Index("ix_embedding_mix_model", Embedding.mix_id, Embedding.model_name)
+
 
 # --- Field mappings stored in DB ---
 class FieldMapping(Base):
@@ -90,3 +108,38 @@ class BusinessRules(Base):
     rules = Column(JSON, nullable=False)  # Stores rule config as JSON
     created_at = Column(DateTime, nullable=True, server_default=func.now())
     updated_at = Column(DateTime, nullable=True, server_default=func.now(), onupdate=func.now())
+
+
+# --- Background ingest / embedding jobs ---
+class IngestJob(Base):
+    __tablename__ = "ingest_jobs"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    mix_id = Column(String, nullable=True, index=True)  # NULL for jobs spanning every mix (rebuild-all)
+    kind = Column(String, nullable=False)  # e.g. "map_fields", "rebuild_embeddings", "rebuild_all"
+    status = Column(String, nullable=False, default="queued", index=True)  # queued, running, succeeded, failed
+    stages = Column(JSON, nullable=True)  # [{"name": ..., "seconds": ...}] in the order they ran
+    result = Column(JSON, nullable=True)
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=False, server_default=func.now(), index=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    duration_seconds = Column(Float, nullable=True)  # wall time from start to finish
+    owner = Column(String, nullable=True)  # "host:pid:boot id" of the process running it
+    heartbeat_at = Column(Float, nullable=True)  # unix time the owner last renewed its lease
+
+
+# --- Per-(user, mix) taste vectors: decayed mean of the features of watched items ---
+class TasteProfile(Base):
+    __tablename__ = "taste_profiles"
+
+    user_id = Column(String, primary_key=True)
+    mix_id = Column(String, ForeignKey("mixes.id"), primary_key=True)
+    featurizer = Column(String, primary_key=True)  # feature space of `vector`: "tfidf" or "sentence"
+    content_version = Column(Integer, nullable=False)  # Mix.content_version the rows / vector refer to
+    items = Column(LargeBinary, nullable=False)  # catalog rows already folded in (int32 .npy bytes)
+    vector = Column(LargeBinary, nullable=False)  # decayed sum of their feature rows (.npy; (index, value) pairs for tfidf)
+    weight = Column(Float, nullable=False)  # decayed item count; vector / weight is the taste vector
+    last_content_id = Column(String, nullable=True)  # most recent interaction (the default seed)
+    last_event_at = Column(DateTime, nullable=True)  # time the decay is measured from
+    updated_at = Column(DateTime, nullable=True, server_default=func.now(), onupdate=func.now())
@@ -6,9 +6,29 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 UPLOADS_DIR = BASE_DIR / "uploads"
 MAPPINGS_DIR = BASE_DIR / "mappings"
+NEIGHBORS_DIR = BASE_DIR / "neighbors"
+TAGS_DIR = BASE_DIR / "tags"
+SNAPSHOTS_DIR = BASE_DIR / "snapshots"
+FACTORS_DIR = BASE_DIR / "factors"
+ANN_DIR = BASE_DIR / "ann"
 
 def mix_csv_path(mix_id: str) -> Path:
     return UPLOADS_DIR / f"{mix_id}.csv"
 
 def mix_mapping_path(mix_id: str) -> Path:
     return MAPPINGS_DIR / f"{mix_id}.json"
+
+def mix_neighbors_path(mix_id: str, featurizer: str) -> Path:
+    return NEIGHBORS_DIR / f"{mix_id}.{featurizer}.npz"
+
+def mix_tags_path(mix_id: str) -> Path:
+    return TAGS_DIR / f"{mix_id}.npz"
+
+def mix_snapshot_path(mix_id: str) -> Path:
+    return SNAPSHOTS_DIR / f"{mix_id}.snapshot"
+
+def mix_factors_path(mix_id: str) -> Path:
+    return FACTORS_DIR / f"{mix_id}.als.npz"
+
+def mix_ann_path(mix_id: str, featurizer: str) -> Path:
+    return ANN_DIR / f"{mix_id}.{featurizer}.npz"
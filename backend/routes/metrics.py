@@ -0,0 +1,51 @@
+# --- backend/routes/metrics.py ---
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from backend.utils.metrics import render_metrics
+from backend.utils.model_cache import model_cache
+from backend.utils.response_cache import response_cache
+
+# Prometheus scrape endpoint (text exposition format 0.0.4)
+router = APIRouter(tags=["metrics"])
+
+
+def model_cache_lines() -> list:
+    """Gauges/counters for the featurized-mix cache."""
+    stats = model_cache.stats()
+    return [
+        "# HELP model_cache_bytes Bytes held by the model cache.",
+        "# TYPE model_cache_bytes gauge",
+        f"model_cache_bytes {stats['bytes']}",
+        "# HELP model_cache_entries Entries held by the model cache.",
+        "# TYPE model_cache_entries gauge",
+        f"model_cache_entries {stats['entries']}",
+        "# HELP model_cache_hits_total Model cache hits.",
+        "# TYPE model_cache_hits_total counter",
+        f"model_cache_hits_total {stats['hits']}",
+        "# HELP model_cache_misses_total Model cache misses.",
+        "# TYPE model_cache_misses_total counter",
+        f"model_cache_misses_total {stats['misses']}",
+    ]
+
+
+def response_cache_lines() -> list:
+    """Gauges/counters for the recommendation response cache."""
+    stats = response_cache.stats()
+    return [
+        "# HELP response_cache_entries Entries held by the response cache.",
+        "# TYPE response_cache_entries gauge",
+        f"response_cache_entries {stats['entries']}",
+        "# HELP response_cache_hits_total Recommendation responses served from cache.",
+        "# TYPE response_cache_hits_total counter",
+        f"response_cache_hits_total {stats['hits']}",
+        "# HELP response_cache_misses_total Recommendation responses computed.",
+        "# TYPE response_cache_misses_total counter",
+        f"response_cache_misses_total {stats['misses']}",
+    ]
+
+
+# GET /metrics - Per-stage recommendation latency histograms and cache stats
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    return PlainTextResponse(render_metrics(model_cache_lines() + response_cache_lines()), media_type="text/plain; version=0.0.4")
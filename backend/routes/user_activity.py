@@ -1,34 +1,84 @@
-from fastapi import APIRouter, Depends
+from typing import List, Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 from backend.database import get_db
-from backend import models
+from backend import models, settings
 from backend.schemas import UserActivityCreate, UserActivityRead
+from backend.utils.activity import activity_row, buffer_event, insert_activity, unknown_mix_ids
+from backend.utils.pagination import NEXT_CURSOR_HEADER, fetch_page, ndjson_response
+from backend.utils.response_cache import response_cache
+from backend.utils.taste import fold_activity, utcnow
 
 router = APIRouter(prefix="/user-activity", tags=["user-activity"])
 
+def _activity_page(db: Session, query, response: Response, cursor: Optional[str], limit: int, format: str):
+    """A keyset page of activity rows (newest first), or all of them as NDJSON."""
+    keys = [models.UserActivity.timestamp, models.UserActivity.id]
+    if format == "ndjson":
+        return ndjson_response(db, query, keys, cursor, lambda r: UserActivityRead.model_validate(r).model_dump())
+    rows, next_cursor = fetch_page(db, query, keys, cursor, limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return rows
+
 @router.get("/by-user/{user_id}", response_model=list[UserActivityRead])
-def list_by_user(user_id: str, db: Session = Depends(get_db)):
-    return (db.query(models.UserActivity)
-              .filter(models.UserActivity.user_id == user_id)
-              .order_by(models.UserActivity.timestamp.desc())
-              .all())
+def list_by_user(user_id: str, response: Response, mix_id: Optional[str] = None,
+                 cursor: Optional[str] = None,
+                 limit: int = Query(settings.PAGE_DEFAULT_LIMIT, ge=1, le=settings.PAGE_MAX_LIMIT),
+                 format: Literal["json", "ndjson"] = "json",
+                 db: Session = Depends(get_db)):
+    """The user's activity, newest first; pass `X-Next-Cursor` back as `cursor` for the next page."""
+    # Pages across mixes follow ix_user_time_id, pages within one mix ix_user_mix_time
+    query = db.query(models.UserActivity).filter(models.UserActivity.user_id == user_id)
+    if mix_id:
+        query = query.filter(models.UserActivity.mix_id == mix_id)
+    return _activity_page(db, query, response, cursor, limit, format)
 
 @router.get("/by-mix/{mix_id}", response_model=list[UserActivityRead])
-def list_by_mix(mix_id: str, db: Session = Depends(get_db)):
-    return (db.query(models.UserActivity)
-              .filter(models.UserActivity.mix_id == mix_id)
-              .order_by(models.UserActivity.timestamp.desc())
-              .all())
-              
+def list_by_mix(mix_id: str, response: Response, cursor: Optional[str] = None,
+                limit: int = Query(settings.PAGE_DEFAULT_LIMIT, ge=1, le=settings.PAGE_MAX_LIMIT),
+                format: Literal["json", "ndjson"] = "json",
+                db: Session = Depends(get_db)):
+    """The mix's activity, newest first; pass `X-Next-Cursor` back as `cursor` for the next page."""
+    query = db.query(models.UserActivity).filter(models.UserActivity.mix_id == mix_id)
+    return _activity_page(db, query, response, cursor, limit, format)
+
 @router.post("", response_model=UserActivityRead)
-def log_user_activity(payload: UserActivityCreate, db: Session = Depends(get_db)):
+def log_user_activity(payload: UserActivityCreate, response: Response, db: Session = Depends(get_db)):
+    # With write-behind enabled the event is queued and written in bulk later
+    buffered = buffer_event(payload.user_id, payload.mix_id, payload.content_id, payload.event_type)
+    if buffered is not None:
+        response.status_code = 202
+        return buffered
+
     rec = models.UserActivity(
         user_id=payload.user_id,
         mix_id=payload.mix_id,
         content_id=payload.content_id,
         event_type=payload.event_type,
+        timestamp=utcnow(),
     )
     db.add(rec)
+    # The profile is rebuilt from the history if it's stale, which must include this event
+    db.flush()
+    fold_activity(db, [{"user_id": rec.user_id, "mix_id": rec.mix_id, "content_id": rec.content_id,
+                        "timestamp": rec.timestamp}])
     db.commit()
     db.refresh(rec)
-    return rec
\ No newline at end of file
+    # Cached recommendations for this user in this mix are now stale
+    response_cache.invalidate_user(payload.mix_id, payload.user_id)
+    return rec
+
+@router.post("/batch")
+def log_user_activity_batch(payload: List[UserActivityCreate], db: Session = Depends(get_db)):
+    """Insert many events with one bulk write."""
+    if len(payload) > settings.ACTIVITY_BATCH_MAX_EVENTS:
+        raise HTTPException(status_code=413, detail=f"At most {settings.ACTIVITY_BATCH_MAX_EVENTS} events per batch")
+    rows = [activity_row(e.user_id, e.mix_id, e.content_id, e.event_type) for e in payload]
+    unknown = unknown_mix_ids(db, rows) if rows else set()
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Mix not found: {', '.join(sorted(unknown))}")
+    inserted = insert_activity(db, rows)
+    db.commit()
+    return {"inserted": inserted}
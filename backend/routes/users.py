@@ -1,9 +1,12 @@
 # --- backend/routes/users.py ---
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 from backend.database import get_db  # DB session dependency
-from backend import models
+from backend import models, settings
 from backend.schemas import UserCreate, UserRead
+from backend.utils.pagination import NEXT_CURSOR_HEADER, fetch_page, ndjson_response
 
 # Create a router for all /users endpoints
 router = APIRouter(prefix="/users", tags=["users"])
@@ -28,10 +31,22 @@ def create_user(payload: UserCreate, db: Session = Depends(get_db)):
     db.refresh(user)   # Refresh object to get DB-generated values (like ID)
     return user
 
-# GET /users - List all users
+# GET /users - List users a page at a time (next page's cursor in X-Next-Cursor)
 @router.get("", response_model=list[UserRead])
-def list_users(db: Session = Depends(get_db)):
-    return db.query(models.User).all()  # Get all users from DB
+def list_users(response: Response, cursor: Optional[str] = None,
+               limit: int = Query(settings.PAGE_DEFAULT_LIMIT, ge=1, le=settings.PAGE_MAX_LIMIT),
+               format: Literal["json", "ndjson"] = "json",
+               db: Session = Depends(get_db)):
+    # Keyed on the primary key alone: created_at is nullable
+    query = db.query(models.User)
+    keys = [models.User.id]
+    if format == "ndjson":
+        return ndjson_response(db, query, keys, cursor, lambda u: UserRead.model_validate(u).model_dump(),
+                               descending=False)
+    users, next_cursor = fetch_page(db, query, keys, cursor, limit, descending=False)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return users
 
 # GET /users/{user_id} - Retrieve a single user by ID
 @router.get("/{user_id}", response_model=UserRead)
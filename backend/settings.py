@@ -0,0 +1,113 @@
+# backend/settings.py
+# Tunables for the recommendation engine. Every value can be overridden with
+# an environment variable (or a `.env` file, same as `DATABASE_URL`).
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Upper bound, in bytes, for the process-wide cache of featurized mixes
+MODEL_CACHE_MAX_BYTES = int(os.getenv("MODEL_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Mixes with at least this many items get an approximate nearest-neighbour
+# (IVF) index; smaller mixes are always scored exactly
+ANN_MIN_ITEMS = int(os.getenv("ANN_MIN_ITEMS", "50000"))
+
+# Default number of IVF clusters scanned per query when a mix doesn't set
+# its own `ann_nprobe` (higher = better recall, slower)
+ANN_DEFAULT_NPROBE = int(os.getenv("ANN_DEFAULT_NPROBE", "8"))
+
+# Neighbours precomputed per item at ingest (serves seed-only requests with
+# top_k * 5 <= NEIGHBORS_TOP_M straight from the table)
+NEIGHBORS_TOP_M = int(os.getenv("NEIGHBORS_TOP_M", "100"))
+
+# Mixes larger than this skip the neighbour table (building it is O(N^2))
+NEIGHBORS_MAX_ITEMS = int(os.getenv("NEIGHBORS_MAX_ITEMS", os.getenv("ANN_MIN_ITEMS", "50000")))
+
+# Threads running blocking endpoint bodies (DB queries, scoring) off the
+# event loop; this also caps how many heavy requests run at once
+DB_POOL_WORKERS = int(os.getenv("DB_POOL_WORKERS", "8"))
+
+# Worker processes for featurization / embedding work (0 = run inline)
+CPU_POOL_WORKERS = int(os.getenv("CPU_POOL_WORKERS", "2"))
+
+# Level of the structured `recengine` logger (DEBUG, INFO, WARNING, ...)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "WARNING").upper()
+
+# Fraction of DEBUG events actually emitted when DEBUG is enabled
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.01"))
+
+# Recommendation response cache: max entries (0 disables) and TTL in seconds.
+# The TTL bounds staleness for writes made through another worker process.
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "10000"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "60"))
+
+# Largest accepted CSV upload, and the chunk size it is streamed to disk in
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+
+# Rows per executemany / COPY chunk when bulk-loading a mix's catalog
+BULK_INSERT_CHUNK_ROWS = int(os.getenv("BULK_INSERT_CHUNK_ROWS", "5000"))
+
+# Threads running background ingest / embedding jobs (0 = run inline, in the request)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+
+# How often a process renews the lease on its queued / running jobs, and how
+# long a job may go unrenewed before another process marks it failed
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "30"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "120"))
+
+# Worker processes `rebuild-all` fans mixes out to, capped at the CPU count
+# (0 or 1 = one mix at a time in the job thread)
+REBUILD_WORKERS = int(os.getenv("REBUILD_WORKERS", "4"))
+
+# Rows per chunk when streaming an uploaded CSV into the DB
+CSV_CHUNK_ROWS = int(os.getenv("CSV_CHUNK_ROWS", "20000"))
+
+# Hashed term columns of the ingest-time TF-IDF vectors (fit a chunk at a time)
+HASHING_TFIDF_FEATURES = int(os.getenv("HASHING_TFIDF_FEATURES", str(2 ** 18)))
+
+# Write-behind buffer for single POST /user-activity events: flushed in bulk
+# at this many events or every ACTIVITY_FLUSH_SECONDS (0 = insert each event
+# in its own request)
+ACTIVITY_FLUSH_ROWS = int(os.getenv("ACTIVITY_FLUSH_ROWS", "0"))
+ACTIVITY_FLUSH_SECONDS = float(os.getenv("ACTIVITY_FLUSH_SECONDS", "1.0"))
+
+# Events the write-behind buffer holds before requests wait for a flush; a
+# request still waiting after ACTIVITY_ENQUEUE_TIMEOUT_SECONDS gets a 503
+ACTIVITY_BUFFER_MAX_EVENTS = int(os.getenv("ACTIVITY_BUFFER_MAX_EVENTS", "50000"))
+ACTIVITY_ENQUEUE_TIMEOUT_SECONDS = float(os.getenv("ACTIVITY_ENQUEUE_TIMEOUT_SECONDS", "0.5"))
+
+# Largest accepted POST /user-activity/batch
+ACTIVITY_BATCH_MAX_EVENTS = int(os.getenv("ACTIVITY_BATCH_MAX_EVENTS", "10000"))
+
+# Listing endpoints (activity, users, mixes): default / largest page size,
+# and rows fetched per query when streaming a listing as NDJSON
+PAGE_DEFAULT_LIMIT = int(os.getenv("PAGE_DEFAULT_LIMIT", "100"))
+PAGE_MAX_LIMIT = int(os.getenv("PAGE_MAX_LIMIT", "1000"))
+STREAM_PAGE_ROWS = int(os.getenv("STREAM_PAGE_ROWS", "1000"))
+
+# Half-life of an interaction's weight in a user's taste vector, in days
+# (0 = every watched item counts the same)
+TASTE_HALF_LIFE_DAYS = float(os.getenv("TASTE_HALF_LIFE_DAYS", "0"))
+
+# Item co-occurrence (Level 2/3 collaborative signal): "cosine" or "jaccard"
+# normalisation, how often a request folds in new activity, how much older
+# activity each refresh re-reads (late write-behind flushes), and the most
+# items counted per user
+COOCCURRENCE_NORMALIZATION = os.getenv("COOCCURRENCE_NORMALIZATION", "cosine")
+COOCCURRENCE_REFRESH_SECONDS = float(os.getenv("COOCCURRENCE_REFRESH_SECONDS", "5"))
+COOCCURRENCE_OVERLAP_SECONDS = float(os.getenv("COOCCURRENCE_OVERLAP_SECONDS", "10"))
+COOCCURRENCE_MAX_ITEMS_PER_USER = int(os.getenv("COOCCURRENCE_MAX_ITEMS_PER_USER", "500"))
+
+# Level 4 implicit ALS: default latent factors / training sweeps (overridable
+# per training job), L2 regularisation, and confidence per event
+# (confidence = 1 + ALS_ALPHA * events for the (user, item) pair)
+ALS_FACTORS = int(os.getenv("ALS_FACTORS", "64"))
+ALS_ITERATIONS = int(os.getenv("ALS_ITERATIONS", "15"))
+ALS_REGULARIZATION = float(os.getenv("ALS_REGULARIZATION", "0.1"))
+ALS_ALPHA = float(os.getenv("ALS_ALPHA", "40"))
+
+# Floats of f x f systems an ALS sweep solves in one batch
+# (bounds training memory: 4 bytes each)
+ALS_BLOCK_FLOATS = int(os.getenv("ALS_BLOCK_FLOATS", str(2 ** 23)))
@@ -0,0 +1,232 @@
+"""Bulk and write-behind ingestion of user activity events.
+
+`insert_activity` writes a batch of events with one bulk insert, folds them
+into the users' taste profiles and drops the cached recommendations of
+every (mix, user) pair in it; it backs
+`POST /user-activity/batch`. With `ACTIVITY_FLUSH_ROWS > 0`, single
+`POST /user-activity` events go to the `ActivityBuffer` instead: a
+background thread writes them in bulk once `ACTIVITY_FLUSH_ROWS` are queued
+or `ACTIVITY_FLUSH_SECONDS` after the first one arrived. The queue is
+bounded, so a DB that can't keep up slows producers down (and eventually
+turns them away with a 503) instead of growing memory, and
+`shutdown_activity_buffer` writes whatever is still queued before the
+process exits.
+
+Buffered events get their id and timestamp when they are accepted, so the
+response matches the row written later; their effect on recommendations
+shows once they are flushed.
+"""
+import logging
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from backend import settings
+from backend.database import SessionLocal
+from backend.models import Mix, UserActivity
+from backend.utils.bulk_load import bulk_insert
+from backend.utils.log import log_event
+from backend.utils.metrics import Counter, register
+from backend.utils.response_cache import response_cache
+from backend.utils.taste import fold_activity, utcnow
+
+# Sessions for buffer flushes (tests point this at their own engine)
+session_factory = SessionLocal
+
+ACTIVITY_EVENTS = register(Counter(
+    "user_activity_events_total",
+    "User activity events by how they were handled.",
+    ["outcome"],
+))
+
+_STOP = object()
+
+
+def activity_row(user_id: str, mix_id: str, content_id: Optional[str], event_type: str,
+                 timestamp: Optional[datetime] = None) -> dict:
+    """A `user_activity` row with its id assigned (and timestamp, if given)."""
+    row = {"id": str(uuid.uuid4()), "user_id": user_id, "mix_id": mix_id,
+           "content_id": content_id, "event_type": event_type}
+    if timestamp is not None:
+        row["timestamp"] = timestamp
+    return row
+
+
+def unknown_mix_ids(db: Session, rows: List[dict]) -> set:
+    mix_ids = {row["mix_id"] for row in rows}
+    known = {mix_id for (mix_id,) in db.query(Mix.id).filter(Mix.id.in_(mix_ids))}
+    return mix_ids - known
+
+
+def insert_activity(db: Session, rows: List[dict]) -> int:
+    """Bulk insert activity rows (not committed), update taste profiles and invalidate cached responses.
+
+    Rows must share the same keys (`activity_row` output); ones without a
+    timestamp are stamped now, so the profiles see the stored time.
+    """
+    if not rows:
+        return 0
+    now = utcnow()
+    rows = [row if row.get("timestamp") else {**row, "timestamp": now} for row in rows]
+    columns: Dict[str, list] = {name: [row[name] for row in rows] for name in rows[0]}
+    inserted = bulk_insert(db, UserActivity.__table__, columns)
+    fold_activity(db, rows)
+    for mix_id, user_id in {(row["mix_id"], row["user_id"]) for row in rows}:
+        response_cache.invalidate_user(mix_id, user_id)
+    return inserted
+
+
+def flush_activity(rows: List[dict]) -> int:
+    """Write buffered rows in their own session; events for unknown mixes are dropped."""
+    db = session_factory()
+    try:
+        unknown = unknown_mix_ids(db, rows)
+        if unknown:
+            log_event("activity_unknown_mix", level=logging.WARNING, mix_ids=sorted(unknown))
+            ACTIVITY_EVENTS.inc(sum(row["mix_id"] in unknown for row in rows), outcome="dropped")
+            rows = [row for row in rows if row["mix_id"] not in unknown]
+        inserted = insert_activity(db, rows)
+        db.commit()
+        return inserted
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+class ActivityBuffer:
+    """Bounded queue of activity rows drained in bulk by one writer thread."""
+
+    def __init__(self, flush_rows: int, flush_seconds: float, max_events: int, write=flush_activity):
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self._write = write
+        self._queue: queue.Queue = queue.Queue(maxsize=max_events)
+        self._stopping = threading.Event()
+        # Puts in progress; `stop` waits for them so none lands after the writer is gone
+        self._putting = 0
+        self._puts_done = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="activity-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, row: dict, timeout: float) -> bool:
+        """Queue a row, waiting up to ``timeout`` seconds for room (503 after that).
+
+        Returns False, without queueing, once the buffer is stopping.
+        """
+        with self._puts_done:
+            if self._stopping.is_set():
+                return False
+            self._putting += 1
+        try:
+            self._queue.put(row, timeout=timeout)
+        except queue.Full:
+            ACTIVITY_EVENTS.inc(outcome="rejected")
+            raise HTTPException(status_code=503, detail="Activity buffer full, retry shortly",
+                                headers={"Retry-After": "1"})
+        finally:
+            with self._puts_done:
+                self._putting -= 1
+                self._puts_done.notify_all()
+        ACTIVITY_EVENTS.inc(outcome="buffered")
+        return True
+
+    def queued(self) -> int:
+        return self._queue.qsize()
+
+    def stop(self) -> None:
+        """Write everything queued so far and stop the writer thread."""
+        with self._puts_done:
+            self._stopping.set()
+            self._puts_done.wait_for(lambda: self._putting == 0)
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _run(self) -> None:
+        batch: List[dict] = []
+        deadline = 0.0
+        stopping = False
+        while not stopping:
+            timeout = max(0.0, deadline - time.monotonic()) if batch else None
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                stopping = True
+            elif item is not None:
+                if not batch:
+                    deadline = time.monotonic() + self.flush_seconds
+                batch.append(item)
+                if len(batch) < self.flush_rows:
+                    continue
+            if batch:
+                self._flush(batch)
+                batch = []
+
+    def _flush(self, batch: List[dict]) -> None:
+        # A failing write is retried, not dropped; meanwhile the queue fills
+        # up and producers are slowed down / turned away
+        while True:
+            try:
+                ACTIVITY_EVENTS.inc(self._write(batch), outcome="flushed")
+                return
+            except Exception as e:
+                if self._stopping.is_set():
+                    ACTIVITY_EVENTS.inc(len(batch), outcome="dropped")
+                    log_event("activity_flush_dropped", level=logging.ERROR, events=len(batch), error=str(e))
+                    return
+                log_event("activity_flush_failed", level=logging.WARNING, events=len(batch), error=str(e))
+                time.sleep(self.flush_seconds)
+
+
+_lock = threading.Lock()
+_buffer: Optional[ActivityBuffer] = None
+_closed = False  # set at shutdown; later events are written synchronously
+
+
+def get_activity_buffer() -> Optional[ActivityBuffer]:
+    """The process-wide buffer, or None when write-behind is disabled or shut down."""
+    global _buffer
+    if settings.ACTIVITY_FLUSH_ROWS <= 0:
+        return None
+    with _lock:
+        if _closed:
+            return None
+        if _buffer is None:
+            _buffer = ActivityBuffer(settings.ACTIVITY_FLUSH_ROWS, settings.ACTIVITY_FLUSH_SECONDS,
+                                     settings.ACTIVITY_BUFFER_MAX_EVENTS)
+        return _buffer
+
+
+def buffer_event(user_id: str, mix_id: str, content_id: Optional[str], event_type: str) -> Optional[dict]:
+    """Queue an event for write-behind; None when the buffer is disabled or
+    shutting down (the caller writes the event itself)."""
+    buffer = get_activity_buffer()
+    if buffer is None:
+        return None
+    row = activity_row(user_id, mix_id, content_id, event_type, timestamp=utcnow())
+    if not buffer.put(row, settings.ACTIVITY_ENQUEUE_TIMEOUT_SECONDS):
+        return None
+    return row
+
+
+def shutdown_activity_buffer() -> None:
+    """Flush queued events and stop the writer (no-op when write-behind is off).
+
+    Events logged after this are written synchronously rather than queued
+    on a new writer that the exiting process would never flush.
+    """
+    global _buffer, _closed
+    with _lock:
+        _closed = True
+        buffer, _buffer = _buffer, None
+    if buffer is not None:
+        buffer.stop()
@@ -0,0 +1,213 @@
+"""Implicit-feedback matrix factorisation for Level 4.
+
+`train_als` is implicit ALS (Hu, Koren & Volinsky, 2008) on a mix's
+`user_activity`: every (user, item) pair with events has preference 1 and
+confidence 1 + ALS_ALPHA * events, all other pairs preference 0 and
+confidence 1. Each sweep solves every user's factors exactly given the
+items', then the items' given the users':
+
+    (YᵀY + Yᵀ(C_u - I)Y + λI) x_u = YᵀC_u p_u
+
+YᵀY is shared, so a user costs O(n_u f² + f³) for n_u items: one
+Y_uᵀ(C_u - I)Y_u product per user, then the systems of a block of users
+(ALS_BLOCK_FLOATS bounds their memory) go to one batched `np.linalg.solve`.
+Sweeps run on the CPU process pool (`run_cpu_bound`), not the job thread.
+
+Factors are float32, written per mix to `factors/{mix_id}.als.npz` with
+their user and content ids. Serving scores every item with one
+user-vector x item-matrix product. Item factors are mapped onto the current
+catalog by content id, so a model keeps serving after re-ingest (items it
+hasn't seen are never recommended) until it is retrained.
+"""
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from backend import settings
+from backend.models import MixContent, UserActivity
+from backend.paths import mix_factors_path
+from backend.utils.executors import run_cpu_bound
+from backend.utils.jobs import job_progress, job_stage
+from backend.utils.log import log_event
+from backend.utils.model_cache import MixFeatures, get_content_version, model_cache
+from backend.utils.response_cache import response_cache
+
+
+def _solve(fixed: np.ndarray, weights: sp.csr_matrix, regularization: float) -> np.ndarray:
+    """Least-squares factors of every row of ``weights`` given the other side's ``fixed`` factors.
+
+    ``weights`` holds C - 1 (ALS_ALPHA * events) for the observed pairs.
+    """
+    n_factors = fixed.shape[1]
+    gram = fixed.T @ fixed + regularization * np.eye(n_factors, dtype=np.float32)
+    solved = np.zeros((weights.shape[0], n_factors), dtype=np.float32)
+    indptr, indices, data = weights.indptr, weights.indices, weights.data
+    rows = np.flatnonzero(np.diff(indptr))
+    block = max(1, settings.ALS_BLOCK_FLOATS // (n_factors * n_factors))
+    a = np.empty((min(block, len(rows)), n_factors, n_factors), dtype=np.float32)
+    b = np.empty((len(a), n_factors), dtype=np.float32)
+
+    for start in range(0, len(rows), block):
+        block_rows = rows[start:start + block]
+        for k, row in enumerate(block_rows):
+            # One BLAS product per row; forming per-pair outer products
+            # instead moves ~f² floats through memory per pair
+            lo, hi = indptr[row], indptr[row + 1]
+            y = fixed[indices[lo:hi]]
+            weighted = y * data[lo:hi, None]
+            a[k] = gram + weighted.T @ y
+            b[k] = (y + weighted).sum(axis=0)
+        n = len(block_rows)
+        solved[block_rows] = np.linalg.solve(a[:n], b[:n, :, None])[:, :, 0]
+    return solved
+
+
+def train_als(counts: sp.csr_matrix, factors: int, iterations: int, regularization: float = None,
+              alpha: float = None, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """(user factors, item factors) of a users x items matrix of event counts."""
+    regularization = settings.ALS_REGULARIZATION if regularization is None else regularization
+    alpha = settings.ALS_ALPHA if alpha is None else alpha
+    weights = (counts.astype(np.float32) * alpha).tocsr()
+    weights_t = weights.T.tocsr()
+    rng = np.random.default_rng(seed)
+    user_factors = (rng.standard_normal((counts.shape[0], factors)) * 0.01).astype(np.float32)
+    item_factors = (rng.standard_normal((counts.shape[1], factors)) * 0.01).astype(np.float32)
+    for iteration in range(iterations):
+        # Sweeps run in the CPU process pool so training doesn't hold the
+        # GIL of the API process; progress is reported between them
+        user_factors, item_factors = run_cpu_bound(_sweep, weights, weights_t, item_factors, regularization)
+        job_progress(iteration + 1, iterations)
+    return user_factors, item_factors
+
+
+def _sweep(weights: sp.csr_matrix, weights_t: sp.csr_matrix, item_factors: np.ndarray,
+           regularization: float) -> Tuple[np.ndarray, np.ndarray]:
+    """One ALS sweep: users given the items, then items given the users."""
+    user_factors = _solve(item_factors, weights, regularization)
+    return user_factors, _solve(user_factors, weights_t, regularization)
+
+
+@dataclass
+class ALSModel:
+    user_ids: np.ndarray  # (U,) str, row i <-> user_factors[i]
+    content_ids: np.ndarray  # (I,) str, row j <-> item_factors[j]
+    user_factors: np.ndarray  # (U, f) float32
+    item_factors: np.ndarray  # (I, f) float32
+    version: int  # content version of the mix when trained
+    index: Dict[str, int] = field(default_factory=dict)  # user_id -> row
+
+    def __post_init__(self):
+        if not self.index:
+            self.index = {uid: row for row, uid in enumerate(self.user_ids.tolist())}
+
+
+def write_model(path, model: ALSModel) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp.npz"
+    np.savez(tmp_path, user_ids=model.user_ids, content_ids=model.content_ids, user_factors=model.user_factors,
+             item_factors=model.item_factors, version=np.int64(model.version))
+    os.replace(tmp_path, path)
+
+
+def read_model(path) -> Optional[ALSModel]:
+    if not os.path.exists(path):
+        return None
+    with np.load(path, allow_pickle=False) as data:
+        return ALSModel(data["user_ids"], data["content_ids"], data["user_factors"], data["item_factors"],
+                        int(data["version"]))
+
+
+def load_counts(db: Session, mix_id: str) -> Tuple[np.ndarray, np.ndarray, sp.csr_matrix]:
+    """(user ids, content ids, users x items event counts) of the mix's catalog items."""
+    catalog = {cid for (cid,) in db.query(MixContent.content_id).filter(MixContent.mix_id == mix_id)}
+    pairs = [(uid, cid, n) for uid, cid, n in
+             db.query(UserActivity.user_id, UserActivity.content_id, func.count())
+               .filter(UserActivity.mix_id == mix_id)
+               .group_by(UserActivity.user_id, UserActivity.content_id)
+             if cid in catalog]
+    user_ids = np.array(sorted({p[0] for p in pairs}), dtype=str)
+    content_ids = np.array(sorted({p[1] for p in pairs}), dtype=str)
+    users = {uid: row for row, uid in enumerate(user_ids.tolist())}
+    items = {cid: row for row, cid in enumerate(content_ids.tolist())}
+    counts = sp.csr_matrix(
+        (np.array([p[2] for p in pairs], dtype=np.float32),
+         ([users[p[0]] for p in pairs], [items[p[1]] for p in pairs])),
+        shape=(len(user_ids), len(content_ids)))
+    return user_ids, content_ids, counts
+
+
+def train_mix_model(mix_id: str, factors: int, iterations: int, db: Session) -> dict:
+    """Train and save a mix's ALS model (body of the `train_als` job)."""
+    started = time.perf_counter()
+    with job_stage("load_activity"):
+        version = get_content_version(db, mix_id)
+        user_ids, content_ids, counts = load_counts(db, mix_id)
+    if counts.nnz == 0:
+        raise ValueError(f"No activity on catalog items of mix {mix_id}")
+    with job_stage("train"):
+        user_factors, item_factors = train_als(counts, factors, iterations)
+    with job_stage("write"):
+        write_model(mix_factors_path(mix_id), ALSModel(user_ids, content_ids, user_factors, item_factors, version))
+    # Cached Level 4 responses were ranked by the previous model
+    response_cache.invalidate_content(mix_id)
+    result = {"users": len(user_ids), "items": len(content_ids), "interactions": int(counts.nnz),
+              "factors": factors, "iterations": iterations, "seconds": round(time.perf_counter() - started, 4)}
+    log_event("als_trained", mix_id=mix_id, **result)
+    return result
+
+
+@dataclass
+class ServingModel:
+    """An ALS model with its item factors laid out on a catalog's rows."""
+    model: ALSModel
+    item_matrix: np.ndarray  # (N, f) float32, row i <-> catalog row i (zeros for unseen items)
+    known: np.ndarray  # (N,) bool, catalog rows the model has factors for
+    mtime: float  # of the model file, to notice retraining
+    nbytes: int = 0
+
+    def __post_init__(self):
+        if not self.nbytes:
+            self.nbytes = int(self.model.user_factors.nbytes + self.item_matrix.nbytes
+                               + self.model.user_ids.nbytes + 100 * len(self.model.index))
+
+    def knows(self, user_id: Optional[str]) -> bool:
+        return user_id in self.model.index
+
+    def user_scores(self, user_ids: List[str]) -> np.ndarray:
+        """Score of every catalog item for each (known) user, one row each; -inf for unseen items."""
+        rows = [self.model.index[uid] for uid in user_ids]
+        scores = self.model.user_factors[rows] @ self.item_matrix.T
+        scores[:, ~self.known] = -np.inf
+        return scores
+
+
+def get_serving_model(db: Session, mix_id: str, features: MixFeatures) -> Optional[ServingModel]:
+    """The mix's trained model on the rows of ``features``, or None if it was never trained."""
+    path = mix_factors_path(mix_id)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    key = (mix_id, "als", get_content_version(db, mix_id))
+    serving = model_cache.get(key)
+    if serving is not None and serving.mtime == mtime:
+        return serving
+
+    model = read_model(path)
+    if model is None:
+        return None
+    rows = np.array([features.index.get(cid, -1) for cid in model.content_ids.tolist()], dtype=np.int64)
+    present = rows >= 0
+    item_matrix = np.zeros((len(features.df), model.item_factors.shape[1]), dtype=np.float32)
+    item_matrix[rows[present]] = model.item_factors[present]
+    known = np.zeros(len(features.df), dtype=bool)
+    known[rows[present]] = True
+    serving = ServingModel(model, item_matrix, known, mtime)
+    model_cache.put(key, serving, serving.nbytes)
+    return serving
@@ -0,0 +1,151 @@
+"""Approximate nearest-neighbour search for large mixes.
+
+`IVFIndex` is an inverted-file index implemented in NumPy: item vectors are
+clustered with k-means, and a query only scans the items in the ``nprobe``
+clusters whose centroids are closest to it. Raising ``nprobe`` trades latency
+for recall (``nprobe == n_lists`` is an exact scan).
+
+The index only selects candidates; callers re-score the candidates against
+the full feature matrix, so returned scores are exact.
+
+Building it (k-means, plus TruncatedSVD for sparse features) is the most
+expensive step of featurizing a large mix, so it runs at ingest and is
+stored as ``ann/{mix_id}.{featurizer}.npz`` with the content ids it covers
+and the mix's content version; serving only loads it.
+"""
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.decomposition import TruncatedSVD
+from sklearn.preprocessing import normalize
+
+# Rows processed per block when assigning items to clusters (bounds memory)
+_ASSIGN_BLOCK = 16384
+
+
+class IVFIndex:
+    """Inverted-file index over L2-normalised dense vectors."""
+
+    def __init__(self, vectors: np.ndarray, n_lists: Optional[int] = None, n_iter: int = 10, seed: int = 0,
+                 projection: Optional[np.ndarray] = None):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        n = len(vectors)
+        self.n_lists = max(1, min(n, n_lists or int(np.sqrt(n))))
+        # (components, features) TruncatedSVD basis for sparse inputs, else None
+        self.projection = projection
+        self.vectors = vectors
+
+        rng = np.random.default_rng(seed)
+        centroids = vectors[rng.choice(n, self.n_lists, replace=False)].copy()
+        assign = np.zeros(n, dtype=np.int64)
+        for _ in range(n_iter):
+            assign = self._assign(centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, vectors)
+            counts = np.bincount(assign, minlength=self.n_lists)
+            empty = counts == 0
+            if empty.any():
+                # Re-seed empty clusters with random items
+                sums[empty] = vectors[rng.choice(n, int(empty.sum()), replace=False)]
+            centroids = normalize(sums, norm="l2")
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        assign = self._assign(self.centroids)
+
+        # Items grouped by cluster: list j is list_ids[offsets[j]:offsets[j + 1]]
+        self.list_ids = np.argsort(assign, kind="stable")
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=self.n_lists))])
+
+    def _assign(self, centroids: np.ndarray) -> np.ndarray:
+        out = np.empty(len(self.vectors), dtype=np.int64)
+        for start in range(0, len(self.vectors), _ASSIGN_BLOCK):
+            block = self.vectors[start:start + _ASSIGN_BLOCK]
+            out[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        return out
+
+    @classmethod
+    def from_arrays(cls, vectors: np.ndarray, centroids: np.ndarray, list_ids: np.ndarray, offsets: np.ndarray,
+                    projection: Optional[np.ndarray] = None) -> "IVFIndex":
+        """An index from the arrays of a built one (see `write_ann_index`)."""
+        index = cls.__new__(cls)
+        index.vectors, index.centroids, index.list_ids, index.offsets = vectors, centroids, list_ids, offsets
+        index.n_lists = len(centroids)
+        index.projection = projection
+        return index
+
+    @property
+    def nbytes(self) -> int:
+        projection = self.projection.nbytes if self.projection is not None else 0
+        return int(self.vectors.nbytes + self.centroids.nbytes + self.list_ids.nbytes + self.offsets.nbytes
+                   + projection)
+
+    @property
+    def n_features(self) -> Optional[int]:
+        """Width of the feature rows it projects (None: dense rows as indexed)."""
+        return self.projection.shape[1] if self.projection is not None else None
+
+    def project(self, query) -> np.ndarray:
+        """Map a feature row (sparse or dense) into the index's vector space."""
+        if self.projection is not None:
+            # TruncatedSVD.transform: the row in the components' basis
+            query = query @ self.projection.T
+        query = np.asarray(query, dtype=np.float32).reshape(1, -1)
+        return normalize(query, norm="l2")[0]
+
+    def search(self, query, k: int, nprobe: int = 8) -> np.ndarray:
+        """Row ids of up to ``k`` approximate nearest neighbours, best first."""
+        q = self.project(query)
+        nprobe = max(1, min(nprobe, self.n_lists))
+        centroid_scores = self.centroids @ q
+        if nprobe < self.n_lists:
+            probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        else:
+            probe = np.arange(self.n_lists)
+        rows = np.concatenate([self.list_ids[self.offsets[j]:self.offsets[j + 1]] for j in probe])
+        if len(rows) <= k:
+            return rows[np.argsort(-(self.vectors[rows] @ q), kind="stable")]
+        approx = self.vectors[rows] @ q
+        top = np.argpartition(-approx, k - 1)[:k]
+        return rows[top[np.argsort(-approx[top], kind="stable")]]
+
+
+def build_ann_index(matrix, n_components: int = 128, **kwargs) -> IVFIndex:
+    """Build an IVF index from a mix's feature matrix.
+
+    Dense (sentence-transformer) embeddings are indexed as-is; sparse TF-IDF
+    is first reduced with TruncatedSVD so clustering runs on dense vectors.
+    """
+    projection = None
+    if sp.issparse(matrix):
+        n_components = max(1, min(n_components, matrix.shape[1] - 1, matrix.shape[0] - 1))
+        svd = TruncatedSVD(n_components=n_components, random_state=0)
+        vectors = svd.fit_transform(matrix)
+        projection = np.ascontiguousarray(svd.components_, dtype=np.float32)
+    else:
+        vectors = matrix
+    vectors = normalize(np.asarray(vectors, dtype=np.float32), norm="l2")
+    return IVFIndex(vectors, projection=projection, **kwargs)
+
+
+def write_ann_index(path, index: IVFIndex, content_ids: List[str], version: int) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp.npz"
+    arrays = {"vectors": index.vectors, "centroids": index.centroids, "list_ids": index.list_ids,
+              "offsets": index.offsets, "content_ids": np.array(content_ids, dtype=str),
+              "version": np.int64(version)}
+    if index.projection is not None:
+        arrays["projection"] = index.projection
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+
+def read_ann_index(path) -> Optional[Tuple[IVFIndex, np.ndarray, int]]:
+    """(index, content ids of its rows, content version), or None if not written."""
+    if not os.path.exists(path):
+        return None
+    with np.load(path, allow_pickle=False) as data:
+        projection = data["projection"] if "projection" in data.files else None
+        index = IVFIndex.from_arrays(data["vectors"], data["centroids"], data["list_ids"], data["offsets"],
+                                     projection)
+        return index, data["content_ids"], int(data["version"])
@@ -0,0 +1,206 @@
+"""Compiled business rules.
+
+A mix's rules dict is compiled once per (content version, rules version) into
+a `RulesPlan`: include / exclude / boost tags become item masks built from
+the mix's inverted `TagIndex` and pinned ids a set. `allowed` (include minus
+exclude) is applied to the similarity scores before top-k selection, so tag
+filters never starve the candidate list; applying a plan to the ranked
+candidates is then a handful of vectorised lookups over arrays of candidate
+rows and scores, plus one pass for the per-tag cap. `diversity_weight` (MMR)
+and `random_sample` re-order the filtered candidates before the cap; see
+`backend.utils.rerank`. The legacy `max_diversity` key (1.0 in rules saved
+before MMR existed) is ignored.
+"""
+import hashlib
+import json
+from dataclasses import dataclass
+from typing import FrozenSet, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from backend.paths import mix_tags_path
+from backend.utils.featurize import load_mix_frame, split_tags
+from backend.utils.model_cache import MixFeatures, get_content_version, model_cache
+from backend.utils.rerank import rerank_order
+from backend.utils.tag_index import TagIndex, build_tag_index, read_tag_index, write_tag_index
+
+
+@dataclass
+class RulesPlan:
+    min_score: float
+    allowed: Optional[np.ndarray]  # bool per item: passes include/exclude, None = no tag filter
+    boost: Optional[np.ndarray]  # bool per item: carries a boost tag, None = rule not set
+    max_from_same_tag: int
+    pinned: FrozenSet[str]
+    max_results: int
+    diversity: float = 0.0  # MMR redundancy weight, 0 = plain relevance order
+    random_sample: bool = False
+    random_seed: Optional[int] = None
+
+    @property
+    def reranks(self) -> bool:
+        return self.diversity > 0 or self.random_sample
+
+
+def rules_version(rules: dict) -> str:
+    """Content hash of a rules dict; changes whenever the rules do."""
+    return hashlib.sha1(json.dumps(rules, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+def compile_rules(rules: dict, tag_index: TagIndex) -> RulesPlan:
+    """Compile ``rules`` against the items of ``tag_index``."""
+    include_tags = rules.get("include_tags") or []
+    exclude_tags = rules.get("exclude_tags") or []
+    boost_tags = rules.get("boost_tags") or []
+
+    allowed = None
+    if include_tags or exclude_tags:
+        allowed = tag_index.any_tags(include_tags) if include_tags else np.ones(len(tag_index), dtype=bool)
+        if exclude_tags:
+            allowed &= ~tag_index.any_tags(exclude_tags)
+
+    max_from_same_tag = rules.get("max_from_same_tag")
+    max_results = rules.get("max_results")
+    return RulesPlan(
+        min_score=float(rules.get("min_content_score") or 0.0),
+        allowed=allowed,
+        boost=tag_index.any_tags(boost_tags) if boost_tags else None,
+        max_from_same_tag=3 if max_from_same_tag is None else int(max_from_same_tag),
+        pinned=frozenset(str(c) for c in (rules.get("pinned_content_ids") or [])),
+        max_results=10 if max_results is None else int(max_results),
+        diversity=min(max(float(rules.get("diversity_weight") or 0.0), 0.0), 1.0),
+        random_sample=bool(rules.get("random_sample")),
+        random_seed=rules.get("random_seed"),
+    )
+
+
+def build_mix_tag_index(db: Session, mix_id: str) -> TagIndex:
+    df = load_mix_frame(db, mix_id)
+    tags = [split_tags(t) for t in df["tags"]] if "tags" in df.columns else [[] for _ in range(len(df))]
+    return build_tag_index(df["content_id"].tolist(), tags)
+
+
+def rebuild_tag_index(db: Session, mix_id: str) -> int:
+    """Build and store the mix's tag index after its content changed (ingest)."""
+    version = get_content_version(db, mix_id)
+    tag_index = build_mix_tag_index(db, mix_id)
+    write_tag_index(mix_tags_path(mix_id), tag_index, version)
+    model_cache.put((mix_id, "tags", version), tag_index, tag_index.nbytes)
+    return len(tag_index.vocab)
+
+
+def get_tag_index(db: Session, mix_id: str) -> TagIndex:
+    """The mix's tag index for its current content version.
+
+    Read from the file written at ingest, or built from the catalog if that
+    is missing or stale.
+    """
+    version = get_content_version(db, mix_id)
+    key = (mix_id, "tags", version)
+    tag_index = model_cache.get(key)
+    if tag_index is None:
+        stored = read_tag_index(mix_tags_path(mix_id))
+        if stored is not None and stored[1] == version:
+            tag_index = stored[0]
+        else:
+            tag_index = build_mix_tag_index(db, mix_id)
+        model_cache.put(key, tag_index, tag_index.nbytes)
+    return tag_index
+
+
+def get_rules_plan(db: Session, mix_id: str, rules: dict,
+                   features: Optional[MixFeatures] = None) -> Tuple[RulesPlan, TagIndex]:
+    """Compiled plan for ``rules``, reused until the rules or the mix's content change.
+
+    With ``features`` the plan is compiled against their own tag index, so its
+    masks line up with the feature matrix rows.
+    """
+    tag_index = features.tag_index if features is not None else get_tag_index(db, mix_id)
+    version = rules_version(rules)
+    plan = tag_index.plans.get(version)
+    if plan is None:
+        plan = tag_index.plans.put(version, compile_rules(rules, tag_index))
+    return plan, tag_index
+
+
+def _at(mask: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """``mask[rows]`` with rows of -1 (unknown items) reading False."""
+    return np.where(rows >= 0, mask[np.maximum(rows, 0)], False)
+
+
+def apply_plan(plan: RulesPlan, tag_index: TagIndex, recommendations: List[dict],
+               features: Optional[MixFeatures] = None) -> List[dict]:
+    """Filter, cap, boost, pin and truncate ranked recommendation records.
+
+    Same order of operations as the original rules: score threshold, exclude,
+    include, at most ``max_from_same_tag`` items per tag (an item counts
+    against its first tag with room left), 20% boost, pinned first, cut to
+    ``max_results``. Diversity / random sampling re-order the candidates
+    right before the cap; MMR needs the mix's ``features``. Records are not
+    mutated; boosted ones are copied.
+    """
+    n = len(recommendations)
+    if n == 0:
+        return []
+    content_ids = [str(r.get("content_id")) for r in recommendations]
+    rows = np.fromiter((tag_index.index.get(c, -1) for c in content_ids), dtype=np.int64, count=n)
+    row_list = rows.tolist()
+    scores = np.fromiter((r.get("score") or 0.0 for r in recommendations), dtype=np.float64, count=n)
+
+    keep = np.ones(n, dtype=bool)
+    if plan.min_score > 0:
+        keep &= scores >= plan.min_score
+    if plan.allowed is not None:
+        keep &= _at(plan.allowed, rows)
+    positions = np.flatnonzero(keep)
+
+    if plan.reranks and len(positions):
+        feature_rows = None
+        if features is not None:
+            feature_rows = np.fromiter((features.index.get(content_ids[p], -1) for p in positions.tolist()),
+                                       dtype=np.int64, count=len(positions))
+        order = rerank_order(scores[positions], diversity=plan.diversity, random_sample=plan.random_sample,
+                             seed=plan.random_seed, matrix=features.matrix if features is not None else None,
+                             rows=feature_rows, k=plan.max_results)
+        positions = positions[order]
+
+    pinned = np.zeros(n, dtype=bool)
+    if plan.pinned:
+        pinned = np.fromiter((c in plan.pinned for c in content_ids), dtype=bool, count=n)
+    pinned_at = np.flatnonzero(pinned[positions])
+    last_pinned = int(pinned_at[-1]) if len(pinned_at) else -1
+
+    # Per-tag cap: inherently sequential, but only over small int lists.
+    # Past max_results, only candidates up to the last pinned one can matter.
+    counts = [0] * len(tag_index.vocab)
+    selected = []
+    for i, pos in enumerate(positions.tolist()):
+        if len(selected) >= plan.max_results and i > last_pinned:
+            break
+        row = row_list[pos]
+        tag_ids = tag_index.item_tags[row] if row >= 0 else []
+        if not tag_ids:
+            selected.append(pos)
+            continue
+        for tag_id in tag_ids:
+            if counts[tag_id] < plan.max_from_same_tag:
+                counts[tag_id] += 1
+                selected.append(pos)
+                break
+    selected = np.asarray(selected, dtype=np.int64)
+
+    boosted = np.zeros(len(selected), dtype=bool)
+    if plan.boost is not None and len(selected):
+        boosted = _at(plan.boost, rows[selected])
+
+    # Pinned items first (stable), then the rest
+    order = np.argsort(~pinned[selected], kind="stable")[:plan.max_results]
+
+    result = []
+    for i in order.tolist():
+        rec = recommendations[selected[i]]
+        if boosted[i]:
+            rec = {**rec, "score": min(1.0, float(scores[selected[i]]) * 1.2)}  # Boost by 20%
+        result.append(rec)
+    return result
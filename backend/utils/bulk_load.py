@@ -0,0 +1,217 @@
+"""Bulk loading of mapped catalog rows and their embeddings.
+
+The mapped DataFrame is converted column-wise (no per-row ORM objects) and
+written in chunks: `COPY ... FROM STDIN` on PostgreSQL, executemany of a
+Core `insert()` elsewhere (SQLite). Nothing here commits, so a caller can
+replace a mix's rows and embeddings inside one transaction.
+
+`sync_mix_content` re-ingests a catalog by diff, streaming it a chunk at a
+time: every row carries a hash of its mapped fields, and only rows whose
+hash changed (keyed by `content_id`) are inserted, updated or deleted.
+"""
+import hashlib
+import io
+import uuid
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+import pandas as pd
+from sqlalchemy import Table, bindparam, insert, update
+from sqlalchemy.orm import Session
+
+from backend import settings
+from backend.models import Embedding, MixContent
+
+CONTENT_FIELDS = ["title", "description", "image_url", "content_id", "tags"]
+
+
+def _string_column(series: pd.Series) -> list:
+    """Values as str, NaN -> None (all catalog columns are String)."""
+    return series.astype(str).where(series.notna(), None).tolist()
+
+
+def row_hash(values: Sequence[Optional[str]]) -> str:
+    """Hash of one row's mapped field values (None and "" hash differently)."""
+    text = "\x1f".join("\x00" if v is None else v for v in values)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def content_columns(df: pd.DataFrame, mix_id: str, new_ids: bool = True) -> Dict[str, list]:
+    """`mix_contents` columns for a mapped catalog frame (ids left None unless ``new_ids``)."""
+    n = len(df)
+    ids = [str(uuid.uuid4()) for _ in range(n)] if new_ids else [None] * n
+    columns = {"id": ids, "mix_id": [mix_id] * n}
+    for name in CONTENT_FIELDS:
+        columns[name] = _string_column(df[name]) if name in df.columns else [None] * n
+    columns["row_hash"] = [row_hash(values) for values in zip(*(columns[name] for name in CONTENT_FIELDS))]
+    return columns
+
+
+def embedding_columns(mix_id: str, content_ids: Sequence, vectors: List[bytes], model_name: str,
+                      text_hashes: Optional[List[str]] = None) -> Dict[str, list]:
+    """`embeddings` columns for already serialised vectors."""
+    n = len(vectors)
+    return {
+        "id": [str(uuid.uuid4()) for _ in range(n)],
+        "mix_id": [mix_id] * n,
+        "content_id": [str(c) for c in content_ids],
+        "model_name": [model_name] * n,
+        "text_hash": list(text_hashes) if text_hashes is not None else [None] * n,
+        "vector": list(vectors),
+    }
+
+
+def _copy_value(value) -> str:
+    """One field in PostgreSQL COPY text format."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return "\\\\x" + bytes(value).hex()
+    return (str(value).replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+
+def _copy_rows(db: Session, table: Table, columns: Dict[str, list], n: int) -> None:
+    names = list(columns)
+    sql = f"COPY {table.name} ({', '.join(names)}) FROM STDIN"
+    raw = db.connection().connection.driver_connection
+    chunk = settings.BULK_INSERT_CHUNK_ROWS
+    with raw.cursor() as cursor:
+        for start in range(0, n, chunk):
+            buf = io.StringIO()
+            for values in zip(*(columns[c][start:start + chunk] for c in names)):
+                buf.write("\t".join(_copy_value(v) for v in values))
+                buf.write("\n")
+            buf.seek(0)
+            cursor.copy_expert(sql, buf)
+
+
+def bulk_insert(db: Session, table: Table, columns: Dict[str, list]) -> int:
+    """Insert equally long column lists into ``table`` in chunks; returns the row count."""
+    n = len(next(iter(columns.values()))) if columns else 0
+    if n == 0:
+        return 0
+    # Core inserts bypass the session; flush pending ORM changes first so
+    # statement order is preserved
+    db.flush()
+    if db.get_bind().dialect.name == "postgresql":
+        _copy_rows(db, table, columns, n)
+        return n
+
+    names = list(columns)
+    chunk = settings.BULK_INSERT_CHUNK_ROWS
+    statement = insert(table)
+    for start in range(0, n, chunk):
+        rows = [dict(zip(names, values)) for values in zip(*(columns[c][start:start + chunk] for c in names))]
+        db.execute(statement, rows)
+    return n
+
+
+@dataclass
+class ContentDiff:
+    """What `sync_mix_content` changed; ``full`` means every row was replaced."""
+    inserted: List[str] = field(default_factory=list)
+    updated: List[str] = field(default_factory=list)
+    deleted: List[str] = field(default_factory=list)
+    unchanged: int = 0
+    full: bool = False
+
+    @property
+    def changed(self) -> bool:
+        return self.full or bool(self.inserted or self.updated or self.deleted)
+
+    def summary(self) -> dict:
+        return {"rows_inserted": len(self.inserted), "rows_updated": len(self.updated),
+                "rows_deleted": len(self.deleted), "rows_unchanged": self.unchanged, "full_replace": self.full}
+
+
+def _select_columns(columns: Dict[str, list], rows: List[int]) -> Dict[str, list]:
+    return {name: [values[i] for i in rows] for name, values in columns.items()}
+
+
+class _NotKeyed(Exception):
+    """content_id turned out not to be a unique key of the incoming catalog."""
+
+
+def sync_mix_content(db: Session, mix_id: str, read_chunks: Callable[[], Iterable[pd.DataFrame]]) -> ContentDiff:
+    """Bring the mix's catalog rows in line with the mapped frames from
+    ``read_chunks()`` by diff, one chunk at a time (not committed).
+
+    Rows are matched by `content_id` and compared by `row_hash`: new items
+    are inserted, changed ones updated in place (keeping their row id),
+    missing ones deleted. Falls back to replacing every row when content
+    ids are not unique keys or stored rows predate row hashes; if that is
+    only discovered mid-stream the session is rolled back and
+    ``read_chunks()`` is called again. Memory holds one chunk plus the
+    mix's (content_id, row id, hash) triples.
+    """
+    stored = (db.query(MixContent.id, MixContent.content_id, MixContent.row_hash)
+                .filter(MixContent.mix_id == mix_id)
+                .all())
+    stored_by_cid = {cid: (row_id, h) for row_id, cid, h in stored}
+
+    keyed = (None not in stored_by_cid and len(stored_by_cid) == len(stored)
+             and all(h is not None for _, _, h in stored))
+    if keyed:
+        try:
+            return _sync_by_key(db, mix_id, read_chunks(), stored_by_cid)
+        except _NotKeyed:
+            db.rollback()
+
+    db.query(MixContent).filter(MixContent.mix_id == mix_id).delete(synchronize_session=False)
+    diff = ContentDiff(deleted=[cid for _, cid, _ in stored], full=True)
+    for df in read_chunks():
+        columns = content_columns(df, mix_id)
+        bulk_insert(db, MixContent.__table__, columns)
+        diff.inserted.extend(columns["content_id"])
+    return diff
+
+
+def _sync_by_key(db: Session, mix_id: str, chunks: Iterable[pd.DataFrame], stored_by_cid: dict) -> ContentDiff:
+    table = MixContent.__table__
+    fields = CONTENT_FIELDS + ["row_hash"]
+    # Executemany: keys other than the "_id" bind fill the SET clause
+    update_statement = update(table).where(table.c.id == bindparam("_id"))
+    chunk = settings.BULK_INSERT_CHUNK_ROWS
+
+    diff = ContentDiff()
+    seen = set()
+    db.flush()
+    for df in chunks:
+        columns = content_columns(df, mix_id, new_ids=False)
+        insert_rows, update_rows = [], []
+        for i, (cid, h) in enumerate(zip(columns["content_id"], columns["row_hash"])):
+            if cid is None or cid in seen:
+                raise _NotKeyed()
+            seen.add(cid)
+            match = stored_by_cid.get(cid)
+            if match is None:
+                columns["id"][i] = str(uuid.uuid4())
+                insert_rows.append(i)
+                diff.inserted.append(cid)
+            elif match[1] != h:
+                columns["id"][i] = match[0]
+                update_rows.append(i)
+                diff.updated.append(cid)
+            else:
+                diff.unchanged += 1
+
+        for start in range(0, len(update_rows), chunk):
+            rows = update_rows[start:start + chunk]
+            db.execute(update_statement, [dict({name: columns[name][i] for name in fields}, _id=columns["id"][i])
+                                          for i in rows])
+        bulk_insert(db, table, _select_columns(columns, insert_rows))
+
+    diff.deleted = sorted(set(stored_by_cid) - seen)
+    for start in range(0, len(diff.deleted), chunk):
+        (db.query(MixContent)
+           .filter(MixContent.mix_id == mix_id, MixContent.content_id.in_(diff.deleted[start:start + chunk]))
+           .delete(synchronize_session=False))
+    return diff
+
+
+def delete_embeddings(db: Session, mix_id: str, model_name: str) -> None:
+    """Delete the mix's ``model_name`` embeddings (not committed)."""
+    (db.query(Embedding)
+       .filter(Embedding.mix_id == mix_id, Embedding.model_name == model_name)
+       .delete(synchronize_session=False))
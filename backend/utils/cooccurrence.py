@@ -0,0 +1,166 @@
+"""Item-item co-occurrence from user activity (Level 2/3 collaborative signal).
+
+Two items co-occur when the same user interacted with both in a mix. With B
+the binary users x items matrix of a mix's activity, the count matrix is
+C = BᵀB, so C_ii is the number of users of item i. New events are folded in
+without recounting: if ΔB holds the new (user, item) pairs and B0 the
+earlier pairs of the same users, C grows by ΔBᵀ(B0 + ΔB) + B0ᵀΔB. Counts
+are normalised into a sparse similarity matrix with a zero diagonal, by
+cosine C_ij / sqrt(C_ii C_jj) or Jaccard C_ij / (C_ii + C_jj - C_ij)
+(`COOCCURRENCE_NORMALIZATION`).
+
+The structure is cached in the model cache next to the mix's features, at
+the same content version (re-ingest rebuilds it); rows are catalog rows, so
+one entry serves every featurizer. Counting the whole history on a cache
+miss happens once per entry: concurrent requests wait for that build
+instead of starting their own. At most every
+`COOCCURRENCE_REFRESH_SECONDS` a request folds in the events logged since
+the last refresh, by any process; it re-reads `COOCCURRENCE_OVERLAP_SECONDS`
+of older events so late write-behind flushes aren't missed (a pair that
+was already counted is skipped).
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Hashable, Iterable, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from sqlalchemy.orm import Session
+
+from backend import settings
+from backend.models import UserActivity
+from backend.utils.model_cache import MixFeatures, get_content_version, model_cache
+
+
+def normalize_counts(counts: sp.csr_matrix, method: str) -> sp.csr_matrix:
+    """Co-occurrence counts -> similarity (zero diagonal), by ``cosine`` or ``jaccard``."""
+    users = counts.diagonal()
+    # Works on the CSR arrays directly, so the result keeps the (sorted) layout
+    rows = np.repeat(np.arange(counts.shape[0]), np.diff(counts.indptr))
+    cols, data = counts.indices, counts.data
+    if method == "cosine":
+        values = data / np.sqrt(users[rows] * users[cols])
+    elif method == "jaccard":
+        values = data / (users[rows] + users[cols] - data)
+    else:
+        raise ValueError(f"Unknown co-occurrence normalization: {method}")
+    values[rows == cols] = 0
+    similarity = sp.csr_matrix((values.astype(np.float32), cols.copy(), counts.indptr.copy()), shape=counts.shape)
+    similarity.eliminate_zeros()
+    return similarity
+
+
+class CoOccurrence:
+    """Co-occurrence counts and similarities of one mix's items (catalog rows of ``index``)."""
+
+    def __init__(self, index: Dict[str, int], n_items: int):
+        self.index = index  # content_id -> catalog row, shared with the mix's features
+        self.user_items: Dict[str, set] = {}  # user -> catalog rows counted for them
+        self.counts = sp.csr_matrix((n_items, n_items), dtype=np.float32)
+        self.similarity = sp.csr_matrix((n_items, n_items), dtype=np.float32)
+        self.seen_until: Optional[datetime] = None  # latest event timestamp folded in
+        self.refreshed_at = 0.0  # time.monotonic() of the last refresh
+        self.lock = threading.Lock()
+
+    @property
+    def nbytes(self) -> int:
+        matrices = sum(m.data.nbytes + m.indices.nbytes + m.indptr.nbytes for m in (self.counts, self.similarity))
+        # set entries and dict slots are roughly 60 bytes per counted pair
+        return int(matrices + 60 * sum(len(items) for items in self.user_items.values()))
+
+    def add_events(self, events: Iterable[Tuple[str, Optional[str], datetime]]) -> int:
+        """Fold (user_id, content_id, timestamp) events in, oldest first; returns the new pairs."""
+        new: Dict[str, list] = {}
+        for user_id, content_id, timestamp in events:
+            if self.seen_until is None or timestamp > self.seen_until:
+                self.seen_until = timestamp
+            item = self.index.get(str(content_id)) if content_id is not None else None
+            if item is None:
+                continue
+            items = self.user_items.setdefault(user_id, set())
+            if item in items or len(items) >= settings.COOCCURRENCE_MAX_ITEMS_PER_USER:
+                continue
+            items.add(item)
+            new.setdefault(user_id, []).append(item)
+        if not new:
+            return 0
+
+        n_items = self.counts.shape[0]
+        new_rows, new_items, old_rows, old_items = [], [], [], []
+        for row, (user_id, items_added) in enumerate(new.items()):
+            items_before = self.user_items[user_id].difference(items_added)
+            new_rows.extend([row] * len(items_added))
+            new_items.extend(items_added)
+            old_rows.extend([row] * len(items_before))
+            old_items.extend(items_before)
+        shape = (len(new), n_items)
+        added = sp.csr_matrix((np.ones(len(new_rows), dtype=np.float32), (new_rows, new_items)), shape=shape)
+        earlier = sp.csr_matrix((np.ones(len(old_rows), dtype=np.float32), (old_rows, old_items)), shape=shape)
+        delta = added.T @ (earlier + added) + earlier.T @ added
+        self.counts = (self.counts + delta).tocsr()
+        self.similarity = normalize_counts(self.counts, settings.COOCCURRENCE_NORMALIZATION)
+        return len(new_rows)
+
+    def refresh(self, db: Session, mix_id: str) -> int:
+        """Fold in the mix's events since the last refresh (all of them the first time)."""
+        query = (db.query(UserActivity.user_id, UserActivity.content_id, UserActivity.timestamp)
+                   .filter(UserActivity.mix_id == mix_id))
+        if self.seen_until is not None:
+            since = self.seen_until - timedelta(seconds=settings.COOCCURRENCE_OVERLAP_SECONDS)
+            query = query.filter(UserActivity.timestamp >= since)
+        added = self.add_events(query.order_by(UserActivity.timestamp.asc()))
+        self.refreshed_at = time.monotonic()
+        return added
+
+    def scores(self, items: np.ndarray, candidates: np.ndarray) -> np.ndarray:
+        """Mean similarity of each candidate row to the ``items`` rows (a user's watched items)."""
+        if not len(items) or not len(candidates):
+            return np.zeros(len(candidates), dtype=np.float32)
+        watched = np.zeros(self.similarity.shape[1], dtype=np.float32)
+        watched[items] = 1.0
+        return np.asarray(self.similarity[candidates] @ watched, dtype=np.float32).ravel() / len(items)
+
+
+# Locks of the co-occurrence entries being built, by cache key
+_build_locks: Dict[Hashable, threading.Lock] = {}
+_build_locks_guard = threading.Lock()
+
+
+def get_cooccurrence(db: Session, mix_id: str, features: MixFeatures) -> CoOccurrence:
+    """The mix's co-occurrence (rows aligned with ``features``), built or refreshed as needed."""
+    key = (mix_id, "cooccurrence", get_content_version(db, mix_id))
+    cooccurrence = model_cache.get(key)
+    if cooccurrence is None:
+        return _build(db, mix_id, features, key)
+    if time.monotonic() - cooccurrence.refreshed_at < settings.COOCCURRENCE_REFRESH_SECONDS:
+        return cooccurrence
+    # Concurrent requests share the entry; while one refreshes it the others
+    # use it as it is
+    if cooccurrence.lock.acquire(blocking=False):
+        try:
+            if cooccurrence.refresh(db, mix_id) or model_cache.peek(key) is not cooccurrence:
+                # (Re-)cache with its current size
+                model_cache.put(key, cooccurrence, cooccurrence.nbytes)
+        finally:
+            cooccurrence.lock.release()
+    return cooccurrence
+
+
+def _build(db: Session, mix_id: str, features: MixFeatures, key: Hashable) -> CoOccurrence:
+    """Count the mix's whole history into a new cache entry; callers that miss
+    the same key meanwhile wait for it and get the same entry."""
+    with _build_locks_guard:
+        lock = _build_locks.setdefault(key, threading.Lock())
+    try:
+        with lock:
+            cooccurrence = model_cache.peek(key)
+            if cooccurrence is None:
+                cooccurrence = CoOccurrence(features.index, len(features.df))
+                cooccurrence.refresh(db, mix_id)
+                model_cache.put(key, cooccurrence, cooccurrence.nbytes)
+            return cooccurrence
+    finally:
+        with _build_locks_guard:
+            if _build_locks.get(key) is lock:
+                del _build_locks[key]
@@ -0,0 +1,164 @@
+"""Persisted item embeddings.
+
+Vectors live in the `embeddings` table, one row per (mix, content_id,
+model_name), stored as `.npy` bytes alongside a hash of the text they were
+computed from. Level 3 sentence-transformer embeddings are encoded at ingest
+(after `map-fields`) and only re-encoded for items whose text changed.
+Ingest-time TF-IDF vectors are sparse and stored as (index, value) pairs.
+"""
+import hashlib
+import logging
+from io import BytesIO
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sqlalchemy.orm import Session
+
+from backend.models import Embedding
+from backend.utils.executors import run_cpu_bound
+from backend.utils.log import log_event
+
+TFIDF_MODEL_NAME = "tfidf"
+SENTENCE_MODEL_NAME = "all-MiniLM-L6-v2"
+
+# Initialize sentence transformer for Level 3 (lazy load on first use)
+_sentence_transformer_model = None
+
+
+def get_sentence_transformer():
+    """Lazy load the sentence transformer model on first use"""
+    global _sentence_transformer_model
+    if _sentence_transformer_model is None:
+        try:
+            from sentence_transformers import SentenceTransformer
+            log_event("sentence_model_loading", level=logging.INFO, model=SENTENCE_MODEL_NAME)
+            _sentence_transformer_model = SentenceTransformer(SENTENCE_MODEL_NAME)
+            log_event("sentence_model_loaded", level=logging.INFO, model=SENTENCE_MODEL_NAME)
+        except Exception as e:
+            log_event("sentence_model_failed", level=logging.ERROR, error=str(e))
+            raise
+    return _sentence_transformer_model
+
+
+def encode_texts(texts) -> np.ndarray:
+    """Encode texts with the Level 3 model as a float32 matrix."""
+    model = get_sentence_transformer()
+    return np.asarray(model.encode(list(texts), show_progress_bar=False), dtype=np.float32)
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1((text or "").encode("utf-8")).hexdigest()
+
+
+def vector_to_bytes(vec: np.ndarray) -> bytes:
+    buf = BytesIO()
+    np.save(buf, np.asarray(vec), allow_pickle=False)
+    return buf.getvalue()
+
+
+def vector_from_bytes(blob: bytes) -> np.ndarray:
+    return np.load(BytesIO(blob), allow_pickle=False)
+
+
+# Sparse vectors (ingest-time TF-IDF) are stored as (index, value) records
+SPARSE_VECTOR_DTYPE = np.dtype([("index", "<i4"), ("value", "<f4")])
+
+
+def sparse_rows_to_bytes(matrix) -> List[bytes]:
+    """Serialise each CSR row as `.npy` bytes of its non-zero (index, value) pairs."""
+    blobs = []
+    for start, end in zip(matrix.indptr[:-1], matrix.indptr[1:]):
+        pairs = np.empty(end - start, dtype=SPARSE_VECTOR_DTYPE)
+        pairs["index"] = matrix.indices[start:end]
+        pairs["value"] = matrix.data[start:end]
+        blobs.append(vector_to_bytes(pairs))
+    return blobs
+
+
+def sparse_vector_from_bytes(blob: bytes, n_features: int) -> sparse.csr_matrix:
+    pairs = vector_from_bytes(blob)
+    return sparse.csr_matrix((pairs["value"], pairs["index"], [0, len(pairs)]), shape=(1, n_features))
+
+
+def _stored_sentence_embeddings(db: Session, mix_id: str) -> Dict[str, Embedding]:
+    return {emb.content_id: emb for emb in
+            db.query(Embedding)
+              .filter(Embedding.mix_id == mix_id, Embedding.model_name == SENTENCE_MODEL_NAME)}
+
+
+def _sentence_matrix(mix_id: str, df: pd.DataFrame, stored: Dict[str, Embedding]
+                     ) -> Tuple[np.ndarray, List[int], List[str]]:
+    """(embedding matrix of ``df``, rows that had to be encoded, text hashes).
+
+    Stored vectors whose text hash still matches are reused; every other row
+    is encoded in a single batch.
+    """
+    content_ids = [str(c) for c in df["content_id"].tolist()]
+    hashes = [text_hash(t) for t in df["text"].tolist()]
+
+    reuse = {}
+    stale_rows = []
+    for row, (cid, h) in enumerate(zip(content_ids, hashes)):
+        emb = stored.get(cid)
+        if emb is not None and emb.text_hash == h:
+            reuse[row] = emb.vector
+        else:
+            stale_rows.append(row)
+
+    fresh = run_cpu_bound(encode_texts, df["text"].iloc[stale_rows].tolist()) if stale_rows else None
+    dim = fresh.shape[1] if fresh is not None else vector_from_bytes(next(iter(reuse.values()))).shape[0]
+    matrix = np.empty((len(content_ids), dim), dtype=np.float32)
+    for row, blob in reuse.items():
+        matrix[row] = vector_from_bytes(blob)
+    if stale_rows:
+        log_event("encode_embeddings", mix_id=mix_id, stale=len(stale_rows), total=len(content_ids))
+        matrix[stale_rows] = fresh
+    return matrix, stale_rows, hashes
+
+
+def sync_sentence_embeddings(db: Session, mix_id: str, df: pd.DataFrame) -> np.ndarray:
+    """Bring the mix's stored sentence embeddings up to date (ingest) and return them.
+
+    `df` must have `content_id` and `text` columns; row i of the result is
+    the embedding of `df.iloc[i]`. Only items that are missing or whose text
+    changed are encoded; rows for items no longer in the catalog are deleted.
+    """
+    content_ids = [str(c) for c in df["content_id"].tolist()]
+    stored = _stored_sentence_embeddings(db, mix_id)
+    matrix, stale_rows, hashes = _sentence_matrix(mix_id, df, stored)
+
+    for row in stale_rows:
+        cid = content_ids[row]
+        emb = stored.get(cid)
+        if emb is None:
+            emb = Embedding(mix_id=mix_id, content_id=cid, model_name=SENTENCE_MODEL_NAME)
+            db.add(emb)
+            stored[cid] = emb
+        emb.vector = vector_to_bytes(matrix[row])
+        emb.text_hash = hashes[row]
+
+    removed = set(stored) - set(content_ids)
+    if removed:
+        (db.query(Embedding)
+           .filter(Embedding.mix_id == mix_id,
+                   Embedding.model_name == SENTENCE_MODEL_NAME,
+                   Embedding.content_id.in_(removed))
+           .delete(synchronize_session=False))
+
+    if stale_rows or removed:
+        db.commit()
+    return matrix
+
+
+def load_sentence_embeddings(db: Session, mix_id: str, df: pd.DataFrame) -> np.ndarray:
+    """The mix's sentence embeddings for serving, without writing anything.
+
+    Items whose stored vector is missing or stale (ingest hasn't caught up)
+    are encoded in memory only; persisting them is left to ingest.
+    """
+    matrix, stale_rows, _ = _sentence_matrix(mix_id, df, _stored_sentence_embeddings(db, mix_id))
+    if stale_rows:
+        log_event("sentence_embeddings_stale", level=logging.WARNING, mix_id=mix_id, stale=len(stale_rows))
+    return matrix
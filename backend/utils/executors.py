@@ -0,0 +1,75 @@
+"""Executors that keep blocking work off the asyncio event loop.
+
+- `run_blocking` (await it from an `async def` endpoint) runs a synchronous
+  function - typically the whole body of a heavy endpoint with its DB
+  queries - on a dedicated thread pool.
+- `run_cpu_bound` (call it from code already running in that pool) ships a
+  picklable top-level function to a process pool, for featurization and
+  embedding work that would otherwise hold the GIL.
+
+Pool sizes come from `DB_POOL_WORKERS` / `CPU_POOL_WORKERS`. With
+`CPU_POOL_WORKERS=0` CPU-bound work runs inline in the calling thread.
+Cheap endpoints declared with plain `def` keep using FastAPI's own thread
+pool, so they stay responsive while heavy scoring runs here.
+"""
+import asyncio
+import functools
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+from backend import settings
+
+_lock = threading.Lock()
+_blocking_pool: Optional[ThreadPoolExecutor] = None
+_cpu_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_blocking_pool() -> ThreadPoolExecutor:
+    global _blocking_pool
+    with _lock:
+        if _blocking_pool is None:
+            _blocking_pool = ThreadPoolExecutor(max_workers=settings.DB_POOL_WORKERS, thread_name_prefix="rec-db")
+        return _blocking_pool
+
+
+def get_cpu_pool() -> Optional[ProcessPoolExecutor]:
+    global _cpu_pool
+    if settings.CPU_POOL_WORKERS <= 0:
+        return None
+    with _lock:
+        if _cpu_pool is None:
+            # "spawn" avoids forking a process that already runs threads
+            _cpu_pool = ProcessPoolExecutor(max_workers=settings.CPU_POOL_WORKERS,
+                                            mp_context=multiprocessing.get_context("spawn"))
+        return _cpu_pool
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """Run a blocking function on the DB/IO thread pool and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_blocking_pool(), functools.partial(fn, *args, **kwargs))
+
+
+def run_cpu_bound(fn, *args, **kwargs):
+    """Run a picklable function in the process pool and wait for it.
+
+    Meant to be called from a worker thread (never directly on the event
+    loop); falls back to running inline when the process pool is disabled.
+    """
+    pool = get_cpu_pool()
+    if pool is None:
+        return fn(*args, **kwargs)
+    return pool.submit(fn, *args, **kwargs).result()
+
+
+def shutdown_executors() -> None:
+    global _blocking_pool, _cpu_pool
+    with _lock:
+        if _blocking_pool is not None:
+            _blocking_pool.shutdown(wait=True)
+            _blocking_pool = None
+        if _cpu_pool is not None:
+            _cpu_pool.shutdown(wait=True)
+            _cpu_pool = None
@@ -0,0 +1,275 @@
+"""Load a mix's catalog and turn it into a feature matrix for similarity.
+
+`get_mix_features` is the entry point used by the recommendation endpoints;
+it consults the process-wide `model_cache` before doing any DB or model work.
+`HashingTfidf` is the chunk-at-a-time TF-IDF used for the vectors persisted
+at ingest.
+"""
+import json
+import os
+from typing import Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+from fastapi import HTTPException
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+from sklearn.preprocessing import normalize
+from sqlalchemy.orm import Session
+
+from backend import settings
+from backend.models import FieldMapping, MixContent
+from backend.paths import mix_ann_path, mix_csv_path, mix_mapping_path, mix_snapshot_path
+from backend.utils.ann import IVFIndex, build_ann_index, read_ann_index, write_ann_index
+from backend.utils.catalog_snapshot import read_snapshot, write_snapshot
+from backend.utils.embeddings import load_sentence_embeddings
+from backend.utils.executors import run_cpu_bound
+from backend.utils.log import log_event
+from backend.utils.metrics import mark_cache, stage
+from backend.utils.model_cache import MixFeatures, estimate_nbytes, get_content_version, model_cache
+from backend.utils.parse_csv import read_mapped_csv
+from backend.utils.scoring import l2_normalize
+from backend.utils.tag_index import build_tag_index
+
+CONTENT_COLUMNS = ["content_id", "title", "description", "tags"]
+
+def load_mix_frame(db: Session, mix_id: str) -> pd.DataFrame:
+    """Return the mix's catalog as a DataFrame.
+
+    Prefer canonical data from the DB (MixContent). This makes the DB the
+    single source of truth for recommendations; the columnar snapshot
+    written at ingest is used instead while it matches the mix's content
+    version. If the DB has no rows for the mix, fall back to CSV + mapping
+    on disk (legacy behavior).
+
+    Rows come in `MixContent.id` order (as `iter_mix_frames`), so the
+    snapshot and the DB give the same catalog rows: taste profiles and
+    co-occurrence store row numbers.
+    """
+    snapshot = read_snapshot(mix_snapshot_path(mix_id))
+    if snapshot is not None and snapshot[1] == get_content_version(db, mix_id):
+        return snapshot[0]
+
+    fields = [getattr(MixContent, c) for c in CONTENT_COLUMNS]
+    rows = db.query(*fields).filter(MixContent.mix_id == mix_id).order_by(MixContent.id).all()
+    if rows:
+        return pd.DataFrame([tuple(r) for r in rows], columns=CONTENT_COLUMNS)
+
+    csv_path = mix_csv_path(mix_id)
+    mapping_path = mix_mapping_path(mix_id)
+
+    # Try CSV + mapping on disk (legacy flow)
+    # Prefer mapping stored in DB (if migrated), otherwise fall back to file
+    mapping = None
+    try:
+        fm = db.query(FieldMapping).filter(FieldMapping.mix_id == mix_id).one_or_none()
+        if fm:
+            mapping = fm.mappings
+    except Exception:
+        mapping = None
+
+    if mapping is None and mapping_path.exists():
+        try:
+            with open(mapping_path) as f:
+                mapping = json.load(f)["mappings"]
+        except Exception as e:
+            raise HTTPException(400, detail=f"Invalid mapping JSON: {e}")
+
+    if mapping is None or not csv_path.exists():
+        # No DB rows and no csv/mapping -> not found
+        raise HTTPException(404, detail=f"Mix data or mapping not found. csv={csv_path}, mapping={mapping_path}")
+
+    return read_mapped_csv(csv_path, mapping)
+
+
+def rebuild_catalog_snapshot(db: Session, mix_id: str) -> int:
+    """Write the mix's columnar catalog snapshot after its content changed (ingest)."""
+    df = prepare_frame(load_mix_frame(db, mix_id))
+    write_snapshot(mix_snapshot_path(mix_id), df, get_content_version(db, mix_id))
+    return len(df)
+
+
+def iter_mix_frames(db: Session, mix_id: str, columns: List[str], chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """Yield the mix's `MixContent` rows ``chunk_rows`` at a time (keyset-paged by row id)."""
+    fields = [getattr(MixContent, c) for c in columns]
+    last_id = None
+    while True:
+        query = db.query(MixContent.id, *fields).filter(MixContent.mix_id == mix_id)
+        if last_id is not None:
+            query = query.filter(MixContent.id > last_id)
+        rows = query.order_by(MixContent.id).limit(chunk_rows).all()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield pd.DataFrame([row[1:] for row in rows], columns=columns)
+
+
+def build_text(df: pd.DataFrame) -> pd.Series:
+    """Build the text field for similarity - title, description AND tags/genre.
+
+    Tags are repeated 3x to give genre more weight, which also helps the LLM
+    embeddings understand genre relationships.
+    """
+    title = df["title"] if "title" in df.columns else pd.Series([""] * len(df), index=df.index)
+    desc = df["description"] if "description" in df.columns else pd.Series([""] * len(df), index=df.index)
+    tags = df["tags"] if "tags" in df.columns else pd.Series([""] * len(df), index=df.index)
+
+    tags_weighted = tags.fillna("").astype(str).apply(lambda x: f"{x} {x} {x}" if x else "")
+    return title.fillna("").astype(str) + " " + desc.fillna("").astype(str) + " " + tags_weighted
+
+
+def split_tags(value) -> list:
+    """Split a comma-separated tag string into stripped, non-empty tags."""
+    if not isinstance(value, str) or not value:
+        return []
+    return [t.strip() for t in value.split(",") if t.strip()]
+
+
+def featurizer_for_level(quality_level: int) -> str:
+    """Level 3 uses semantic embeddings; Levels 1 & 2 use TF-IDF."""
+    return "sentence" if quality_level == 3 else "tfidf"
+
+
+def fit_tfidf(texts):
+    """Fit TF-IDF on the texts (top-level so it can run in the process pool)."""
+    return TfidfVectorizer().fit_transform(texts)
+
+
+def hash_counts(texts, n_features: int):
+    """Term counts hashed into ``n_features`` columns (top-level so it can run in the process pool)."""
+    vectorizer = HashingVectorizer(n_features=n_features, alternate_sign=False, norm=None)
+    return vectorizer.transform(texts)
+
+
+class HashingTfidf:
+    """TF-IDF over hashed terms that is fit a chunk at a time.
+
+    Same tokenisation, smoothed idf and L2 norm as `TfidfVectorizer`'s
+    defaults, so vectors match it up to hash collisions - but only document
+    frequencies are kept, not a vocabulary.
+    """
+
+    def __init__(self, n_features: int = None):
+        self.n_features = n_features or settings.HASHING_TFIDF_FEATURES
+        self.doc_freq = np.zeros(self.n_features, dtype=np.int64)
+        self.n_docs = 0
+
+    def partial_fit(self, texts) -> "HashingTfidf":
+        counts = run_cpu_bound(hash_counts, list(texts), self.n_features)
+        self.doc_freq += np.bincount(counts.indices, minlength=self.n_features)
+        self.n_docs += counts.shape[0]
+        return self
+
+    def transform(self, texts):
+        """Rows of L2-normalised TF-IDF as float32 CSR."""
+        counts = run_cpu_bound(hash_counts, list(texts), self.n_features)
+        idf = np.log((1 + self.n_docs) / (1 + self.doc_freq)) + 1
+        return normalize(counts.multiply(idf).tocsr()).astype(np.float32)
+
+
+def prepare_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Validate a mapped catalog frame and add the `text` column."""
+    if "content_id" not in df.columns:
+        raise HTTPException(400, detail="Mapped column 'content_id' is required but missing after rename.")
+
+    df = df.reset_index(drop=True)
+    if "text" not in df.columns:
+        df["text"] = build_text(df)
+
+    if df.empty:
+        raise HTTPException(400, detail="No content available")
+    if (df["text"].str.strip() == "").all():
+        raise HTTPException(400, detail="All text rows are empty after mapping.")
+    return df
+
+
+def build_features(df: pd.DataFrame, matrix, ann: Optional[IVFIndex] = None) -> MixFeatures:
+    """Wrap a prepared frame and its (unnormalised) feature matrix."""
+    # Rows are L2-normalised so cosine similarity is a plain dot product
+    matrix = l2_normalize(matrix)
+
+    index = {}
+    for row, cid in enumerate(df["content_id"].tolist()):
+        index.setdefault(str(cid), row)
+
+    cols = [c for c in CONTENT_COLUMNS if c in df.columns]
+    tags = [split_tags(t) for t in df["tags"]] if "tags" in df.columns else [[] for _ in range(len(df))]
+    tag_index = build_tag_index(df["content_id"].tolist(), tags)
+    return MixFeatures(df=df[cols], matrix=matrix, index=index, tag_index=tag_index, ann=ann)
+
+
+def get_mix_features(db: Session, mix_id: str, quality_level: int) -> MixFeatures:
+    """Return cached features for the mix, featurizing on a cache miss.
+
+    Level 3 reads the sentence embeddings persisted at ingest (items that are
+    missing or whose text changed are encoded but not stored); TF-IDF is
+    refit here.
+    """
+    return get_features(db, mix_id, featurizer_for_level(quality_level))
+
+
+def cached_features(db: Session, mix_id: str, featurizer: str) -> Optional[MixFeatures]:
+    """The mix's features if this process already has them cached, else None (never featurizes)."""
+    return model_cache.get((mix_id, featurizer, get_content_version(db, mix_id)))
+
+
+def get_features(db: Session, mix_id: str, featurizer: str) -> MixFeatures:
+    """`get_mix_features` by featurizer name ("tfidf" or "sentence")."""
+    key = (mix_id, featurizer, get_content_version(db, mix_id))
+
+    features = model_cache.get(key)
+    if features is not None:
+        mark_cache("hit")
+        return features
+    mark_cache("miss")
+
+    with stage("load"):
+        df = prepare_frame(load_mix_frame(db, mix_id))
+    log_event("featurize", mix_id=mix_id, featurizer=featurizer, n_items=len(df))
+    with stage("featurize"):
+        if featurizer == "sentence":
+            matrix = load_sentence_embeddings(db, mix_id, df)
+        else:
+            matrix = run_cpu_bound(fit_tfidf, df["text"].tolist())
+
+        # Large mixes are served through the IVF index built at ingest
+        ann = load_ann_index(mix_id, featurizer, key[2], df, matrix) if len(df) >= settings.ANN_MIN_ITEMS else None
+        features = build_features(df, matrix, ann)
+    model_cache.put(key, features, features.nbytes)
+    return features
+
+
+def load_ann_index(mix_id: str, featurizer: str, version: int, df: pd.DataFrame, matrix) -> Optional[IVFIndex]:
+    """The IVF index stored at ingest, if it covers exactly these items and features.
+
+    Without one the mix is scored exactly until the next ingest builds it.
+    """
+    stored = read_ann_index(mix_ann_path(mix_id, featurizer))
+    if stored is not None:
+        ann, content_ids, stored_version = stored
+        if (stored_version == version and content_ids.tolist() == [str(c) for c in df["content_id"].tolist()]
+                and ann.n_features in (None, matrix.shape[1])):
+            return ann
+    log_event("ann_index_missing", mix_id=mix_id, featurizer=featurizer, version=version)
+    return None
+
+
+def rebuild_ann_index(db: Session, mix_id: str, featurizer: str) -> int:
+    """Build and store the mix's IVF index after its content changed (ingest).
+
+    Returns the number of items indexed; mixes below ``ANN_MIN_ITEMS`` get
+    no index (and lose a stored one).
+    """
+    path = mix_ann_path(mix_id, featurizer)
+    features = get_features(db, mix_id, featurizer)
+    if len(features.df) < settings.ANN_MIN_ITEMS:
+        if os.path.exists(path):
+            os.remove(path)
+        return 0
+    version = get_content_version(db, mix_id)
+    ann = run_cpu_bound(build_ann_index, features.matrix)
+    write_ann_index(path, ann, [str(c) for c in features.df["content_id"].tolist()], version)
+    # The features were just cached without it; serve this process through it too
+    features.ann = ann
+    features.nbytes = estimate_nbytes(features)
+    model_cache.put((mix_id, featurizer, version), features, features.nbytes)
+    return len(features.df)
@@ -0,0 +1,302 @@
+"""Local background job runner for ingest and embedding builds.
+
+`submit_job` records a row in `ingest_jobs` and runs `fn(*args, db)` on a
+small thread pool with its own session, so map / rebuild requests return a
+job id immediately. Inside a job, `job_stage("name")` times a stage and
+`job_progress(done, total)` reports progress; both are no-ops outside a job,
+like `metrics.stage`. `record_stages()` collects stage timings outside a job
+(e.g. in a worker process doing part of one).
+
+Live stage / progress state is kept in memory and merged into `job_status`;
+the row itself is only written when the job starts and finishes, so the
+runner never competes with the job's own transaction for the DB.
+Jobs for the same mix run one at a time (`mix_lock`). With `JOB_WORKERS=0`
+jobs run inline in the submitting thread.
+
+Each job row records its owner (host, pid and a per-process boot id), and
+the owner's heartbeat thread renews `heartbeat_at` on its queued / running
+rows every `JOB_HEARTBEAT_SECONDS`. `fail_interrupted_jobs` fails only
+rows whose owner is gone: a previous incarnation of this process (same
+host and pid, or a dead pid on this host) or any owner whose lease
+(`JOB_LEASE_SECONDS`) ran out. Sibling workers' jobs are left alone.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+
+from backend import settings
+from backend.database import SessionLocal
+from backend.models import IngestJob
+from backend.utils.log import log_event
+
+# Sessions for job bodies (tests point this at their own engine)
+session_factory = SessionLocal
+
+_lock = threading.Lock()
+_pool: Optional[ThreadPoolExecutor] = None
+_mix_locks: Dict[Optional[str], threading.Lock] = {}
+_live: Dict[str, "JobContext"] = {}
+_owner_lock = threading.Lock()
+_owner: Optional[Tuple[int, str]] = None  # (pid, owner id) of this process
+_heartbeat: Optional[threading.Thread] = None
+_stop_heartbeat = threading.Event()
+
+ACTIVE_STATUSES = ["queued", "running"]
+
+
+class JobContext:
+    """In-memory state of a running job: finished stages, current stage, progress."""
+
+    def __init__(self, job_id: Optional[str]):
+        self.job_id = job_id
+        self.stages: List[dict] = []
+        self.current: Optional[str] = None
+        self.current_started = 0.0
+        self.progress: Optional[dict] = None
+
+    @contextmanager
+    def stage(self, name: str):
+        self.current, self.current_started = name, time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append({"name": name, "seconds": round(time.perf_counter() - self.current_started, 4)})
+            self.current = None
+
+
+_current_job: ContextVar = ContextVar("ingest_job", default=None)
+
+
+def job_stage(name: str):
+    """Time a stage of the current job (no-op outside a job)."""
+    job = _current_job.get()
+    return job.stage(name) if job is not None else nullcontext()
+
+
+def job_progress(done: int, total: int, **details) -> None:
+    """Report progress of the current job (no-op outside a job)."""
+    job = _current_job.get()
+    if job is not None:
+        job.progress = {"done": done, "total": total, **details}
+
+
+@contextmanager
+def record_stages():
+    """Collect the `job_stage` timings of the enclosed block into a list."""
+    ctx = JobContext(None)
+    token = _current_job.set(ctx)
+    try:
+        yield ctx.stages
+    finally:
+        _current_job.reset(token)
+
+
+def get_job_pool() -> Optional[ThreadPoolExecutor]:
+    global _pool
+    if settings.JOB_WORKERS <= 0:
+        return None
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=settings.JOB_WORKERS, thread_name_prefix="ingest-job")
+        return _pool
+
+
+def mix_lock(mix_id: Optional[str]) -> threading.Lock:
+    """Held while a job (or a rebuild-all step) writes the mix, in this process."""
+    with _lock:
+        return _mix_locks.setdefault(mix_id, threading.Lock())
+
+
+def job_owner() -> str:
+    """``host:pid:boot id`` of this process, recorded on the jobs it submits."""
+    global _owner
+    pid = os.getpid()
+    with _owner_lock:
+        # Derived again in a forked child
+        if _owner is None or _owner[0] != pid:
+            _owner = (pid, f"{socket.gethostname()}:{pid}:{uuid.uuid4().hex[:8]}")
+        return _owner[1]
+
+
+def submit_job(db: Session, kind: str, mix_id: Optional[str], fn, *args) -> IngestJob:
+    """Record a queued job and run `fn(*args, db)` in the background."""
+    job = IngestJob(kind=kind, mix_id=mix_id, status="queued", owner=job_owner(), heartbeat_at=time.time())
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+
+    pool = get_job_pool()
+    if pool is None:
+        _run(job.id, mix_id, fn, args)
+        db.refresh(job)
+    else:
+        pool.submit(_run, job.id, mix_id, fn, args)
+    return job
+
+
+def _run(job_id: str, mix_id: Optional[str], fn, args: tuple) -> None:
+    ctx = JobContext(job_id)
+    token = _current_job.set(ctx)
+    db = session_factory()
+    try:
+        with mix_lock(mix_id):
+            _live[job_id] = ctx
+            _update(db, job_id, status="running", started_at=func.now())
+            started = time.perf_counter()
+            result, error = None, None
+            try:
+                result = fn(*args, db)
+            except HTTPException as e:
+                error = str(e.detail)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            if error is not None:
+                db.rollback()
+                log_event("job_failed", level=logging.WARNING, job_id=job_id, mix_id=mix_id, error=error)
+            _update(db, job_id,
+                    status="failed" if error is not None else "succeeded",
+                    stages=ctx.stages, result=result, error=error,
+                    finished_at=func.now(), duration_seconds=round(time.perf_counter() - started, 4))
+    except Exception as e:
+        log_event("job_update_failed", level=logging.ERROR, job_id=job_id, error=str(e))
+    finally:
+        _live.pop(job_id, None)
+        _current_job.reset(token)
+        db.close()
+
+
+def _update(db: Session, job_id: str, **values) -> None:
+    db.query(IngestJob).filter(IngestJob.id == job_id).update(values, synchronize_session=False)
+    db.commit()
+
+
+def job_status(db: Session, job_id: str) -> Optional[dict]:
+    """The job's row as a dict, with live stage / progress while it runs."""
+    job = db.query(IngestJob).filter(IngestJob.id == job_id).one_or_none()
+    if job is None:
+        return None
+    status = {
+        "job_id": job.id,
+        "mix_id": job.mix_id,
+        "kind": job.kind,
+        "status": job.status,
+        "stage": None,
+        "progress": None,
+        "stages": job.stages or [],
+        "duration_seconds": job.duration_seconds,
+        "result": job.result,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+    ctx = _live.get(job_id)
+    if ctx is not None and job.status == "running":
+        status["stages"] = list(ctx.stages)
+        status["progress"] = ctx.progress
+        if ctx.current is not None:
+            status["stage"] = {"name": ctx.current,
+                               "seconds": round(time.perf_counter() - ctx.current_started, 4)}
+    return status
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # exists, owned by someone else
+    return True
+
+
+def _owner_gone(owner: Optional[str]) -> bool:
+    """Whether ``owner`` is known to have stopped (only decidable on its own host)."""
+    if owner is None:
+        return True  # recorded before jobs had owners
+    me = job_owner()
+    host, pid, _ = owner.rsplit(":", 2)
+    if owner == me or host != me.rsplit(":", 2)[0]:
+        return False
+    # Same host and pid as this process is this process's previous incarnation
+    return int(pid) == os.getpid() or not _pid_alive(int(pid))
+
+
+def fail_interrupted_jobs(db: Session) -> int:
+    """Mark queued / running jobs whose owning process is gone as failed.
+
+    Run at startup and by the heartbeat thread; jobs of live sibling
+    processes keep running.
+    """
+    lease_expired = time.time() - settings.JOB_LEASE_SECONDS
+    rows = db.query(IngestJob.id, IngestJob.owner, IngestJob.heartbeat_at).filter(
+        IngestJob.status.in_(ACTIVE_STATUSES))
+    stale = [job_id for job_id, owner, heartbeat_at in rows
+             if _owner_gone(owner) or heartbeat_at is None or heartbeat_at < lease_expired]
+    if not stale:
+        return 0
+    count = (db.query(IngestJob)
+               .filter(IngestJob.id.in_(stale), IngestJob.status.in_(ACTIVE_STATUSES))
+               .update({"status": "failed", "error": "Interrupted: the process running it stopped",
+                        "finished_at": func.now()},
+                       synchronize_session=False))
+    db.commit()
+    if count:
+        log_event("jobs_interrupted", level=logging.WARNING, count=count)
+    return count
+
+
+def renew_job_leases(db: Session) -> int:
+    """Bump `heartbeat_at` on this process's queued / running jobs."""
+    count = (db.query(IngestJob)
+               .filter(IngestJob.owner == job_owner(), IngestJob.status.in_(ACTIVE_STATUSES))
+               .update({"heartbeat_at": time.time()}, synchronize_session=False))
+    db.commit()
+    return count
+
+
+def _heartbeat_loop() -> None:
+    while not _stop_heartbeat.wait(settings.JOB_HEARTBEAT_SECONDS):
+        db = session_factory()
+        try:
+            renew_job_leases(db)
+            fail_interrupted_jobs(db)
+        except Exception as e:
+            db.rollback()
+            log_event("job_heartbeat_failed", level=logging.WARNING, error=str(e))
+        finally:
+            db.close()
+
+
+def start_job_heartbeat() -> None:
+    """Start renewing this process's job leases (once per process)."""
+    global _heartbeat
+    with _lock:
+        if _heartbeat is None:
+            _stop_heartbeat.clear()
+            _heartbeat = threading.Thread(target=_heartbeat_loop, name="job-heartbeat", daemon=True)
+            _heartbeat.start()
+
+
+def shutdown_jobs() -> None:
+    """Let running jobs finish; queued ones are dropped (and failed once their lease runs out)."""
+    global _pool, _heartbeat
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+        heartbeat, _heartbeat = _heartbeat, None
+    if heartbeat is not None:
+        _stop_heartbeat.set()
+        heartbeat.join()
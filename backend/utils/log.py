@@ -0,0 +1,30 @@
+"""Structured, level-gated and sampled logging for hot paths.
+
+`log_event("name", key=value, ...)` emits one JSON line on the
+`recengine` logger. Nothing is formatted unless the logger is enabled for
+the level, and DEBUG events are additionally sampled at `LOG_SAMPLE_RATE`
+so per-request diagnostics can stay on in production without flooding it.
+"""
+import json
+import logging
+import random
+
+from backend import settings
+
+logger = logging.getLogger("recengine")
+logger.setLevel(settings.LOG_LEVEL)
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+    logger.addHandler(_handler)
+    logger.propagate = False
+
+
+def log_event(event: str, level: int = logging.DEBUG, sample_rate: float = None, **fields) -> None:
+    if not logger.isEnabledFor(level):
+        return
+    if sample_rate is None:
+        sample_rate = settings.LOG_SAMPLE_RATE if level <= logging.DEBUG else 1.0
+    if sample_rate < 1.0 and random.random() >= sample_rate:
+        return
+    logger.log(level, json.dumps({"event": event, **fields}, default=str))
@@ -0,0 +1,167 @@
+"""In-process latency metrics for the recommendation pipeline.
+
+Each recommendation request runs inside `request_timer`, which collects the
+time spent per stage (DB load, featurization, similarity, hybrid scoring,
+business rules, ...) and, when the request finishes, records every stage in
+the `recommendation_stage_seconds` histogram labelled by mix, quality level
+and whether the featurized mix came from the model cache. Code deeper in the
+pipeline marks its stages with `stage("name")`, which is a no-op outside a
+request. `render_metrics` returns everything in Prometheus text format.
+"""
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(pairs: Sequence[Tuple[str, str]]) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """Monotonic counter with labels."""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(list(zip(self.label_names, key)))} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels."""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                pairs = list(zip(self.label_names, key))
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{_format_labels(pairs + [('le', _format_value(bound))])} {_format_value(count)}")
+                lines.append(f"{self.name}_bucket{_format_labels(pairs + [('le', '+Inf')])} {_format_value(series[-2])}")
+                lines.append(f"{self.name}_sum{_format_labels(pairs)} {repr(float(series[-1]))}")
+                lines.append(f"{self.name}_count{_format_labels(pairs)} {_format_value(series[-2])}")
+        return lines
+
+
+REGISTRY: List = []
+
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+STAGE_SECONDS = register(Histogram(
+    "recommendation_stage_seconds",
+    "Time spent in each stage of the recommendation pipeline.",
+    ["stage", "mix_id", "quality_level", "cache"],
+))
+
+
+class RequestTimer:
+    """Accumulates per-stage durations for one request."""
+
+    def __init__(self, mix_id: str, quality_level: Optional[int] = None):
+        self.mix_id = mix_id
+        self.quality_level = quality_level
+        self.cache = "none"  # "hit" / "miss" once features are loaded, "neighbors" for table lookups
+        self.durations: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[name] = self.durations.get(name, 0.0) + time.perf_counter() - start
+
+    def finish(self) -> None:
+        labels = {"mix_id": self.mix_id, "quality_level": self.quality_level or "", "cache": self.cache}
+        for name, seconds in self.durations.items():
+            STAGE_SECONDS.observe(seconds, stage=name, **labels)
+
+
+_current_timer: ContextVar = ContextVar("recommendation_request_timer", default=None)
+
+
+@contextmanager
+def request_timer(mix_id: str):
+    """Time a whole recommendation request; stages are recorded on exit."""
+    timer = RequestTimer(mix_id)
+    token = _current_timer.set(timer)
+    try:
+        with timer.stage("total"):
+            yield timer
+    finally:
+        _current_timer.reset(token)
+        timer.finish()
+
+
+def stage(name: str):
+    """Time a stage of the current request (no-op outside `request_timer`)."""
+    timer = _current_timer.get()
+    return timer.stage(name) if timer is not None else nullcontext()
+
+
+def mark_cache(result: str) -> None:
+    """Record how the current request got its features ("hit", "miss", ...)."""
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.cache = result
+
+
+def render_metrics(extra_lines: Sequence[str] = ()) -> str:
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    lines.extend(extra_lines)
+    return "\n".join(lines) + "\n"
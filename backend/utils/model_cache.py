@@ -0,0 +1,150 @@
+"""Process-wide cache of featurized mixes.
+
+Featurizing a mix (loading its `MixContent` rows, building the text field and
+fitting a vectorizer or encoding with sentence-transformers) dominates the
+cost of a recommendation request, yet the result only changes when the mix's
+content is re-ingested. Entries are keyed by
+``(mix_id, featurizer, content_version)`` and evicted least-recently-used once
+the total size of cached entries exceeds ``MODEL_CACHE_MAX_BYTES``.
+"""
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Hashable, Optional
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from sqlalchemy.orm import Session
+
+from backend import settings
+from backend.models import Mix
+from backend.utils.response_cache import response_cache
+from backend.utils.tag_index import TagIndex
+
+
+@dataclass
+class MixFeatures:
+    """Everything the scoring code needs about one mix, computed once."""
+    df: pd.DataFrame  # content_id / title / description / tags, one row per item
+    matrix: Any  # dense ndarray or scipy sparse matrix, row i <-> df.iloc[i]
+    index: Dict[str, int]  # content_id -> row
+    tag_index: Optional[TagIndex] = None  # inverted tag index, rows aligned with df
+    ann: Optional[Any] = None  # IVFIndex for large mixes, None -> exact search
+    nbytes: int = field(default=0)
+
+    def __post_init__(self):
+        if not self.nbytes:
+            self.nbytes = estimate_nbytes(self)
+
+
+def _matrix_nbytes(matrix) -> int:
+    if sp.issparse(matrix):
+        matrix = matrix.tocsr()
+        return int(matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes)
+    return int(np.asarray(matrix).nbytes)
+
+
+def estimate_nbytes(features: MixFeatures) -> int:
+    """Approximate memory held by a MixFeatures entry."""
+    total = int(features.df.memory_usage(deep=True).sum())
+    total += _matrix_nbytes(features.matrix)
+    # dict + list overhead is roughly proportional to the number of items
+    total += 100 * len(features.index)
+    if features.tag_index is not None:
+        total += features.tag_index.nbytes
+    if features.ann is not None:
+        total += features.ann.nbytes
+    return total
+
+
+class ModelCache:
+    """Thread-safe LRU cache bounded by the total ``nbytes`` of its values."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._sizes: Dict[Hashable, int] = {}
+        self._total = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        """Like `get`, but without counting a hit / miss or refreshing recency."""
+        with self._lock:
+            return self._entries.get(key)
+
+    def put(self, key: Hashable, value: Any, nbytes: int) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._total -= self._sizes.pop(key)
+                del self._entries[key]
+            if nbytes > self.max_bytes:
+                # Never cache something that would evict everything else
+                return
+            self._entries[key] = value
+            self._sizes[key] = nbytes
+            self._total += nbytes
+            while self._total > self.max_bytes:
+                old_key, _ = self._entries.popitem(last=False)
+                self._total -= self._sizes.pop(old_key)
+
+    def invalidate(self, mix_id: str) -> int:
+        """Drop every entry whose key starts with ``mix_id``."""
+        with self._lock:
+            stale = [k for k in self._entries if isinstance(k, tuple) and k and k[0] == mix_id]
+            for key in stale:
+                del self._entries[key]
+                self._total -= self._sizes.pop(key)
+            return len(stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._total = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+model_cache = ModelCache(settings.MODEL_CACHE_MAX_BYTES)
+
+
+def get_content_version(db: Session, mix_id: str) -> int:
+    """Return the mix's content version (0 for mixes without a `mixes` row)."""
+    version = db.query(Mix.content_version).filter(Mix.id == mix_id).scalar()
+    return int(version or 0)
+
+
+def invalidate_mix(db: Session, mix_id: str) -> None:
+    """Mark a mix's content as changed.
+
+    Bumps `Mix.content_version` so other worker processes stop using their
+    cached entries, and drops this process's entries (and cached responses)
+    right away.
+    """
+    mix = db.query(Mix).filter(Mix.id == mix_id).first()
+    if mix is not None:
+        mix.content_version = (mix.content_version or 0) + 1
+        db.commit()
+    model_cache.invalidate(mix_id)
+    response_cache.invalidate_content(mix_id)
@@ -0,0 +1,236 @@
+"""Materialised item-to-item neighbour lists.
+
+Requests without a `user_id` depend only on (mix, seed, featurizer), so the
+top-M neighbours of every item are computed at ingest and written to a
+compact per-mix `.npz` file under `neighbors/`. Serving such a request is
+then one row lookup plus one indexed query for the neighbours' metadata -
+no featurization or similarity work at all.
+
+Tables are tagged with the mix's `content_version`; a stale table is never
+served. Sentence-embedding tables are updated incrementally (only lists that
+could be affected by changed items are touched); TF-IDF tables are rebuilt,
+because refitting the vectorizer moves every vector.
+"""
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from backend import settings
+from backend.models import MixContent
+from backend.paths import mix_neighbors_path
+from backend.utils.embeddings import text_hash
+from backend.utils.featurize import build_text, get_mix_features
+from backend.utils.log import log_event
+from backend.utils.model_cache import MixFeatures, get_content_version, model_cache
+from backend.utils.scoring import similarity_rows
+
+# Rows of the catalog scored per block while building a table
+_BUILD_BLOCK_ROWS = 1024
+
+# Featurizer -> a quality level that uses it
+_FEATURIZER_LEVELS = {"tfidf": 1, "sentence": 3}
+
+
+@dataclass
+class NeighborTable:
+    content_ids: np.ndarray  # (N,) str, row i <-> item i
+    neighbors: np.ndarray  # (N, M) int32 rows, best first, -1 padded
+    scores: np.ndarray  # (N, M) float32
+    text_hashes: np.ndarray  # (N,) str, used for incremental updates
+    version: int
+    index: Dict[str, int] = field(default_factory=dict)
+
+    def __post_init__(self):
+        if not self.index:
+            for row, cid in enumerate(self.content_ids.tolist()):
+                self.index.setdefault(cid, row)
+
+    @property
+    def m(self) -> int:
+        return self.neighbors.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.content_ids.nbytes + self.neighbors.nbytes + self.scores.nbytes
+                   + self.text_hashes.nbytes + 100 * len(self.index))
+
+
+def _top_m(block: np.ndarray, rows: np.ndarray, m: int):
+    """Top-m columns of each row of ``block`` excluding the item itself."""
+    block = block.copy()
+    block[np.arange(len(rows)), rows] = -np.inf
+    m_eff = min(m, block.shape[1] - 1)
+    neighbors = np.full((len(rows), m), -1, dtype=np.int32)
+    scores = np.full((len(rows), m), -np.inf, dtype=np.float32)
+    if m_eff <= 0:
+        return neighbors, scores
+    part = np.argpartition(-block, m_eff - 1, axis=1)[:, :m_eff]
+    part_scores = np.take_along_axis(block, part, axis=1)
+    # Best first, ties broken by row order (same as `top_k_indices`)
+    order = np.lexsort((part, -part_scores))
+    neighbors[:, :m_eff] = np.take_along_axis(part, order, axis=1)
+    scores[:, :m_eff] = np.take_along_axis(part_scores, order, axis=1)
+    return neighbors, scores
+
+
+def _item_hashes(features: MixFeatures) -> np.ndarray:
+    return np.array([text_hash(t) for t in build_text(features.df).tolist()])
+
+
+def build_table(features: MixFeatures, version: int, m: int = None) -> NeighborTable:
+    """Compute the top-M neighbours of every item in blocks of rows."""
+    m = m or settings.NEIGHBORS_TOP_M
+    n = features.matrix.shape[0]
+    neighbors = np.empty((n, m), dtype=np.int32)
+    scores = np.empty((n, m), dtype=np.float32)
+    for start in range(0, n, _BUILD_BLOCK_ROWS):
+        rows = np.arange(start, min(n, start + _BUILD_BLOCK_ROWS))
+        neighbors[rows], scores[rows] = _top_m(similarity_rows(features.matrix, rows), rows, m)
+    content_ids = np.array([str(c) for c in features.df["content_id"].tolist()])
+    return NeighborTable(content_ids, neighbors, scores, _item_hashes(features), version)
+
+
+def update_table(old: NeighborTable, features: MixFeatures, version: int) -> NeighborTable:
+    """Bring ``old`` up to date with ``features`` touching as few lists as possible.
+
+    Only valid when unchanged items keep their vectors (sentence embeddings).
+    Lists of changed/new items, and lists that pointed at a changed or removed
+    item, are recomputed; every other list just merges in the changed items.
+    """
+    m = old.m
+    n = features.matrix.shape[0]
+    content_ids = np.array([str(c) for c in features.df["content_id"].tolist()])
+    hashes = _item_hashes(features)
+
+    # old row -> new row for items whose text is unchanged, -1 otherwise
+    remap = np.full(len(old.content_ids), -1, dtype=np.int64)
+    new_index = {}
+    for row, cid in enumerate(content_ids.tolist()):
+        new_index.setdefault(cid, row)
+    for old_row, (cid, h) in enumerate(zip(old.content_ids.tolist(), old.text_hashes.tolist())):
+        row = new_index.get(cid)
+        if row is not None and hashes[row] == h:
+            remap[old_row] = row
+
+    kept_old = np.flatnonzero(remap >= 0)
+    changed = np.setdiff1d(np.arange(n), remap[kept_old])
+    if len(changed) == 0 and len(kept_old) == len(old.content_ids):
+        return NeighborTable(content_ids, old.neighbors.copy(), old.scores.copy(), hashes, version)
+
+    neighbors = np.full((n, m), -1, dtype=np.int32)
+    scores = np.full((n, m), -np.inf, dtype=np.float32)
+    old_valid = old.neighbors[kept_old] >= 0
+    old_lists = np.where(old_valid, remap[np.maximum(old.neighbors[kept_old], 0)], -1)
+    # A list is still trustworthy only if every entry survived (or the item has < M peers)
+    intact = np.all((old_lists >= 0) | ~old_valid, axis=1)
+
+    new_rows = remap[kept_old[intact]]
+    neighbors[new_rows] = old_lists[intact]
+    scores[new_rows] = old.scores[kept_old[intact]]
+    recompute = np.union1d(changed, remap[kept_old[~intact]])
+
+    if len(changed) and len(new_rows):
+        # Merge changed items into the intact lists: (rows, M + C) candidates
+        sims = similarity_rows(features.matrix, changed)[:, new_rows].T
+        cand = np.concatenate([neighbors[new_rows], np.broadcast_to(changed, sims.shape).astype(np.int32)], axis=1)
+        cand_scores = np.concatenate([scores[new_rows], sims.astype(np.float32)], axis=1)
+        cand_scores[cand < 0] = -np.inf
+        order = np.lexsort((np.where(cand < 0, n, cand), -cand_scores))[:, :m]
+        merged = np.take_along_axis(cand, order, axis=1)
+        merged_scores = np.take_along_axis(cand_scores, order, axis=1)
+        merged[~np.isfinite(merged_scores)] = -1
+        neighbors[new_rows] = merged
+        scores[new_rows] = merged_scores
+
+    for start in range(0, len(recompute), _BUILD_BLOCK_ROWS):
+        rows = recompute[start:start + _BUILD_BLOCK_ROWS]
+        neighbors[rows], scores[rows] = _top_m(similarity_rows(features.matrix, rows), rows, m)
+
+    log_event("neighbor_table_update", recomputed=len(recompute), total=n)
+    return NeighborTable(content_ids, neighbors, scores, hashes, version)
+
+
+def write_table(path, table: NeighborTable) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp.npz"
+    np.savez(tmp_path, content_ids=table.content_ids, neighbors=table.neighbors, scores=table.scores,
+             text_hashes=table.text_hashes, version=np.int64(table.version))
+    os.replace(tmp_path, path)
+
+
+def read_table(path) -> Optional[NeighborTable]:
+    if not os.path.exists(path):
+        return None
+    with np.load(path, allow_pickle=False) as data:
+        return NeighborTable(data["content_ids"], data["neighbors"], data["scores"],
+                             data["text_hashes"], int(data["version"]))
+
+
+def rebuild_neighbors(db: Session, mix_id: str, featurizers: List[str]) -> Dict[str, int]:
+    """(Re)build the neighbour tables of a mix after its content changed.
+
+    Mixes above ``NEIGHBORS_MAX_ITEMS`` get no table (they are served by the
+    ANN index instead). Returns the number of items per table written.
+    """
+    version = get_content_version(db, mix_id)
+    written = {}
+    for featurizer in featurizers:
+        path = mix_neighbors_path(mix_id, featurizer)
+        features = get_mix_features(db, mix_id, _FEATURIZER_LEVELS[featurizer])
+        if features.matrix.shape[0] > settings.NEIGHBORS_MAX_ITEMS:
+            if os.path.exists(path):
+                os.remove(path)
+            continue
+        old = read_table(path) if featurizer == "sentence" else None
+        if old is not None and old.m == settings.NEIGHBORS_TOP_M:
+            table = update_table(old, features, version)
+        else:
+            table = build_table(features, version)
+        write_table(path, table)
+        written[featurizer] = len(table.content_ids)
+    return written
+
+
+def get_neighbor_table(db: Session, mix_id: str, featurizer: str) -> Optional[NeighborTable]:
+    """The mix's neighbour table if it exists and matches the current content."""
+    version = get_content_version(db, mix_id)
+    key = (mix_id, f"neighbors:{featurizer}", version)
+    table = model_cache.get(key)
+    if table is None:
+        table = read_table(mix_neighbors_path(mix_id, featurizer))
+        if table is None or table.version != version:
+            return None
+        model_cache.put(key, table, table.nbytes)
+    return table
+
+
+def lookup_neighbors(db: Session, mix_id: str, featurizer: str, content_id: str, k: int) -> Optional[List[dict]]:
+    """Scored neighbour records of ``content_id``, or None if the table can't answer."""
+    table = get_neighbor_table(db, mix_id, featurizer)
+    if table is None or k > table.m:
+        return None
+    row = table.index.get(str(content_id))
+    if row is None:
+        return None
+
+    rows = table.neighbors[row, :k]
+    valid = rows >= 0
+    ids = table.content_ids[rows[valid]].tolist()
+    scores = table.scores[row, :k][valid].tolist()
+
+    by_id = {}
+    for r in (db.query(MixContent)
+                .filter(MixContent.mix_id == mix_id, MixContent.content_id.in_(ids))
+                .all()):
+        by_id.setdefault(r.content_id, {
+            "content_id": r.content_id,
+            "title": r.title,
+            "description": r.description,
+            "tags": r.tags,
+        })
+    if any(cid not in by_id for cid in ids):
+        return None
+    return [dict(by_id[cid], score=float(s)) for cid, s in zip(ids, scores)]
@@ -0,0 +1,99 @@
+"""Keyset (cursor) pagination for the listing endpoints.
+
+Pages are ordered by a tuple of key columns - a timestamp and the row id as
+a tie-breaker - and the cursor is the last row's key, so fetching a page is
+an index range scan instead of an OFFSET over every earlier row. List
+responses keep their JSON array body and return the next page's cursor in
+the `X-Next-Cursor` header (absent on the last page); `format=ndjson`
+streams every remaining row instead, `STREAM_PAGE_ROWS` at a time, so
+memory stays flat however long the history is.
+"""
+import base64
+import json
+import uuid
+from datetime import datetime
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlalchemy import DateTime, String, Uuid, cast, literal, tuple_
+from sqlalchemy.orm import Query, Session
+
+from backend import settings
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class _Key:
+    """A key column: what pages are ordered by, what the cursor stores, and how it is read back."""
+
+    def __init__(self, db: Session, column):
+        self.column, self.selected, self.type, self.parse = column, column, column.type, str
+        if isinstance(column.type, DateTime):
+            if db.get_bind().dialect.name == "sqlite":
+                # SQLite keeps datetimes as text in more than one format (server
+                # defaults lack microseconds); order and compare the stored text
+                # as is, so pages stay consistent and the index is still used
+                self.selected, self.type = cast(column, String), String()
+            else:
+                self.parse = datetime.fromisoformat
+        elif isinstance(column.type, Uuid):
+            self.parse = uuid.UUID
+
+
+def encode_cursor(values: Sequence) -> str:
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else str(v) for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, parsers: Sequence[Callable[[str], object]]) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if len(values) != len(parsers):
+            raise ValueError("wrong number of keys")
+        return [parse(v) for parse, v in zip(parsers, values)]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def fetch_page(db: Session, query: Query, key_columns: Sequence, cursor: Optional[str], limit: int,
+               descending: bool = True) -> Tuple[List, Optional[str]]:
+    """One page of ``query`` ordered by ``key_columns``, and the cursor of the next page."""
+    keys = [_Key(db, column) for column in key_columns]
+    if cursor:
+        after = decode_cursor(cursor, [key.parse for key in keys])
+        column = tuple_(*(key.column for key in keys))
+        bound = tuple_(*(literal(value, key.type) for key, value in zip(keys, after)))
+        query = query.filter(column < bound if descending else column > bound)
+    order = [key.column.desc() if descending else key.column.asc() for key in keys]
+    rows = query.add_columns(*(key.selected for key in keys)).order_by(*order).limit(limit + 1).all()
+
+    items = [row[0] for row in rows[:limit]]
+    next_cursor = encode_cursor(rows[limit - 1][1:]) if len(rows) > limit else None
+    return items, next_cursor
+
+
+def iter_rows(db: Session, query: Query, key_columns: Sequence, cursor: Optional[str],
+              descending: bool = True) -> Iterator:
+    """Every row from ``cursor`` on, fetched a page at a time."""
+    while True:
+        items, cursor = fetch_page(db, query, key_columns, cursor, settings.STREAM_PAGE_ROWS, descending)
+        yield from items
+        if cursor is None:
+            return
+        # Loaded rows are not needed once streamed
+        db.expunge_all()
+
+
+def ndjson_response(db: Session, query: Query, key_columns: Sequence, cursor: Optional[str],
+                    serialize: Callable, descending: bool = True) -> StreamingResponse:
+    """Stream the rows as newline-delimited JSON (one ``serialize(row)`` object per line)."""
+    def lines():
+        try:
+            for row in iter_rows(db, query, key_columns, cursor, descending):
+                yield json.dumps(jsonable_encoder(serialize(row))) + "\n"
+        finally:
+            db.close()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
@@ -0,0 +1,42 @@
+"""Chunked reading of uploaded catalog CSVs.
+
+`iter_mapped_chunks` yields the file `CSV_CHUNK_ROWS` rows at a time with
+the user's column mapping applied, so ingest memory is bounded by the chunk
+size rather than the file size. Every column is read as text: per-chunk
+type inference could otherwise turn the same id into "7" in one chunk and
+"7.0" in another.
+"""
+from typing import Dict, Iterator, Optional
+
+import pandas as pd
+from fastapi import HTTPException
+
+from backend import settings
+
+
+def iter_mapped_chunks(csv_path, mappings: Dict[str, str], chunk_rows: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """Yield mapped frames of at most ``chunk_rows`` rows (index continues across chunks)."""
+    try:
+        reader = pd.read_csv(csv_path, dtype=str, chunksize=chunk_rows or settings.CSV_CHUNK_ROWS)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed reading CSV: {e}")
+
+    with reader:
+        while True:
+            try:
+                chunk = next(reader)
+            except StopIteration:
+                return
+            except Exception as e:
+                raise HTTPException(status_code=400, detail=f"Failed reading CSV: {e}")
+
+            chunk = chunk.rename(columns=mappings)
+            if "content_id" not in chunk.columns:
+                raise HTTPException(status_code=400, detail="Mapped column 'content_id' is required but missing after rename.")
+            yield chunk
+
+
+def read_mapped_csv(csv_path, mappings: Dict[str, str]) -> pd.DataFrame:
+    """The whole mapped CSV as one frame, read chunk by chunk."""
+    chunks = list(iter_mapped_chunks(csv_path, mappings))
+    return pd.concat(chunks) if chunks else pd.DataFrame(columns=["content_id"])
@@ -0,0 +1,84 @@
+"""Re-rankers used by the business rules (`diversity_weight`, `random_sample`).
+
+Both work on the already-filtered candidate list and return a new order as
+positions into it; neither changes the scores shown to the client.
+"""
+from typing import Optional
+
+import numpy as np
+import scipy.sparse as sp
+
+
+def weighted_sample_keys(scores: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """Efraimidis-Spirakis keys ``u ** (1 / w)``.
+
+    Sorting by key (descending) is a weighted sample without replacement with
+    probabilities proportional to the (positive) scores; the keys also lie in
+    (0, 1], so they can stand in for relevance in MMR.
+    """
+    weights = np.maximum(np.asarray(scores, dtype=np.float64), 1e-6)
+    u = rng.random(len(weights))
+    return np.exp(np.log(np.maximum(u, 1e-300)) / weights)
+
+
+def mmr_order(matrix, rows: np.ndarray, relevance: np.ndarray, k: int, diversity: float) -> np.ndarray:
+    """Maximal marginal relevance order of the candidates.
+
+    Greedily picks ``argmax(relevance - diversity * max_sim)`` where
+    ``max_sim`` is each candidate's highest similarity to anything picked so
+    far. ``max_sim`` is updated with one candidates-by-pick product per step,
+    so the cost is O(k * candidates) and no pairwise matrix is built. Rows
+    are L2-normalised, so the product is cosine similarity. The first ``k``
+    positions are MMR picks, the rest follow in their original order.
+    ``rows`` of -1 (unknown to the matrix) get no similarity penalty.
+    """
+    n = len(rows)
+    k = min(k, n)
+    known = rows >= 0
+    candidates = matrix[np.where(known, rows, 0)]
+    sparse = sp.issparse(candidates)
+    if sparse:
+        # sparse @ dense-vector is O(nnz); sparse @ sparse.T per step is not
+        candidates = candidates.tocsr()
+        picked = np.zeros(candidates.shape[1], dtype=np.float32)
+
+    relevance = np.asarray(relevance, dtype=np.float64)
+    max_sim = np.zeros(n, dtype=np.float64)
+    taken = np.zeros(n, dtype=bool)
+    order = np.empty(k, dtype=np.int64)
+    for step in range(k):
+        gain = relevance - diversity * max_sim
+        gain[taken] = -np.inf
+        pick = int(np.argmax(gain))
+        order[step] = pick
+        taken[pick] = True
+        if not known[pick]:
+            continue
+        if sparse:
+            start, end = candidates.indptr[pick], candidates.indptr[pick + 1]
+            cols = candidates.indices[start:end]
+            picked[cols] = candidates.data[start:end]
+            sims = candidates @ picked
+            picked[cols] = 0.0
+        else:
+            sims = candidates @ candidates[pick]
+        sims[~known] = 0.0
+        np.maximum(max_sim, sims, out=max_sim)
+    return np.concatenate([order, np.flatnonzero(~taken)])
+
+
+def rerank_order(scores: np.ndarray, diversity: float = 0.0, random_sample: bool = False,
+                 seed: Optional[int] = None, matrix=None, rows: Optional[np.ndarray] = None,
+                 k: int = 10) -> np.ndarray:
+    """New order (positions) of score-sorted candidates.
+
+    ``random_sample`` replaces relevance by weighted sample keys; a positive
+    ``diversity`` (needs ``matrix`` and feature ``rows``) then applies MMR to
+    the first ``k`` picks.
+    """
+    relevance = np.asarray(scores, dtype=np.float64)
+    if random_sample:
+        relevance = weighted_sample_keys(relevance, np.random.default_rng(seed))
+    if diversity > 0 and matrix is not None and rows is not None:
+        return mmr_order(matrix, rows, relevance, k, diversity)
+    return np.argsort(-relevance, kind="stable")
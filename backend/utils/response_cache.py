@@ -0,0 +1,154 @@
+"""LRU + TTL cache of recommendation responses.
+
+The frontend re-issues identical requests (e.g. `top_k=100` on every page
+load), so finished responses are cached under
+``(mix_id, content_id, user_id, quality_level, top_k)`` plus three versions:
+the mix's content version, its business-rules version and the user's
+activity version in that mix. Writes bump the matching version and drop the
+affected entries right away; because the key is built *before* computing, a
+response computed concurrently with a write is stored under the old version
+and never served afterwards.
+
+Entries are indexed by mix and user, so an invalidation only touches the
+entries it drops. A user's activity version is forgotten once no cached
+entry uses it and it is older than the TTL; versions are drawn from one
+increasing counter, so a forgotten one is never reused.
+
+Versions live in this process only. Writes handled by another worker process
+are picked up once entries expire (`RESPONSE_CACHE_TTL_SECONDS`).
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Set, Tuple
+
+from backend import settings
+
+
+class ResponseCache:
+    """Thread-safe LRU cache with per-entry expiry and versioned keys."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._content_versions: Dict[str, int] = {}
+        self._rules_versions: Dict[str, int] = {}
+        # (mix_id, user_id) -> (version, monotonic time of the bump), roughly oldest first
+        self._activity_versions: "OrderedDict[Tuple[str, str], Tuple[int, float]]" = OrderedDict()
+        self._last_version = 0
+        # mix_id -> user_id (None for anonymous requests) -> keys of its entries
+        self._index: Dict[str, Dict[Optional[str], Set[Hashable]]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def make_key(self, mix_id: str, content_id: Optional[str], user_id: Optional[str],
+                 quality_level: Optional[int], top_k: int) -> tuple:
+        with self._lock:
+            return (
+                mix_id, content_id, user_id, quality_level, top_k,
+                self._content_versions.get(mix_id, 0),
+                self._rules_versions.get(mix_id, 0),
+                self._activity_versions.get((mix_id, user_id), (0, 0.0))[0] if user_id else 0,
+            )
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            self._index.setdefault(key[0], {}).setdefault(key[2], set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: Hashable) -> None:
+        # Caller holds the lock
+        del self._entries[key]
+        users = self._index[key[0]]
+        keys = users[key[2]]
+        keys.discard(key)
+        if not keys:
+            del users[key[2]]
+            if not users:
+                del self._index[key[0]]
+
+    def _drop(self, mix_id: str, user_id: Optional[str] = None) -> int:
+        # Caller holds the lock
+        users = self._index.get(mix_id, {})
+        groups = [users.get(user_id, set())] if user_id is not None else list(users.values())
+        stale = [key for keys in groups for key in keys]
+        for key in stale:
+            self._remove(key)
+        return len(stale)
+
+    def _next_version(self) -> int:
+        self._last_version += 1
+        return self._last_version
+
+    def invalidate_content(self, mix_id: str) -> int:
+        """The mix's items, mapping or quality level changed."""
+        with self._lock:
+            self._content_versions[mix_id] = self._next_version()
+            return self._drop(mix_id)
+
+    def invalidate_rules(self, mix_id: str) -> int:
+        """The mix's business rules were set or deleted."""
+        with self._lock:
+            self._rules_versions[mix_id] = self._next_version()
+            return self._drop(mix_id)
+
+    def invalidate_user(self, mix_id: str, user_id: str) -> int:
+        """The user logged activity in the mix; other users' entries stay."""
+        with self._lock:
+            now = time.monotonic()
+            key = (mix_id, user_id)
+            self._activity_versions.pop(key, None)
+            self._activity_versions[key] = (self._next_version(), now)
+            self._prune_versions(now)
+            return self._drop(mix_id, user_id)
+
+    def _prune_versions(self, now: float) -> None:
+        # Caller holds the lock. Looks at two of the oldest versions per bump
+        # (each bump adds at most one). A request keyed before a bump older
+        # than the TTL is past the staleness the cache allows anyway.
+        for _ in range(min(2, len(self._activity_versions))):
+            (mix_id, user_id), (_, bumped_at) = next(iter(self._activity_versions.items()))
+            if bumped_at >= now - self.ttl_seconds:
+                break
+            if user_id in self._index.get(mix_id, {}):
+                # Still keys cached entries; look again later
+                self._activity_versions.move_to_end((mix_id, user_id))
+            else:
+                self._activity_versions.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._index.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+response_cache = ResponseCache(settings.RESPONSE_CACHE_MAX_ENTRIES, settings.RESPONSE_CACHE_TTL_SECONDS)
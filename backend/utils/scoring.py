@@ -0,0 +1,75 @@
+"""Similarity scoring over L2-normalised feature matrices.
+
+Feature rows are normalised once at featurization time, so the cosine
+similarity between items is a plain dot product. Only the rows a request
+actually needs (the seed, watched items) are ever multiplied against the
+catalog - we never materialise the full N x N similarity matrix.
+"""
+from typing import Iterable, Optional, Sequence
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.preprocessing import normalize
+
+
+def l2_normalize(matrix):
+    """Row-normalise a feature matrix. Sparse stays CSR, dense becomes float32."""
+    if sp.issparse(matrix):
+        return normalize(sp.csr_matrix(matrix, dtype=np.float32), norm="l2", copy=False)
+    dense = np.ascontiguousarray(matrix, dtype=np.float32)
+    return normalize(dense, norm="l2", copy=False)
+
+
+def similarity_rows(matrix, rows: Sequence[int]) -> np.ndarray:
+    """Cosine similarity of the given rows to every item, shape (len(rows), N)."""
+    rows = np.asarray(rows, dtype=np.int64)
+    if sp.issparse(matrix):
+        block = matrix[rows] @ matrix.T
+        return np.asarray(block.toarray(), dtype=np.float32)
+    return matrix[rows] @ matrix.T
+
+
+def vector_scores(matrix, rows: np.ndarray, vector: np.ndarray) -> np.ndarray:
+    """Dot product of the given rows with a dense ``vector``, shape (len(rows),)."""
+    return np.asarray(matrix[np.asarray(rows, dtype=np.int64)] @ vector, dtype=np.float32).ravel()
+
+
+def top_k_indices(scores: np.ndarray, k: int, exclude: Optional[Iterable[int]] = None) -> np.ndarray:
+    """Indices of the ``k`` highest scores, best first.
+
+    Uses ``argpartition`` (O(N)) to find the candidates and only sorts those
+    k. Ties are broken by row order so results are deterministic.
+    """
+    scores = np.asarray(scores)
+    candidates = np.arange(len(scores))
+    if exclude is not None:
+        mask = np.ones(len(scores), dtype=bool)
+        mask[np.fromiter(exclude, dtype=np.int64)] = False
+        candidates = candidates[mask]
+
+    k = max(0, min(k, len(candidates)))
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+
+    candidate_scores = scores[candidates]
+    if k < len(candidates):
+        part = np.argpartition(-candidate_scores, k - 1)[:k]
+        candidates = candidates[part]
+        candidate_scores = candidate_scores[part]
+    order = np.lexsort((candidates, -candidate_scores))
+    return candidates[order]
+
+
+def candidate_scores(matrix, row: int, candidates: np.ndarray) -> np.ndarray:
+    """Exact similarity of ``row`` to ``candidates`` as a full-length vector.
+
+    Items outside the candidate set score ``-inf`` so `top_k_indices` never
+    picks them ahead of a real candidate.
+    """
+    scores = np.full(matrix.shape[0], -np.inf, dtype=np.float32)
+    if len(candidates):
+        block = matrix[candidates] @ matrix[row].T
+        if sp.issparse(block):
+            block = block.toarray()
+        scores[candidates] = np.asarray(block, dtype=np.float32).ravel()
+    return scores
@@ -0,0 +1,137 @@
+"""Per-mix inverted tag index.
+
+Every distinct tag in a mix gets an integer id and a packed bitmap over the
+mix's items (its posting list), so "items having any of these tags" is an OR
+of a few bitmaps instead of substring matching on comma-separated strings.
+Business rules use it to drop include/exclude misses *before* top-k
+selection. The index is built at ingest and stored next to the neighbour
+tables as ``tags/{mix_id}.npz``, tagged with the mix's content version.
+"""
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Compiled plans kept per tag index (i.e. per mix content version)
+MAX_PLANS_PER_INDEX = 8
+
+
+class PlanCache:
+    """Thread-safe LRU of compiled rules plans by rules version.
+
+    Requests are served from a thread pool, so concurrent misses for the
+    same index look up, insert and evict here under one lock.
+    """
+
+    def __init__(self, max_entries: int = MAX_PLANS_PER_INDEX):
+        self.max_entries = max_entries
+        self._plans: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._plans)
+
+    def get(self, version: str) -> Optional[Any]:
+        with self._lock:
+            plan = self._plans.get(version)
+            if plan is not None:
+                self._plans.move_to_end(version)
+            return plan
+
+    def put(self, version: str, plan: Any) -> Any:
+        """Cache ``plan``; returns the plan cached for ``version`` (a concurrent caller's may win)."""
+        with self._lock:
+            existing = self._plans.get(version)
+            if existing is not None:
+                self._plans.move_to_end(version)
+                return existing
+            self._plans[version] = plan
+            while len(self._plans) > self.max_entries:
+                self._plans.popitem(last=False)
+            return plan
+
+
+@dataclass
+class TagIndex:
+    vocab: Dict[str, int]  # tag -> tag id
+    content_ids: List[str]  # row -> content_id
+    item_tags: List[List[int]]  # tag ids per row, in the item's own order
+    postings: np.ndarray  # uint8 (n_tags, ceil(n_items / 8)), packed item bitmap per tag
+    index: Dict[str, int] = field(default_factory=dict)  # content_id -> row (first occurrence)
+    plans: PlanCache = field(default_factory=PlanCache)  # rules version -> compiled RulesPlan
+    nbytes: int = field(default=0)
+
+    def __post_init__(self):
+        if not self.index:
+            for row, cid in enumerate(self.content_ids):
+                self.index.setdefault(cid, row)
+        if not self.nbytes:
+            self.nbytes = int(self.postings.nbytes + 150 * len(self.index) + 60 * len(self.vocab)
+                              + sum(8 * len(t) + 56 for t in self.item_tags))
+
+    def __len__(self) -> int:
+        return len(self.content_ids)
+
+    def any_tags(self, tags: Iterable[str]) -> np.ndarray:
+        """Boolean per item: does it carry any of ``tags``? Unknown tags match nothing."""
+        ids = sorted({self.vocab[t] for t in (str(t).strip() for t in tags) if t in self.vocab})
+        if not ids:
+            return np.zeros(len(self), dtype=bool)
+        bitmap = np.bitwise_or.reduce(self.postings[ids], axis=0)
+        return np.unpackbits(bitmap, count=len(self)).astype(bool)
+
+
+def _postings(n_items: int, n_tags: int, item_tags: Sequence[List[int]]) -> np.ndarray:
+    lengths = np.fromiter((len(t) for t in item_tags), dtype=np.int64, count=len(item_tags))
+    rows = np.repeat(np.arange(len(item_tags), dtype=np.int64), lengths)
+    tag_ids = np.fromiter((i for t in item_tags for i in t), dtype=np.int64, count=int(lengths.sum()))
+    postings = np.zeros((n_tags, (n_items + 7) // 8), dtype=np.uint8)
+    np.bitwise_or.at(postings, (tag_ids, rows >> 3), (128 >> (rows & 7)).astype(np.uint8))
+    return postings
+
+
+def build_tag_index(content_ids: Sequence, tags: Sequence[List[str]]) -> TagIndex:
+    """Index pre-split tag lists (see `featurize.split_tags`) for one mix."""
+    vocab: Dict[str, int] = {}
+    item_tags = []
+    for item in tags:
+        ids = []
+        for tag in item:
+            tag_id = vocab.setdefault(tag, len(vocab))
+            if tag_id not in ids:
+                ids.append(tag_id)
+        item_tags.append(ids)
+    content_ids = [str(c) for c in content_ids]
+    return TagIndex(vocab=vocab, content_ids=content_ids, item_tags=item_tags,
+                    postings=_postings(len(content_ids), len(vocab), item_tags))
+
+
+def write_tag_index(path, tag_index: TagIndex, version: int) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    lengths = np.fromiter((len(t) for t in tag_index.item_tags), dtype=np.int64, count=len(tag_index))
+    ptr = np.concatenate([[0], np.cumsum(lengths)])
+    tag_ids = np.fromiter((i for t in tag_index.item_tags for i in t), dtype=np.int32, count=int(ptr[-1]))
+    vocab = sorted(tag_index.vocab, key=tag_index.vocab.get)
+    tmp_path = f"{path}.tmp.npz"
+    np.savez(tmp_path, content_ids=np.array(tag_index.content_ids, dtype=str), vocab=np.array(vocab, dtype=str),
+             ptr=ptr, tag_ids=tag_ids, version=np.int64(version))
+    os.replace(tmp_path, path)
+
+
+def read_tag_index(path) -> Optional[Tuple[TagIndex, int]]:
+    """(index, content version) stored at ``path``, or None."""
+    if not os.path.exists(path):
+        return None
+    with np.load(path, allow_pickle=False) as data:
+        ptr, tag_ids = data["ptr"].tolist(), data["tag_ids"].tolist()
+        item_tags = [tag_ids[ptr[i]:ptr[i + 1]] for i in range(len(ptr) - 1)]
+        vocab = {tag: i for i, tag in enumerate(data["vocab"].tolist())}
+        content_ids = data["content_ids"].tolist()
+        version = int(data["version"])
+    tag_index = TagIndex(vocab=vocab, content_ids=content_ids, item_tags=item_tags,
+                         postings=_postings(len(content_ids), len(vocab), item_tags))
+    return tag_index, version
@@ -0,0 +1,365 @@
+"""Per-(user, mix) taste vectors for Level 2/3 personalisation.
+
+A user's taste vector is the mean feature row of the catalog items they
+interacted with in a mix. Feature rows are L2-normalised, so its dot product
+with a candidate's row is the candidate's mean similarity to the watched
+items - the collaborative boost - and scoring a request takes one
+matrix-vector product instead of a similarity row per watched item, without
+re-reading the user's history.
+
+A profile is stored as a decayed sum of rows plus a decayed item count, so
+an event folds in with one row addition. With `TASTE_HALF_LIFE_DAYS > 0` an
+item's weight halves every half-life, measured from the user's latest
+event; each item counts once, from its first interaction (like the watched
+set it replaces). Profiles belong to the feature space they were built in,
+(featurizer, content_version).
+
+Profiles are only written on the write path and by ingest jobs: logging
+activity folds the events into the user's profiles (rebuilding a stale one,
+creating a missing one from the history) when the mix's features are
+already cached in the process, and otherwise marks them stale; an ingest
+that changed the catalog rebuilds the mix's profiles for the new content
+version (`rebuild_tastes`). Recommendation requests only read them; a
+profile that is missing or stale is computed from the history for that
+request alone.
+"""
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session
+
+from backend import settings
+from backend.models import Mix, TasteProfile, UserActivity
+from backend.utils.embeddings import SPARSE_VECTOR_DTYPE, vector_from_bytes, vector_to_bytes
+from backend.utils.featurize import cached_features, featurizer_for_level, get_features
+from backend.utils.log import log_event
+from backend.utils.model_cache import MixFeatures, get_content_version
+
+# (user, mix) pairs per profile lookup when folding in a batch of events
+_PAIRS_PER_QUERY = 500
+
+# content_version of a profile that must be rebuilt (matches no mix version)
+STALE_VERSION = -1
+
+
+def _decay(newer: datetime, older: datetime) -> float:
+    """Weight of an event at ``older`` relative to one at ``newer``."""
+    if settings.TASTE_HALF_LIFE_DAYS <= 0 or newer <= older:
+        return 1.0
+    days = (newer - older).total_seconds() / 86400.0
+    return float(0.5 ** (days / settings.TASTE_HALF_LIFE_DAYS))
+
+
+def utcnow() -> datetime:
+    # Naive UTC, like the DB's server-side default
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def feature_row(features: MixFeatures, row: int) -> np.ndarray:
+    vec = features.matrix[row]
+    if sp.issparse(vec):
+        vec = vec.toarray()
+    return np.asarray(vec, dtype=np.float32).ravel()
+
+
+@dataclass
+class UserTaste:
+    """A user's taste in one mix, in the feature space of one featurizer."""
+    items: np.ndarray  # sorted catalog rows folded in (int32)
+    vector: np.ndarray  # decayed sum of their feature rows (float32)
+    weight: float = 0.0  # decayed item count
+    last_content_id: Optional[str] = None  # most recent interaction
+    last_event_at: Optional[datetime] = None
+
+    @classmethod
+    def empty(cls, n_features: int) -> "UserTaste":
+        return cls(np.empty(0, dtype=np.int32), np.zeros(n_features, dtype=np.float32))
+
+    def mean(self) -> np.ndarray:
+        """The taste vector (zeros while nothing in the catalog was watched)."""
+        return self.vector / self.weight if self.weight else self.vector
+
+    def fold(self, features: MixFeatures, content_id: Optional[str], timestamp: datetime) -> None:
+        """Add one interaction (events may arrive slightly out of order)."""
+        newest = self.last_event_at is None or timestamp >= self.last_event_at
+        if newest:
+            if self.last_event_at is not None:
+                # Re-base the sums on the new latest event
+                factor = _decay(timestamp, self.last_event_at)
+                self.vector *= factor
+                self.weight *= factor
+            self.last_content_id, self.last_event_at = content_id, timestamp
+
+        row = features.index.get(str(content_id)) if content_id is not None else None
+        if row is None:
+            return
+        pos = int(np.searchsorted(self.items, row))
+        if pos < len(self.items) and self.items[pos] == row:
+            return
+        self.items = np.insert(self.items, pos, row).astype(np.int32)
+        weight = _decay(self.last_event_at, timestamp)
+        self.vector += weight * feature_row(features, row)
+        self.weight += weight
+
+
+def build_taste(features: MixFeatures, events: Iterable[Tuple[Optional[str], datetime]]) -> UserTaste:
+    """A user's taste from their (content_id, timestamp) events, oldest first."""
+    taste = UserTaste.empty(features.matrix.shape[1])
+    first_seen: Dict[int, datetime] = {}
+    for content_id, timestamp in events:
+        taste.last_content_id, taste.last_event_at = content_id, timestamp
+        row = features.index.get(str(content_id)) if content_id is not None else None
+        if row is not None and row not in first_seen:
+            first_seen[row] = timestamp
+    if first_seen:
+        rows = np.fromiter(first_seen, dtype=np.int64, count=len(first_seen))
+        weights = np.array([_decay(taste.last_event_at, t) for t in first_seen.values()], dtype=np.float32)
+        taste.items = np.sort(rows).astype(np.int32)
+        taste.vector = np.asarray(features.matrix[rows].T @ weights, dtype=np.float32).ravel()
+        taste.weight = float(weights.sum())
+    return taste
+
+
+def _encode_vector(vector: np.ndarray, featurizer: str) -> bytes:
+    if featurizer == "tfidf":
+        # TF-IDF tastes touch a small part of the vocabulary; keep the non-zeros
+        nonzero = np.flatnonzero(vector)
+        pairs = np.empty(len(nonzero), dtype=SPARSE_VECTOR_DTYPE)
+        pairs["index"] = nonzero
+        pairs["value"] = vector[nonzero]
+        return vector_to_bytes(pairs)
+    return vector_to_bytes(vector.astype(np.float32))
+
+
+def _decode(record: TasteProfile, n_features: int) -> Optional[UserTaste]:
+    """The stored taste, or None if it doesn't fit the current feature space."""
+    stored = vector_from_bytes(record.vector)
+    if stored.dtype == SPARSE_VECTOR_DTYPE:
+        if len(stored) and int(stored["index"].max()) >= n_features:
+            return None
+        vector = np.zeros(n_features, dtype=np.float32)
+        vector[stored["index"]] = stored["value"]
+    elif stored.shape == (n_features,):
+        vector = stored.astype(np.float32)
+    else:
+        return None
+    return UserTaste(vector_from_bytes(record.items).astype(np.int32), vector, float(record.weight),
+                     record.last_content_id, record.last_event_at)
+
+
+def _store(record: TasteProfile, taste: UserTaste, content_version: int) -> None:
+    record.content_version = content_version
+    record.items = vector_to_bytes(taste.items)
+    record.vector = _encode_vector(taste.vector, record.featurizer)
+    record.weight = taste.weight
+    record.last_content_id = taste.last_content_id
+    record.last_event_at = taste.last_event_at
+
+
+def _histories(db: Session, mix_id: str, user_ids: List[str]) -> Dict[str, list]:
+    """Each user's (content_id, timestamp) events in the mix, oldest first."""
+    events = defaultdict(list)
+    for start in range(0, len(user_ids), _PAIRS_PER_QUERY):
+        for uid, content_id, timestamp in (
+            db.query(UserActivity.user_id, UserActivity.content_id, UserActivity.timestamp)
+              .filter(UserActivity.mix_id == mix_id, UserActivity.user_id.in_(user_ids[start:start + _PAIRS_PER_QUERY]))
+              .order_by(UserActivity.timestamp.asc())
+        ):
+            events[uid].append((content_id, timestamp))
+    return events
+
+
+def get_user_tastes(db: Session, mix_id: str, features: MixFeatures, featurizer: str,
+                    user_ids: Iterable[str]) -> Dict[str, UserTaste]:
+    """Each user's taste in the mix (read-only).
+
+    Stored profiles at the current content version are used as they are;
+    missing or stale ones are built from the history for this call only.
+    """
+    user_ids = list(dict.fromkeys(uid for uid in user_ids if uid))
+    if not user_ids:
+        return {}
+    version = get_content_version(db, mix_id)
+    n_features = features.matrix.shape[1]
+
+    tastes = {}
+    for record in db.query(TasteProfile).filter(
+            TasteProfile.mix_id == mix_id, TasteProfile.featurizer == featurizer,
+            TasteProfile.user_id.in_(user_ids)):
+        taste = _decode(record, n_features) if record.content_version == version else None
+        if taste is not None:
+            tastes[record.user_id] = taste
+
+    stale = [uid for uid in user_ids if uid not in tastes]
+    if stale:
+        events = _histories(db, mix_id, stale)
+        for uid in stale:
+            tastes[uid] = build_taste(features, events[uid])
+    return tastes
+
+
+class _FeatureSpaces:
+    """Mix features per (mix, featurizer) for one write, looked up at most once.
+
+    With ``resident_only`` only features already in this process's model
+    cache are used (the activity write path never featurizes); otherwise
+    they are loaded or featurized as a request would.
+    """
+
+    def __init__(self, db: Session, resident_only: bool = False):
+        self.db = db
+        self.resident_only = resident_only
+        self._features: Dict[Tuple[str, str], Optional[MixFeatures]] = {}
+
+    def get(self, mix_id: str, featurizer: str) -> Optional[MixFeatures]:
+        key = (mix_id, featurizer)
+        if key not in self._features:
+            if self.resident_only:
+                self._features[key] = cached_features(self.db, mix_id, featurizer)
+                return self._features[key]
+            try:
+                self._features[key] = get_features(self.db, mix_id, featurizer)
+            except Exception as e:
+                # e.g. the sentence model is unavailable; the profile is dropped
+                log_event("taste_features_failed", level=logging.WARNING, mix_id=mix_id,
+                          featurizer=featurizer, error=str(e))
+                self._features[key] = None
+        return self._features[key]
+
+
+# Columns of a new profile row (`updated_at` is set by the DB)
+_INSERT_COLUMNS = ["user_id", "mix_id", "featurizer", "content_version", "items", "vector", "weight",
+                   "last_content_id", "last_event_at"]
+
+
+def _profile_values(user_id: str, mix_id: str, featurizer: str, taste: UserTaste, content_version: int) -> dict:
+    record = TasteProfile(user_id=user_id, mix_id=mix_id, featurizer=featurizer)
+    _store(record, taste, content_version)
+    return {name: getattr(record, name) for name in _INSERT_COLUMNS}
+
+
+def _insert_profiles(db: Session, values: List[dict]) -> None:
+    """Insert new profiles; one a concurrent writer created first is kept (it has the same events)."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        from sqlalchemy import insert
+    statement = insert(TasteProfile.__table__)
+    if dialect in ("postgresql", "sqlite"):
+        statement = statement.on_conflict_do_nothing()
+    db.execute(statement, values)
+
+
+def fold_activity(db: Session, rows: List[dict]) -> None:
+    """Bring the profiles of the users in new activity rows up to date (not committed).
+
+    Rows are `user_activity` dicts already written in this transaction;
+    ones without a timestamp count as now. Only features already cached in
+    this process are used: current profiles fold the events in, stale ones
+    are rebuilt from the history (which includes the rows), and users
+    without a profile in their mix's current feature space get one. A
+    profile whose features aren't cached is marked stale instead, and
+    requests compute it from the history until a later write or ingest job
+    (`rebuild_tastes`) rebuilds it.
+    """
+    events = defaultdict(list)
+    now = utcnow()
+    for row in rows:
+        events[(row["user_id"], row["mix_id"])].append((row.get("timestamp") or now, row.get("content_id")))
+    pairs = list(events)
+    spaces = _FeatureSpaces(db, resident_only=True)
+    versions = {mix_id: get_content_version(db, mix_id) for mix_id in {mix_id for _, mix_id in pairs}}
+    levels = dict(db.query(Mix.id, Mix.quality_level).filter(Mix.id.in_(list(versions))))
+    featurizers = {mix_id: featurizer_for_level(int(levels.get(mix_id) or 2)) for mix_id in versions}
+
+    for start in range(0, len(pairs), _PAIRS_PER_QUERY):
+        chunk = pairs[start:start + _PAIRS_PER_QUERY]
+        query = db.query(TasteProfile).filter(tuple_(TasteProfile.user_id, TasteProfile.mix_id).in_(chunk))
+        if db.get_bind().dialect.name != "sqlite":
+            # Concurrent writers for the same user serialise on the profile row
+            query = query.with_for_update()
+        records = query.all()
+
+        stale = []
+        for record in records:
+            features = spaces.get(record.mix_id, record.featurizer)
+            if features is None:
+                record.content_version = STALE_VERSION
+                continue
+            taste = (_decode(record, features.matrix.shape[1])
+                     if record.content_version == versions[record.mix_id] else None)
+            if taste is None:
+                stale.append(record)
+                continue
+            for timestamp, content_id in sorted(events[(record.user_id, record.mix_id)], key=lambda e: e[0]):
+                taste.fold(features, content_id, timestamp)
+            _store(record, taste, versions[record.mix_id])
+        _rebuild(db, spaces, stale, versions)
+
+        profiled = {(r.user_id, r.mix_id, r.featurizer) for r in records}
+        missing = defaultdict(list)
+        for user_id, mix_id in chunk:
+            if (user_id, mix_id, featurizers[mix_id]) not in profiled:
+                missing[mix_id].append(user_id)
+        new = []
+        for mix_id, user_ids in missing.items():
+            features = spaces.get(mix_id, featurizers[mix_id])
+            if features is None:
+                continue
+            histories = _histories(db, mix_id, user_ids)
+            new.extend(_profile_values(uid, mix_id, featurizers[mix_id], build_taste(features, histories[uid]),
+                                       versions[mix_id]) for uid in user_ids)
+        if new:
+            _insert_profiles(db, new)
+
+
+def _rebuild(db: Session, spaces: _FeatureSpaces, records: List[TasteProfile], versions: Dict[str, int]) -> None:
+    """Rebuild stored ``records`` from their users' histories (not committed).
+
+    Profiles whose feature space can't be loaded are deleted (never happens
+    on the write path, which only passes records with resident features).
+    """
+    by_space = defaultdict(list)
+    for record in records:
+        by_space[(record.mix_id, record.featurizer)].append(record)
+    for (mix_id, featurizer), group in by_space.items():
+        features = spaces.get(mix_id, featurizer)
+        if features is None:
+            for record in group:
+                db.delete(record)
+            continue
+        histories = _histories(db, mix_id, [r.user_id for r in group])
+        for record in group:
+            _store(record, build_taste(features, histories[record.user_id]), versions[mix_id])
+
+
+def rebuild_tastes(db: Session, mix_id: str) -> int:
+    """Rebuild the mix's stored profiles for its current content version (ingest jobs; committed)."""
+    version = get_content_version(db, mix_id)
+    spaces = _FeatureSpaces(db)
+    rebuilt = 0
+    while True:
+        records = (db.query(TasteProfile)
+                     .filter(TasteProfile.mix_id == mix_id, TasteProfile.content_version != version)
+                     .limit(_PAIRS_PER_QUERY).all())
+        if not records:
+            return rebuilt
+        _rebuild(db, spaces, records, {mix_id: version})
+        db.commit()
+        rebuilt += len(records)
+
+
+def drop_tastes(db: Session, mix_id: str, user_id: str) -> None:
+    """Forget a user's profiles in a mix (not committed), e.g. after their activity was deleted."""
+    (db.query(TasteProfile)
+       .filter(TasteProfile.mix_id == mix_id, TasteProfile.user_id == user_id)
+       .delete(synchronize_session=False))
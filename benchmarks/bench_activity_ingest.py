@@ -0,0 +1,95 @@
+"""Throughput of user activity writes: one commit per event vs. bulk.
+
+    python -m benchmarks.bench_activity_ingest --events 20000
+    DATABASE_URL=postgresql://... python -m benchmarks.bench_activity_ingest
+
+Compares the single-event path of `POST /user-activity` (insert, commit,
+refresh), `POST /user-activity/batch` bodies of --batch events, and the
+write-behind buffer fed one event at a time (timed until it has flushed).
+Uses a scratch SQLite file unless DATABASE_URL points at PostgreSQL.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.database import Base
+from backend.models import Mix, UserActivity
+from backend.utils import activity
+
+
+def events(n: int, mix_id: str):
+    return [(f"user-{i % 500}", mix_id, f"c{i % 1000}", "heartbeat") for i in range(n)]
+
+
+def write_single(Session, batch: list) -> None:
+    with Session() as db:
+        for user_id, mix_id, content_id, event_type in batch:
+            rec = UserActivity(user_id=user_id, mix_id=mix_id, content_id=content_id, event_type=event_type)
+            db.add(rec)
+            db.commit()
+            db.refresh(rec)
+
+
+def write_batches(Session, batch: list, size: int) -> None:
+    with Session() as db:
+        for start in range(0, len(batch), size):
+            activity.insert_activity(db, [activity.activity_row(*e) for e in batch[start:start + size]])
+            db.commit()
+
+
+def write_buffered(batch: list, flush_rows: int) -> None:
+    buffer = activity.ActivityBuffer(flush_rows, flush_seconds=0.05, max_events=10 * flush_rows)
+    for e in batch:
+        buffer.put(activity.activity_row(*e), timeout=5.0)
+    buffer.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=20_000)
+    parser.add_argument("--batch", type=int, default=500)
+    args = parser.parse_args()
+
+    url = os.getenv("DATABASE_URL", "")
+    scratch = None
+    if not url.startswith("postgresql"):
+        scratch = tempfile.mktemp(suffix=".db")
+        url = f"sqlite:///{scratch}"
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    activity.session_factory = Session
+
+    mix_id = "bench-activity"
+    batch = events(args.events, mix_id)
+    try:
+        with Session() as db:
+            db.add(Mix(id=mix_id, title="bench", status="draft", quality_level="1"))
+            db.commit()
+        for name, write in (("single commits", lambda: write_single(Session, batch)),
+                            (f"batch of {args.batch}", lambda: write_batches(Session, batch, args.batch)),
+                            ("write-behind", lambda: write_buffered(batch, args.batch))):
+            start = time.perf_counter()
+            write()
+            seconds = time.perf_counter() - start
+            with Session() as db:
+                count = db.query(UserActivity).filter(UserActivity.mix_id == mix_id).delete()
+                db.commit()
+            print(f"{name:16s} {args.events:>8,d} events  {seconds:7.2f}s  {args.events / seconds:>10,.0f} events/s"
+                  f"  ({count} written)")
+    finally:
+        with Session() as db:
+            db.query(UserActivity).filter(UserActivity.mix_id == mix_id).delete()
+            db.query(Mix).filter(Mix.id == mix_id).delete()
+            db.commit()
+        engine.dispose()
+        if scratch:
+            os.remove(scratch)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Level 4 implicit ALS on synthetic activity: training time per sweep and
+the serving cost of scoring the catalog from a user's factors.
+
+    python -m benchmarks.bench_als --users 20000 --items 10000 --events 500000 --factors 64
+
+Item popularity is Zipf-like, as in real catalogs; everything stays in
+memory (no DB).
+"""
+import argparse
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+from backend.utils.als import train_als
+from backend.utils.scoring import top_k_indices
+
+
+def synthetic_counts(rng, n_users: int, n_items: int, n_events: int) -> sp.csr_matrix:
+    popularity = 1.0 / np.arange(1, n_items + 1) ** 0.8
+    items = rng.choice(n_items, n_events, p=popularity / popularity.sum())
+    users = rng.integers(0, n_users, n_events)
+    # Duplicate (user, item) pairs are summed into event counts
+    return sp.csr_matrix((np.ones(n_events, dtype=np.float32), (users, items)), shape=(n_users, n_items))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--items", type=int, default=10_000)
+    parser.add_argument("--events", type=int, default=500_000)
+    parser.add_argument("--factors", type=int, default=64)
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    counts = synthetic_counts(rng, args.users, args.items, args.events)
+    counts.sum_duplicates()
+
+    start = time.perf_counter()
+    user_factors, item_factors = train_als(counts, args.factors, args.iterations)
+    seconds = time.perf_counter() - start
+    print(f"train     {counts.shape[0]:,d} users x {counts.shape[1]:,d} items, {counts.nnz:,d} pairs, "
+          f"{args.factors} factors   {seconds:8.2f} s   ({seconds / args.iterations:.2f} s per sweep)")
+
+    users = rng.integers(0, args.users, 1000)
+    start = time.perf_counter()
+    for u in users:
+        top_k_indices(item_factors @ user_factors[u], args.top_k)
+    print(f"serve     1 user x {args.items:,d} items, top {args.top_k}   "
+          f"{(time.perf_counter() - start):8.3f} ms per request")
+
+    for block in (16, 128):
+        start = time.perf_counter()
+        for n in range(0, len(users), block):
+            scores = user_factors[users[n:n + block]] @ item_factors.T
+            for row in scores:
+                top_k_indices(row, args.top_k)
+        print(f"batch     {block:>3d} users per block   "
+              f"{(time.perf_counter() - start):8.3f} ms per user")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Compare the per-row ORM catalog load with the bulk loader (a full
+`sync_mix_content` replace), and a diff re-ingest of the same catalog with
+a fraction of its rows edited.
+
+    python -m benchmarks.bench_bulk_load --rows 100000 --changed 0.001
+    DATABASE_URL=postgresql://... python -m benchmarks.bench_bulk_load
+
+Uses a scratch SQLite file unless DATABASE_URL points at PostgreSQL (where
+the bulk path uses COPY). Each run loads a synthetic mix and deletes it.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import pandas as pd
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.database import Base
+from backend.models import Mix, MixContent
+from backend.utils.bulk_load import sync_mix_content
+
+
+def synthetic_catalog(rows: int) -> pd.DataFrame:
+    return pd.DataFrame({
+        "content_id": [str(i) for i in range(rows)],
+        "title": [f"Title {i}" for i in range(rows)],
+        "description": [f"Description of item {i} with a few more words" for i in range(rows)],
+        "image_url": [None] * rows,
+        "tags": ["drama,comedy" if i % 2 else "sci-fi" for i in range(rows)],
+    })
+
+
+def load_per_row(db, mix_id: str, df: pd.DataFrame) -> None:
+    """The previous map-fields path: one ORM object per `iterrows()` row."""
+    db.query(MixContent).filter(MixContent.mix_id == mix_id).delete()
+    for _, row in df.iterrows():
+        db.add(MixContent(mix_id=mix_id, title=row.get("title"), description=row.get("description"),
+                          image_url=row.get("image_url"), content_id=row.get("content_id"), tags=row.get("tags")))
+    db.commit()
+
+
+def load_bulk(db, mix_id: str, df: pd.DataFrame) -> None:
+    """map-fields' path; the rows loaded per row have no row hashes, so every row is replaced."""
+    sync_mix_content(db, mix_id, lambda: [df])
+    db.commit()
+
+
+def edited_catalog(df: pd.DataFrame, fraction: float) -> pd.DataFrame:
+    """``df`` with ``fraction`` of the descriptions edited."""
+    edited = df.copy()
+    step = max(1, int(round(1 / fraction))) if fraction > 0 else len(df) + 1
+    edited.loc[::step, "description"] = edited.loc[::step, "description"] + " (edited)"
+    return edited
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--changed", type=float, default=0.001, help="fraction of rows edited for the re-ingest")
+    args = parser.parse_args()
+
+    url = os.getenv("DATABASE_URL", "")
+    scratch = None
+    if not url.startswith("postgresql"):
+        scratch = tempfile.mktemp(suffix=".db")
+        url = f"sqlite:///{scratch}"
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+
+    df = synthetic_catalog(args.rows)
+    mix_id = "bench-bulk-load"
+    try:
+        edited = edited_catalog(df, args.changed)
+
+        def load_sync(db, mix_id, _df):
+            sync_mix_content(db, mix_id, lambda: [edited])
+            db.commit()
+
+        for name, load in (("per-row ORM", load_per_row), ("bulk", load_bulk), ("diff sync", load_sync)):
+            with Session() as db:
+                if db.get(Mix, mix_id) is None:
+                    db.add(Mix(id=mix_id, title="bench", status="draft", quality_level="1"))
+                    db.commit()
+                start = time.perf_counter()
+                load(db, mix_id, df)
+                seconds = time.perf_counter() - start
+                count = db.query(MixContent).filter(MixContent.mix_id == mix_id).count()
+                print(f"{name:12s} {args.rows:>9,d} rows  {seconds:7.2f}s  {args.rows / seconds:>10,.0f} rows/s  ({count} in table)")
+    finally:
+        with Session() as db:
+            db.query(MixContent).filter(MixContent.mix_id == mix_id).delete()
+            db.query(Mix).filter(Mix.id == mix_id).delete()
+            db.commit()
+        engine.dispose()
+        if scratch:
+            os.remove(scratch)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Peak memory and time of streaming a catalog CSV into the DB.
+
+    python -m benchmarks.bench_chunked_ingest --rows 500000
+
+Runs the row sync and the ingest-time TF-IDF of `ingest_mix` against a
+scratch SQLite file, once per chunk size, each in a fresh process so peak
+RSS is comparable. A chunk size of 0 reads the whole file as one chunk
+(what ingest did before).
+"""
+import argparse
+import functools
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def measure(csv_path: str, chunk_rows: int) -> None:
+    os.environ["DATABASE_URL"] = f"sqlite:///{csv_path}.db"
+    os.environ["CPU_POOL_WORKERS"] = "0"
+    from backend.database import Base, SessionLocal, engine
+    from backend.mixes.map_fields import TFIDF_COLUMNS, replace_tfidf_embeddings
+    from backend.models import Mix
+    from backend.utils.bulk_load import sync_mix_content
+    from backend.utils.featurize import iter_mix_frames
+    from backend.utils.parse_csv import iter_mapped_chunks
+
+    Base.metadata.create_all(engine)
+    rows = chunk_rows or 10 ** 12
+    with SessionLocal() as db:
+        db.add(Mix(id="bench", title="bench", status="draft", quality_level="1"))
+        db.commit()
+        start = time.perf_counter()
+        diff = sync_mix_content(db, "bench", functools.partial(iter_mapped_chunks, csv_path, {}, rows))
+        synced = time.perf_counter()
+        replace_tfidf_embeddings(db, "bench", functools.partial(iter_mix_frames, db, "bench", TFIDF_COLUMNS, rows))
+        db.commit()
+        done = time.perf_counter()
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    label = f"chunk={chunk_rows:,d}" if chunk_rows else "whole file"
+    print(f"{label:16s} rows={len(diff.inserted):,d}  sync {synced - start:6.1f}s  "
+          f"tfidf {done - synced:6.1f}s  peak RSS {peak_mb:7.0f} MB")
+    os.remove(f"{csv_path}.db")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--chunks", type=int, nargs="+", default=[0, 20_000])
+    parser.add_argument("--measure", help=argparse.SUPPRESS)
+    parser.add_argument("--chunk-rows", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure, args.chunk_rows)
+        return
+
+    from benchmarks.bench_bulk_load import synthetic_catalog
+
+    csv_path = os.path.join(tempfile.mkdtemp(prefix="bench-chunked-"), "catalog.csv")
+    synthetic_catalog(args.rows).to_csv(csv_path, index=False)
+    print(f"{args.rows:,d} rows, {os.path.getsize(csv_path) / 1e6:.0f} MB CSV")
+    try:
+        for chunk_rows in args.chunks:
+            subprocess.run([sys.executable, "-m", "benchmarks.bench_chunked_ingest",
+                            "--measure", csv_path, "--chunk-rows", str(chunk_rows)], check=True)
+    finally:
+        os.remove(csv_path)
+
+
+if __name__ == "__main__":
+    main()
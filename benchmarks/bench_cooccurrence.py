@@ -0,0 +1,69 @@
+"""Item co-occurrence on synthetic activity: full build, incremental folds
+of new events vs. recounting everything, and the per-request lookup.
+
+    python -m benchmarks.bench_cooccurrence --items 20000 --users 20000 --events 500000
+
+Item popularity is Zipf-like, as in real catalogs; everything stays in
+memory (no DB).
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from backend import settings
+from backend.utils.cooccurrence import CoOccurrence
+
+
+def synthetic_events(rng, n_items: int, n_users: int, n_events: int, start: datetime):
+    popularity = 1.0 / np.arange(1, n_items + 1) ** 0.8
+    items = rng.choice(n_items, n_events, p=popularity / popularity.sum())
+    users = rng.integers(0, n_users, n_events)
+    return [(f"u{u}", f"c{i}", start + timedelta(seconds=n)) for n, (u, i) in enumerate(zip(users, items))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=20_000)
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--events", type=int, default=500_000)
+    parser.add_argument("--fold", type=int, default=1_000, help="new events per incremental fold")
+    parser.add_argument("--normalization", default=settings.COOCCURRENCE_NORMALIZATION)
+    args = parser.parse_args()
+    settings.COOCCURRENCE_NORMALIZATION = args.normalization
+
+    rng = np.random.default_rng(0)
+    index = {f"c{i}": i for i in range(args.items)}
+    events = synthetic_events(rng, args.items, args.users, args.events + 5 * args.fold, datetime(2030, 1, 1))
+    history, new = events[:args.events], events[args.events:]
+
+    cooccurrence = CoOccurrence(index, args.items)
+    start = time.perf_counter()
+    cooccurrence.add_events(history)
+    print(f"full build     {args.events:>9,d} events  {time.perf_counter() - start:8.2f} s   "
+          f"nnz {cooccurrence.similarity.nnz:,d}   {cooccurrence.nbytes / 1e6:.0f} MB")
+
+    times = []
+    for n in range(0, len(new), args.fold):
+        start = time.perf_counter()
+        cooccurrence.add_events(new[n:n + args.fold])
+        times.append(time.perf_counter() - start)
+    print(f"fold           {args.fold:>9,d} events  {np.median(times):8.3f} s  (median of {len(times)})")
+
+    start = time.perf_counter()
+    CoOccurrence(index, args.items).add_events(events)
+    print(f"recount        {len(events):>9,d} events  {time.perf_counter() - start:8.2f} s")
+
+    user_items = sorted(cooccurrence.user_items.items(), key=lambda kv: len(kv[1]))
+    watched = np.array(sorted(user_items[len(user_items) // 2][1]), dtype=np.int64)
+    candidates = rng.choice(args.items, 100, replace=False)
+    start = time.perf_counter()
+    for _ in range(1000):
+        cooccurrence.scores(watched, candidates)
+    print(f"lookup         {len(watched):>3d} watched x 100 candidates  "
+          f"{(time.perf_counter() - start):8.3f} ms per request")
+
+
+if __name__ == "__main__":
+    main()
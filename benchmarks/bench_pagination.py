@@ -0,0 +1,103 @@
+"""Deep pages of a mix's activity history: OFFSET vs. keyset cursor, and
+the whole history as one response vs. streamed NDJSON.
+
+    python -m benchmarks.bench_pagination --events 200000
+    DATABASE_URL=postgresql://... python -m benchmarks.bench_pagination
+
+Uses a scratch SQLite file unless DATABASE_URL points at PostgreSQL.
+"""
+import argparse
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.database import Base
+from backend.models import Mix, UserActivity
+from backend.utils import activity
+from backend.utils.pagination import fetch_page, iter_rows
+
+
+def best_of(repeat: int, fn):
+    """(fastest of ``repeat`` timed calls, last result)."""
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=200_000)
+    parser.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args()
+
+    url = os.getenv("DATABASE_URL", "")
+    scratch = None
+    if not url.startswith("postgresql"):
+        scratch = tempfile.mktemp(suffix=".db")
+        url = f"sqlite:///{scratch}"
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+
+    mix_id = "bench-pagination"
+    start_time = datetime(2030, 1, 1)
+    keys = [UserActivity.timestamp, UserActivity.id]
+    try:
+        with Session() as db:
+            db.add(Mix(id=mix_id, title="bench", status="draft", quality_level="1"))
+            activity.insert_activity(db, [
+                activity.activity_row(f"user-{i % 1000}", mix_id, f"c{i % 5000}", "play",
+                                      timestamp=start_time + timedelta(seconds=i))
+                for i in range(args.events)])
+            db.commit()
+
+        with Session() as db:
+            query = db.query(UserActivity).filter(UserActivity.mix_id == mix_id)
+            for depth in (0.01, 0.5, 0.99):
+                offset = int(args.events * depth)
+                offset_seconds, page = best_of(3, lambda: (
+                    query.order_by(UserActivity.timestamp.desc(), UserActivity.id.desc())
+                    .offset(offset).limit(args.limit).all()))
+
+                # The cursor a client would hold after reading ``offset`` rows (untimed)
+                _, cursor = fetch_page(db, query, keys, None, offset)
+                db.expunge_all()
+                keyset_seconds, (keyset_page, _) = best_of(3, lambda: fetch_page(db, query, keys, cursor, args.limit))
+                assert [r.id for r in keyset_page] == [r.id for r in page]
+                print(f"page at {depth:4.0%}  OFFSET {offset_seconds * 1000:7.1f} ms   "
+                      f"keyset {keyset_seconds * 1000:7.1f} ms")
+                db.expunge_all()
+
+        for name, read in (("streamed pages", lambda db, q: sum(1 for _ in iter_rows(db, q, keys, None))),
+                           (".all()", lambda db, q: len(q.order_by(UserActivity.timestamp.desc()).all()))):
+            with Session() as db:
+                query = db.query(UserActivity).filter(UserActivity.mix_id == mix_id)
+                tracemalloc.start()
+                start = time.perf_counter()
+                rows = read(db, query)
+                seconds = time.perf_counter() - start
+                peak_mb = tracemalloc.get_traced_memory()[1] / 1e6
+                tracemalloc.stop()
+            print(f"{name:15s} {rows:,d} rows  {seconds:6.2f}s  peak Python heap {peak_mb:7.1f} MB")
+    finally:
+        with Session() as db:
+            db.query(UserActivity).filter(UserActivity.mix_id == mix_id).delete()
+            db.query(Mix).filter(Mix.id == mix_id).delete()
+            db.commit()
+        engine.dispose()
+        if scratch:
+            os.remove(scratch)
+
+
+if __name__ == "__main__":
+    main()
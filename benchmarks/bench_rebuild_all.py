@@ -0,0 +1,93 @@
+"""Time `rebuild-all` serially vs. fanned out over worker processes.
+
+    python -m benchmarks.bench_rebuild_all --mixes 8 --rows 20000 --workers 4
+    DATABASE_URL=postgresql://... python -m benchmarks.bench_rebuild_all
+
+Writes synthetic mappings/ + uploads/ into a scratch directory and uses a
+scratch SQLite file unless DATABASE_URL points at PostgreSQL (SQLite
+serialises the workers' writes). Each configuration starts from empty
+catalogs; a final run with nothing changed shows the skip path.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+MAPPINGS = {"content_id": "content_id", "title": "title", "description": "description",
+            "image_url": "image_url", "tags": "tags"}
+
+
+def reset(mix_ids):
+    from backend.database import SessionLocal
+    from backend.models import Embedding, Mix, MixContent
+
+    with SessionLocal() as db:
+        for model in (Embedding, MixContent):
+            db.query(model).filter(model.mix_id.in_(mix_ids)).delete(synchronize_session=False)
+        db.query(Mix).filter(Mix.id.in_(mix_ids)).update({"ingest_hash": None}, synchronize_session=False)
+        db.commit()
+
+
+def run(label: str, workers: int) -> None:
+    from backend import settings
+    from backend.database import SessionLocal
+    from backend.mixes.map_fields import rebuild_all_mixes
+
+    settings.REBUILD_WORKERS = workers
+    with SessionLocal() as db:
+        start = time.perf_counter()
+        result = rebuild_all_mixes(False, db)
+        seconds = time.perf_counter() - start
+    per_mix = [r["seconds"] for r in result["results"].values() if "seconds" in r]
+    mean = sum(per_mix) / len(per_mix) if per_mix else 0.0
+    print(f"{label:18s} workers={result['workers']}  rebuilt={result['rebuilt']:>3d}  "
+          f"total {seconds:7.2f}s  mean per mix {mean:6.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mixes", type=int, default=8)
+    parser.add_argument("--rows", type=int, default=20_000)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix="bench-rebuild-")
+    if not os.getenv("DATABASE_URL", "").startswith("postgresql"):
+        # Set before backend.database is first imported; worker processes inherit it
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(scratch, 'bench.db')}"
+
+    from backend.database import Base, SessionLocal, engine
+    from backend.models import Mix
+    from backend.paths import mix_neighbors_path, mix_tags_path
+    from benchmarks.bench_bulk_load import synthetic_catalog
+
+    Base.metadata.create_all(engine)
+    os.chdir(scratch)
+    os.makedirs("mappings")
+    os.makedirs("uploads")
+    mix_ids = [f"bench-rebuild-{i}" for i in range(args.mixes)]
+    with SessionLocal() as db:
+        for mix_id in mix_ids:
+            db.add(Mix(id=mix_id, title=mix_id, status="draft", quality_level="1"))
+        db.commit()
+    for mix_id in mix_ids:
+        synthetic_catalog(args.rows).to_csv(os.path.join("uploads", f"{mix_id}.csv"), index=False)
+        with open(os.path.join("mappings", f"{mix_id}.json"), "w") as f:
+            json.dump({"mix_id": mix_id, "mappings": MAPPINGS}, f)
+
+    try:
+        run("serial", 0)
+        reset(mix_ids)
+        run("process pool", args.workers)
+        run("unchanged (skip)", args.workers)
+    finally:
+        reset(mix_ids)
+        for mix_id in mix_ids:
+            for path in (mix_neighbors_path(mix_id, "tfidf"), mix_tags_path(mix_id)):
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Business-rule re-rankers at serving sizes: MMR (`diversity_weight`) over
+dense and sparse feature rows, and the weighted sample keys behind
+`random_sample`.
+
+    python -m benchmarks.bench_rerank --items 20000 --candidates 500 --top-k 100
+
+Candidates are a random subset of a synthetic catalog, sorted by score as
+they reach the rules; everything stays in memory (no DB).
+"""
+import argparse
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+from backend.utils.rerank import mmr_order, weighted_sample_keys
+from backend.utils.scoring import l2_normalize
+
+
+def best_of(repeat: int, fn) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=20_000)
+    parser.add_argument("--candidates", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=100)
+    parser.add_argument("--dim", type=int, default=384, help="dense (sentence embedding) width")
+    parser.add_argument("--vocabulary", type=int, default=20_000, help="sparse (TF-IDF) width")
+    parser.add_argument("--diversity", type=float, default=0.5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    dense = l2_normalize(rng.standard_normal((args.items, args.dim)).astype(np.float32))
+    sparse = l2_normalize(sp.random(args.items, args.vocabulary, density=30 / args.vocabulary, format="csr",
+                                    dtype=np.float32, random_state=0))
+    rows = rng.choice(args.items, args.candidates, replace=False)
+    scores = np.sort(rng.random(args.candidates))[::-1]
+
+    for name, matrix in ((f"dense {args.dim}-d", dense), (f"sparse {args.vocabulary:,d} cols", sparse)):
+        seconds = best_of(5, lambda: mmr_order(matrix, rows, scores, args.top_k, args.diversity))
+        print(f"mmr       {name:<20s} {args.candidates} candidates, {args.top_k} picks   {seconds * 1000:8.2f} ms")
+
+    sample_rng = np.random.default_rng(1)
+    seconds = best_of(5, lambda: np.argsort(-weighted_sample_keys(scores, sample_rng), kind="stable"))
+    print(f"sample    {args.candidates} candidates (keys + sort)   {seconds * 1000:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Cold catalog load (`prepare_frame(load_mix_frame(...))`) from the DB vs.
+from the columnar snapshot written at ingest.
+
+    python -m benchmarks.bench_snapshot_load --rows 100000
+    DATABASE_URL=postgresql://... python -m benchmarks.bench_snapshot_load
+
+Uses a scratch SQLite file unless DATABASE_URL points at PostgreSQL. The
+Arrow snapshot is only timed when pyarrow is installed. Best of --repeat.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import pandas as pd
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.database import Base
+from backend.models import Mix, MixContent
+from backend.utils import catalog_snapshot, featurize
+from backend.utils.bulk_load import sync_mix_content
+from benchmarks.bench_bulk_load import synthetic_catalog
+
+
+def load_orm_objects(db, mix_id: str) -> pd.DataFrame:
+    """The previous DB path: one ORM object and one dict per row."""
+    rows = db.query(MixContent).filter(MixContent.mix_id == mix_id).all()
+    return pd.DataFrame([{"content_id": r.content_id, "title": r.title,
+                          "description": r.description, "tags": r.tags} for r in rows])
+
+
+def best_of(repeat: int, fn) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    url = os.getenv("DATABASE_URL", "")
+    scratch = tempfile.mkdtemp(prefix="bench-snapshot-")
+    if not url.startswith("postgresql"):
+        url = f"sqlite:///{os.path.join(scratch, 'bench.db')}"
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+
+    mix_id = "bench-snapshot"
+    snapshot_path = os.path.join(scratch, "catalog.snapshot")
+    featurize.mix_snapshot_path = lambda _mix_id: snapshot_path
+    pyarrow = catalog_snapshot.pa
+    try:
+        with Session() as db:
+            db.add(Mix(id=mix_id, title="bench", status="draft", quality_level="1"))
+            catalog = synthetic_catalog(args.rows)
+            sync_mix_content(db, mix_id, lambda: [catalog])
+            db.commit()
+
+            frame = featurize.prepare_frame(load_orm_objects(db, mix_id))
+            timings = [("ORM objects", None, lambda: featurize.prepare_frame(load_orm_objects(db, mix_id))),
+                       ("column query", None, lambda: featurize.prepare_frame(featurize.load_mix_frame(db, mix_id)))]
+            for fmt, pa in (("npz", None), ("arrow", pyarrow)):
+                if fmt == "npz" or pa is not None:
+                    timings.append((f"snapshot ({fmt})", pa,
+                                    lambda: featurize.prepare_frame(featurize.load_mix_frame(db, mix_id))))
+
+            for name, pa, load in timings:
+                size = ""
+                if name.startswith("snapshot"):
+                    catalog_snapshot.pa = pa
+                    catalog_snapshot.write_snapshot(snapshot_path, frame, featurize.get_content_version(db, mix_id))
+                    size = f"  ({os.path.getsize(snapshot_path) / 1e6:.1f} MB file)"
+                seconds = best_of(args.repeat, load)
+                print(f"{name:16s} {args.rows:>9,d} rows  {seconds:7.3f}s{size}")
+    finally:
+        catalog_snapshot.pa = pyarrow
+        with Session() as db:
+            db.query(MixContent).filter(MixContent.mix_id == mix_id).delete()
+            db.query(Mix).filter(Mix.id == mix_id).delete()
+            db.commit()
+        engine.dispose()
+        for name in os.listdir(scratch):
+            os.remove(os.path.join(scratch, name))
+        os.rmdir(scratch)
+
+
+if __name__ == "__main__":
+    main()
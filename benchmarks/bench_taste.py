@@ -0,0 +1,126 @@
+"""Level 2 personalisation as a user's history grows: re-reading the history
+and gathering a similarity row per watched item vs. the stored taste vector.
+
+    python -m benchmarks.bench_taste --items 20000 --history 10 100 1000 5000
+    DATABASE_URL=postgresql://... python -m benchmarks.bench_taste
+
+Times the user-dependent part of a request (loading what the user watched
+and computing the collaborative boost of the seed's candidates), and the
+cost of folding one logged event into a stored profile. Uses a scratch
+SQLite file unless DATABASE_URL points at PostgreSQL.
+"""
+import argparse
+import gc
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.database import Base
+from backend.models import Mix, TasteProfile, UserActivity
+from backend.utils import activity
+from backend.utils.featurize import build_features, fit_tfidf
+from backend.utils.model_cache import model_cache
+from backend.utils.scoring import similarity_rows, top_k_indices, vector_scores
+from backend.utils.taste import get_user_tastes
+
+
+def best_of(repeat: int, fn):
+    """(fastest of ``repeat`` timed calls, last result)."""
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def history_boost(db, mix_id, user_id, features, candidates):
+    """The previous path: every event of the user, one similarity row per watched item."""
+    history = [cid for (cid,) in db.query(UserActivity.content_id)
+               .filter(UserActivity.mix_id == mix_id, UserActivity.user_id == user_id)
+               .order_by(UserActivity.timestamp.desc())]
+    watched = set(history)
+    rows = sorted({features.index[cid] for cid in watched if cid in features.index})
+    sims = similarity_rows(features.matrix, rows)
+    return sims[:, candidates].sum(axis=0) / len(watched)
+
+
+def taste_boost(db, mix_id, user_id, features, candidates):
+    taste = get_user_tastes(db, mix_id, features, "tfidf", [user_id])[user_id]
+    return vector_scores(features.matrix, candidates, taste.mean())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=20_000)
+    parser.add_argument("--history", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    args = parser.parse_args()
+
+    url = os.getenv("DATABASE_URL", "")
+    scratch = None
+    if not url.startswith("postgresql"):
+        scratch = tempfile.mktemp(suffix=".db")
+        url = f"sqlite:///{scratch}"
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+
+    rng = np.random.default_rng(0)
+    vocabulary = np.array([f"w{i}" for i in range(5000)])
+    texts = [" ".join(rng.choice(vocabulary, 20)) for _ in range(args.items)]
+    df = pd.DataFrame({"content_id": [f"c{i}" for i in range(args.items)], "title": texts})
+    features = build_features(df, fit_tfidf(texts))
+    candidates = top_k_indices(similarity_rows(features.matrix, [0])[0], 100, exclude=[0])
+
+    mix_id = "bench-taste"
+    start_time = datetime(2030, 1, 1)
+    try:
+        with Session() as db:
+            db.add(Mix(id=mix_id, title="bench", status="draft", quality_level="2"))
+            db.commit()
+            # Logging events creates and folds profiles in the mix's features; the
+            # bench catalog isn't in the DB, so they come from the model cache
+            model_cache.put((mix_id, "tfidf", 0), features, features.nbytes)
+            for n in args.history:
+                user_id = f"user-{n}"
+                items = rng.integers(1, args.items, n)
+                activity.insert_activity(db, [
+                    activity.activity_row(user_id, mix_id, f"c{i}", "play", timestamp=start_time + timedelta(seconds=s))
+                    for s, i in enumerate(items)])
+                db.commit()
+
+        for n in args.history:
+            user_id = f"user-{n}"
+            with Session() as db:
+                history_seconds, expected = best_of(5, lambda: history_boost(db, mix_id, user_id, features, candidates))
+                taste_boost(db, mix_id, user_id, features, candidates)  # warm-up (the profile was stored on insert)
+                taste_seconds, boost = best_of(5, lambda: taste_boost(db, mix_id, user_id, features, candidates))
+                assert np.allclose(boost, expected, atol=1e-5)
+
+                def log_one():
+                    activity.insert_activity(db, [activity.activity_row(user_id, mix_id, "c0", "play")])
+                    db.commit()
+                fold_seconds, _ = best_of(5, log_one)
+            print(f"history {n:>6,d} events   history + similarity rows {history_seconds * 1000:8.2f} ms   "
+                  f"taste vector {taste_seconds * 1000:6.2f} ms   log event + fold {fold_seconds * 1000:6.2f} ms")
+    finally:
+        model_cache.invalidate(mix_id)
+        with Session() as db:
+            db.query(TasteProfile).filter(TasteProfile.mix_id == mix_id).delete()
+            db.query(UserActivity).filter(UserActivity.mix_id == mix_id).delete()
+            db.query(Mix).filter(Mix.id == mix_id).delete()
+            db.commit()
+        engine.dispose()
+        if scratch:
+            os.remove(scratch)
+
+
+if __name__ == "__main__":
+    main()
@@ -14,11 +14,17 @@ from backend.mixes import list_mixes
 from backend.mixes import business_rules
 from backend.mixes import simulate_watch_data
 from backend.mixes import get_mix
+from backend.mixes import jobs
+from backend.mixes import train_model
 from backend.routes import users
 from backend.routes import user_activity
+from backend.routes import metrics
 
 # Import database setup
-from backend.database import Base, engine
+from backend.database import Base, SessionLocal, engine
+from backend.utils.activity import shutdown_activity_buffer
+from backend.utils.executors import shutdown_executors
+from backend.utils.jobs import fail_interrupted_jobs, shutdown_jobs, start_job_heartbeat
 from backend.routes import user_activity
 
 
@@ -39,6 +45,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],  # keyset pagination of the listing endpoints
 )
 
 
@@ -58,11 +65,14 @@ app.include_router(list_mixes.router, prefix="/mixes")
 app.include_router(get_mix.router, prefix="/mixes")
 app.include_router(business_rules.router, prefix="/mixes")
 app.include_router(simulate_watch_data.router, prefix="/mixes")
+app.include_router(jobs.router, prefix="/mixes")
+app.include_router(train_model.router, prefix="/mixes")
 
 
 # Register the /users routes with the FastAPI app
 app.include_router(users.router)
 app.include_router(user_activity.router)
+app.include_router(metrics.router)
 
 # Startup event to create tables after app is ready
 @app.on_event("startup")
@@ -75,6 +85,25 @@ async def startup_event():
         print(f"Warning: Could not create tables: {e}")
         # Don't fail startup if tables already exist
 
+    # Jobs a previous incarnation of this process (or a dead one) left queued /
+    # running will never finish; sibling workers' jobs are left alone
+    db = SessionLocal()
+    try:
+        fail_interrupted_jobs(db)
+    except Exception as e:
+        print(f"Warning: Could not clean up interrupted jobs: {e}")
+    finally:
+        db.close()
+    start_job_heartbeat()
+
+
+@app.on_event("shutdown")
+def shutdown_event():
+    """Flush buffered activity, stop the job runner, then the executor pools used for blocking / CPU-bound work"""
+    shutdown_activity_buffer()
+    shutdown_jobs()
+    shutdown_executors()
+
 for route in app.routes:
     print(route.path)
 
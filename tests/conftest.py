@@ -1,11 +1,21 @@
 import os
 import pytest
+
+# Run featurization inline instead of in worker processes during tests
+os.environ.setdefault("CPU_POOL_WORKERS", "0")
+# Run background jobs inline so endpoints return after the job finished
+os.environ.setdefault("JOB_WORKERS", "0")
+# Rebuild mixes one at a time in-process (worker processes can't see the in-memory DB)
+os.environ.setdefault("REBUILD_WORKERS", "0")
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 
 from backend.database import Base, get_db
+from backend.utils import activity, jobs
+from backend.utils.model_cache import model_cache
+from backend.utils.response_cache import response_cache
 from main import app
 
 # Create in-memory SQLite for testing
@@ -17,11 +27,17 @@ engine = create_engine(
     poolclass=StaticPool  # Ensures same connection across threads
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Background jobs open their own sessions
+jobs.session_factory = TestingSessionLocal
+activity.session_factory = TestingSessionLocal
 
 @pytest.fixture(scope="function")
 def test_db():
     """Create a fresh database for each test."""
     Base.metadata.create_all(bind=engine)  # Create tables
+    # Process-wide caches are keyed by mix id, which repeats across tests
+    model_cache.clear()
+    response_cache.clear()
     try:
         db = TestingSessionLocal()
         yield db
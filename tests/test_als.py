@@ -0,0 +1,97 @@
+"""Tests for the Level 4 implicit ALS trainer and serving path."""
+import numpy as np
+import scipy.sparse as sp
+import pytest
+
+from backend import models, settings
+from backend.utils import als
+from tests.test_recommendations import seed_mix
+
+
+def test_solve_matches_per_user_least_squares(monkeypatch):
+    rng = np.random.default_rng(0)
+    weights = (sp.random(40, 25, density=0.15, random_state=1, format="csr", dtype=np.float32) * 40).tocsr()
+    fixed = rng.standard_normal((25, 6)).astype(np.float32)
+
+    expected = np.zeros((40, 6))
+    for u in range(40):
+        c = 1 + weights[u].toarray().ravel()
+        p = (c > 1).astype(float)
+        if p.any():
+            a = fixed.T @ (c[:, None] * fixed) + 0.1 * np.eye(6)
+            expected[u] = np.linalg.solve(a, fixed.T @ (c * p))
+
+    # One block, several blocks, and one row at a time
+    for block_floats in (2 ** 25, 6 * 6 * 7, 1):
+        monkeypatch.setattr(settings, "ALS_BLOCK_FLOATS", block_floats)
+        assert np.allclose(als._solve(fixed, weights, 0.1), expected, atol=1e-4)
+
+
+def test_als_ranks_items_of_similar_users_first():
+    # Two groups of users, each watching all but one item of its half of the catalog
+    rows, cols = [], []
+    for u in range(20):
+        group = range(0, 10) if u < 10 else range(10, 20)
+        for i in group:
+            if i != u:
+                rows.append(u)
+                cols.append(i)
+    counts = sp.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, cols)), shape=(20, 20))
+    user_factors, item_factors = als.train_als(counts, factors=2, iterations=10)
+    assert user_factors.dtype == item_factors.dtype == np.float32
+
+    scores = user_factors @ item_factors.T
+    scores[counts.toarray() > 0] = -np.inf
+    assert scores.argmax(axis=1).tolist() == list(range(20))
+
+
+@pytest.fixture
+def factors_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(als, "mix_factors_path", lambda mix_id: tmp_path / "factors" / f"{mix_id}.als.npz")
+    return tmp_path / "factors"
+
+
+def test_level4_trains_in_background_and_serves_factors(client, test_db, factors_dir):
+    mix_id = seed_mix(test_db, mix_id="mix-als", quality_level="4")
+    watched = {"u1": ["m1", "m2"], "u2": ["m1", "m2", "m5"], "u3": ["m2", "m5"],
+               "u4": ["m3", "m4"], "u5": ["m3", "m4"]}
+    client.post("/user-activity/batch", json=[{"user_id": u, "mix_id": mix_id, "content_id": c, "event_type": "watched"}
+                                              for u, items in watched.items() for c in items])
+
+    untrained = client.get("/mixes/generate-recommendations", params={"mix_id": mix_id, "user_id": "u1"}).json()
+    assert untrained["method"] == "Hybrid ML"
+
+    response = client.post(f"/mixes/train-als/{mix_id}", params={"factors": 3, "iterations": 8})
+    job = client.get(f"/mixes/jobs/{response.json()['job_id']}").json()
+    assert job["status"] == "succeeded", job
+    assert job["result"]["users"] == 5 and job["result"]["items"] == 5 and job["result"]["factors"] == 3
+    assert [s["name"] for s in job["stages"]] == ["load_activity", "train", "write"]
+    assert (factors_dir / f"{mix_id}.als.npz").exists()
+
+    result = client.get("/mixes/generate-recommendations", params={"mix_id": mix_id, "user_id": "u1"}).json()
+    assert result["based_on"] == "user_factors" and result["method"] == "Matrix Factorization (ALS)"
+    ids = [r["content_id"] for r in result["recommendations"]]
+    assert ids[0] == "m5" and not {"m1", "m2"} & set(ids)
+
+    # Seeded requests and users the model doesn't know use the Level 2 blend
+    seeded = client.get("/mixes/generate-recommendations",
+                        params={"mix_id": mix_id, "user_id": "u1", "content_id": "m3"}).json()
+    assert seeded["based_on"] == "m3" and seeded["method"] == "Hybrid ML"
+    stranger = client.get("/mixes/generate-recommendations", params={"mix_id": mix_id, "user_id": "nobody"}).json()
+    assert stranger["method"] == "Hybrid ML"
+
+    batch = client.post("/mixes/generate-recommendations/batch", json={
+        "mix_id": mix_id, "requests": [{"user_id": "u1"}, {"user_id": "nobody"}, {"user_id": "u4", "content_id": "m1"}],
+    }).json()["results"]
+    assert batch[0]["recommendations"] == result["recommendations"]
+    assert batch[1]["method"] == "Hybrid ML"
+    assert batch[2]["based_on"] == "m1"
+
+
+def test_train_als_rejects_unknown_mix_and_empty_activity(client, test_db, factors_dir):
+    assert client.post("/mixes/train-als/nope").status_code == 404
+    mix_id = seed_mix(test_db, mix_id="mix-als-empty", quality_level="4")
+    job_id = client.post(f"/mixes/train-als/{mix_id}").json()["job_id"]
+    job = client.get(f"/mixes/jobs/{job_id}").json()
+    assert job["status"] == "failed" and "No activity" in job["error"]
+    assert test_db.get(models.Mix, mix_id).quality_level == "4"
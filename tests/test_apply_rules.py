@@ -0,0 +1,108 @@
+from backend.utils.apply_rules import apply_plan, compile_rules, rules_version
+from backend.utils.featurize import split_tags
+from backend.utils.tag_index import build_tag_index
+
+ITEMS = [
+    {"content_id": "a", "tags": "sci-fi,action", "score": 0.9},
+    {"content_id": "b", "tags": "sci-fi", "score": 0.8},
+    {"content_id": "c", "tags": "sci-fi,comedy", "score": 0.7},
+    {"content_id": "d", "tags": "action-comedy", "score": 0.6},
+    {"content_id": "e", "tags": "", "score": 0.5},
+    {"content_id": "f", "tags": "drama", "score": 0.4},
+]
+
+
+def run(rules, items=ITEMS):
+    index = build_tag_index([r["content_id"] for r in items], [split_tags(r["tags"]) for r in items])
+    return apply_plan(compile_rules(rules, index), index, items)
+
+
+def ids(records):
+    return [r["content_id"] for r in records]
+
+
+def test_tag_rules_match_whole_tags():
+    # "action" must not match "action-comedy" the way substring matching did
+    assert ids(run({"exclude_tags": ["action"]})) == ["b", "c", "d", "e", "f"]
+    assert ids(run({"include_tags": ["comedy", "unknown"]})) == ["c"]
+    assert ids(run({"include_tags": ["unknown"]})) == []
+
+
+def test_cap_boost_pin_and_limit():
+    result = run({"max_from_same_tag": 1, "boost_tags": ["drama"], "pinned_content_ids": ["f"], "max_results": 4})
+    # b has no room left under "sci-fi"; c counts against "comedy" instead
+    assert ids(result) == ["f", "a", "c", "d"]
+    assert result[0]["score"] == 0.4 * 1.2
+    assert ITEMS[5]["score"] == 0.4  # records are not mutated
+
+
+def test_rules_version_ignores_key_order():
+    assert rules_version({"a": 1, "b": [1, 2]}) == rules_version({"b": [1, 2], "a": 1})
+    assert rules_version({"a": 1}) != rules_version({"a": 2})
+
+
+def test_mmr_matches_pairwise_greedy():
+    import numpy as np
+    from backend.utils.rerank import mmr_order
+    from backend.utils.scoring import l2_normalize
+
+    rng = np.random.default_rng(0)
+    matrix = l2_normalize(rng.standard_normal((40, 8)))
+    rows = rng.choice(40, 25, replace=False)
+    relevance = np.sort(rng.random(25))[::-1]
+
+    gram = matrix[rows] @ matrix[rows].T
+    expected, max_sim = [], np.zeros(25)
+    for _ in range(10):
+        gain = relevance - 0.7 * max_sim
+        gain[expected] = -np.inf
+        pick = int(np.argmax(gain))
+        expected.append(pick)
+        max_sim = np.maximum(max_sim, gram[pick])
+
+    order = mmr_order(matrix, rows, relevance, 10, 0.7)
+    assert order[:10].tolist() == expected
+    assert sorted(order.tolist()) == list(range(25))
+
+
+def test_random_sample_is_seeded():
+    rules = {"random_sample": True, "random_seed": 7, "max_from_same_tag": 10}
+    first = ids(run(rules))
+    assert ids(run(rules)) == first
+    assert sorted(first) == sorted(ids(run({"max_from_same_tag": 10})))
+
+
+def test_tag_index_round_trip(tmp_path):
+    from backend.utils.tag_index import read_tag_index, write_tag_index
+
+    index = build_tag_index([r["content_id"] for r in ITEMS], [split_tags(r["tags"]) for r in ITEMS])
+    write_tag_index(tmp_path / "tags.npz", index, version=4)
+    loaded, version = read_tag_index(tmp_path / "tags.npz")
+    assert version == 4
+    assert loaded.vocab == index.vocab and loaded.item_tags == index.item_tags
+    assert (loaded.postings == index.postings).all()
+    assert loaded.any_tags(["comedy", "drama"]).tolist() == [False, False, True, False, False, True]
+
+
+def test_plan_cache_is_shared_across_threads():
+    from concurrent.futures import ThreadPoolExecutor
+
+    from backend.utils.apply_rules import get_rules_plan
+    from backend.utils.model_cache import MixFeatures
+
+    index = build_tag_index([r["content_id"] for r in ITEMS], [split_tags(r["tags"]) for r in ITEMS])
+    features = MixFeatures(df=None, matrix=None, index={}, tag_index=index, nbytes=1)
+    rule_sets = [{"max_results": n % 12} for n in range(400)]
+    with ThreadPoolExecutor(8) as pool:
+        plans = list(pool.map(lambda rules: get_rules_plan(None, "mix", rules, features)[0], rule_sets))
+    assert [plan.max_results for plan in plans] == [rules["max_results"] for rules in rule_sets]
+    assert len(index.plans) == index.plans.max_entries
+
+    # Least recently used plans are evicted first
+    first = get_rules_plan(None, "mix", {"max_results": 100}, features)[0]
+    for n in range(index.plans.max_entries - 1):
+        get_rules_plan(None, "mix", {"max_results": 200 + n}, features)
+    assert get_rules_plan(None, "mix", {"max_results": 100}, features)[0] is first
+    get_rules_plan(None, "mix", {"max_results": 300}, features)
+    assert get_rules_plan(None, "mix", {"max_results": 100}, features)[0] is first
+    assert index.plans.get(rules_version({"max_results": 200})) is None
@@ -1,4 +1,5 @@
 """Test suite for key API endpoints."""
+import os
 
 from fastapi.testclient import TestClient
 import pytest
@@ -36,4 +37,54 @@ def test_list_users(client):
     """Test GET /users."""
     response = client.get("/users")
     assert response.status_code == 200
-    assert isinstance(response.json(), list)
\ No newline at end of file
+    assert isinstance(response.json(), list)
+
+def test_upload_content_streams_and_detects_unchanged(client, tmp_path, monkeypatch):
+    """Test POST /mixes/upload-content (chunked copy, hash, size limit)."""
+    import hashlib
+    from backend import settings
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(settings, "UPLOAD_CHUNK_BYTES", 7)
+    body = b"content_id,title\n1,Alpha\n2,Beta\n"
+    files = {"file": ("catalog.csv", body, "text/csv")}
+
+    first = client.post("/mixes/upload-content", data={"mix_id": "m1"}, files=files).json()
+    assert first["size_bytes"] == len(body)
+    assert first["sha256"] == hashlib.sha256(body).hexdigest()
+    assert first["unchanged"] is False
+    assert (tmp_path / "uploads" / "m1.csv").read_bytes() == body
+
+    again = client.post("/mixes/upload-content", data={"mix_id": "m1"}, files=files).json()
+    assert again["unchanged"] is True
+    assert client.post("/mixes/upload-content", files=files).status_code == 422
+
+    monkeypatch.setattr(settings, "UPLOAD_MAX_BYTES", 10)
+    response = client.post("/mixes/upload-content", data={"mix_id": "m1"}, files=files)
+    assert response.status_code == 413
+    assert (tmp_path / "uploads" / "m1.csv").read_bytes() == body
+    assert [p.name for p in (tmp_path / "uploads").iterdir() if p.suffix == ".part"] == []
+
+    # Rejected on Content-Length before the body is read
+    from backend.mixes import upload_content
+    monkeypatch.setattr(upload_content, "FORM_OVERHEAD_BYTES", 0)
+    assert client.post("/mixes/upload-content", data={"mix_id": "m1"}, files=files).status_code == 413
+
+
+def test_upload_hash_sidecar_ignored_when_it_does_not_describe_the_csv(client, tmp_path, monkeypatch):
+    """A sidecar left by an interrupted upload must not vouch for the old CSV."""
+    import hashlib
+    from backend.mixes.upload_content import csv_sha256, read_upload_hash, write_upload_hash
+
+    monkeypatch.chdir(tmp_path)
+    body = b"content_id,title\n1,Alpha\n"
+    client.post("/mixes/upload-content", data={"mix_id": "m1"}, files={"file": ("c.csv", body, "text/csv")})
+    csv_path = str(tmp_path / "uploads" / "m1.csv")
+    assert read_upload_hash(csv_path) == hashlib.sha256(body).hexdigest()
+
+    # Crash after the new sidecar was written but before the CSV was replaced
+    new = tmp_path / "new.part"
+    new.write_bytes(b"content_id,title\n1,Changed\n")
+    write_upload_hash(csv_path, "0" * 64, os.stat(new))
+    assert read_upload_hash(csv_path) is None
+    assert csv_sha256(csv_path) == hashlib.sha256(body).hexdigest()
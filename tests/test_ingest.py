@@ -0,0 +1,280 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from backend import models, settings
+from backend.mixes import map_fields
+from backend.utils import apply_rules, catalog_snapshot, featurize, jobs, neighbors
+from backend.utils.embeddings import TFIDF_MODEL_NAME, sparse_vector_from_bytes, vector_from_bytes
+
+CSV = (
+    "id,name,summary,img,genres\n"
+    "1,Space Saga,Rebels fight an empire,http://img/1.png,\"sci-fi,action\"\n"
+    "2,Star Voyage,A crew explores distant stars,,sci-fi\n"
+    "3,Laugh Out Loud,\"A family comedy, with a wedding\",http://img/3.png,comedy\n"
+)
+MAPPINGS = {"id": "content_id", "name": "title", "summary": "description", "img": "image_url", "genres": "tags"}
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Run ingest against a scratch uploads/, mappings/ and index directory."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(neighbors, "mix_neighbors_path", lambda mix_id, f: tmp_path / "neighbors" / f"{mix_id}.{f}.npz")
+    monkeypatch.setattr(apply_rules, "mix_tags_path", lambda mix_id: tmp_path / "tags" / f"{mix_id}.npz")
+    monkeypatch.setattr(featurize, "mix_snapshot_path", lambda mix_id: tmp_path / "snapshots" / f"{mix_id}.snapshot")
+    monkeypatch.setattr(featurize, "mix_ann_path", lambda mix_id, f: tmp_path / "ann" / f"{mix_id}.{f}.npz")
+    (tmp_path / "uploads").mkdir()
+    (tmp_path / "uploads" / "mix-csv.csv").write_text(CSV)
+    return tmp_path
+
+
+def test_map_fields_bulk_loads_content_and_embeddings(client, test_db, workdir, monkeypatch):
+    monkeypatch.setattr(settings, "BULK_INSERT_CHUNK_ROWS", 2)
+    test_db.add(models.Mix(id="mix-csv", title="CSV", status="draft", quality_level="1"))
+    test_db.commit()
+
+    response = client.post("/mixes/map-fields", json={"mix_id": "mix-csv", "mappings": MAPPINGS})
+    assert response.status_code == 200
+    job = client.get(f"/mixes/jobs/{response.json()['job_id']}").json()
+    assert job["status"] == "succeeded"
+    assert job["result"]["rows_inserted"] == 3
+
+    rows = {r.content_id: r for r in test_db.query(models.MixContent).filter_by(mix_id="mix-csv")}
+    assert sorted(rows) == ["1", "2", "3"]
+    assert rows["2"].image_url is None
+    assert rows["3"].description == "A family comedy, with a wedding"
+    assert rows["1"].tags == "sci-fi,action"
+
+    embeddings = test_db.query(models.Embedding).filter_by(mix_id="mix-csv", model_name=TFIDF_MODEL_NAME).all()
+    assert sorted(e.content_id for e in embeddings) == ["1", "2", "3"]
+    assert vector_from_bytes(embeddings[0].vector).ndim == 1
+
+    # Re-mapping replaces rather than duplicates
+    client.post("/mixes/map-fields", json={"mix_id": "mix-csv", "mappings": MAPPINGS})
+    assert test_db.query(models.MixContent).filter_by(mix_id="mix-csv").count() == 3
+    assert test_db.query(models.Embedding).filter_by(mix_id="mix-csv").count() == 3
+
+
+def test_remap_syncs_only_changed_rows(client, test_db, workdir):
+    test_db.add(models.Mix(id="mix-csv", title="CSV", status="draft", quality_level="1"))
+    test_db.commit()
+
+    def remap():
+        job_id = client.post("/mixes/map-fields", json={"mix_id": "mix-csv", "mappings": MAPPINGS}).json()["job_id"]
+        return client.get(f"/mixes/jobs/{job_id}").json()
+
+    remap()
+    ids = {r.content_id: r.id for r in test_db.query(models.MixContent).filter_by(mix_id="mix-csv")}
+    version = test_db.get(models.Mix, "mix-csv").content_version
+
+    # Same CSV again: nothing is rewritten, re-embedded or invalidated
+    job = remap()
+    assert job["result"]["rows_unchanged"] == 3
+    assert [s["name"] for s in job["stages"]] == ["mapping", "sync_rows"]
+    test_db.expire_all()
+    assert test_db.get(models.Mix, "mix-csv").content_version == version
+
+    # Edit item 2, drop item 3, add item 4
+    (workdir / "uploads" / "mix-csv.csv").write_text(
+        "id,name,summary,img,genres\n"
+        "1,Space Saga,Rebels fight an empire,http://img/1.png,\"sci-fi,action\"\n"
+        "2,Star Voyage,A crew explores a black hole,,sci-fi\n"
+        "4,Deep Sea,Divers find a wreck,,documentary\n"
+    )
+    result = remap()["result"]
+    assert (result["rows_inserted"], result["rows_updated"], result["rows_deleted"], result["rows_unchanged"]) == (1, 1, 1, 1)
+
+    test_db.expire_all()
+    rows = {r.content_id: r for r in test_db.query(models.MixContent).filter_by(mix_id="mix-csv")}
+    assert sorted(rows) == ["1", "2", "4"]
+    assert rows["1"].id == ids["1"] and rows["2"].id == ids["2"]
+    assert rows["2"].description == "A crew explores a black hole"
+    assert test_db.get(models.Mix, "mix-csv").content_version > version
+    embeddings = test_db.query(models.Embedding).filter_by(mix_id="mix-csv", model_name=TFIDF_MODEL_NAME).all()
+    assert sorted(e.content_id for e in embeddings) == ["1", "2", "4"]
+
+
+def test_rebuild_all_skips_unchanged_mixes(client, test_db, workdir):
+    test_db.add(models.Mix(id="mix-csv", title="CSV", status="draft", quality_level="1"))
+    test_db.commit()
+    client.post("/mixes/map-fields", json={"mix_id": "mix-csv", "mappings": MAPPINGS})
+
+    def rebuild(**params):
+        job_id = client.post("/mixes/rebuild-all", params=params).json()["job_id"]
+        return client.get(f"/mixes/jobs/{job_id}").json()["result"]
+
+    result = rebuild()
+    assert result["results"] == {"mix-csv": {"skipped": "unchanged"}}
+    assert result["rebuilt"] == 0
+
+    # An edited CSV (no upload sidecar) is detected by hashing the file
+    with open(workdir / "uploads" / "mix-csv.csv", "a") as f:
+        f.write("4,Deep Sea,Divers find a wreck,,documentary\n")
+    result = rebuild()["results"]["mix-csv"]
+    assert (result["rows_inserted"], result["rows_unchanged"]) == (1, 3)
+    assert result["seconds"] >= 0
+    assert "sync_rows" in [s["name"] for s in result["stages"]]
+    assert test_db.query(models.MixContent).filter_by(mix_id="mix-csv").count() == 4
+
+    assert rebuild()["results"]["mix-csv"] == {"skipped": "unchanged"}
+    assert rebuild(force="true")["results"]["mix-csv"]["content_changed"] is False
+
+
+def test_map_fields_job_reports_stages_and_failures(client, test_db, workdir, monkeypatch):
+    test_db.add(models.Mix(id="mix-csv", title="CSV", status="draft", quality_level="3"))
+    test_db.commit()
+
+    # Missing required fields are still rejected synchronously
+    response = client.post("/mixes/map-fields", json={"mix_id": "mix-csv", "mappings": {"id": "content_id"}})
+    assert response.status_code == 400
+
+    def broken_encoder(*args, **kwargs):
+        raise RuntimeError("model unavailable")
+
+    monkeypatch.setattr(map_fields, "sync_sentence_embeddings", broken_encoder)
+    job_id = client.post("/mixes/map-fields", json={"mix_id": "mix-csv", "mappings": MAPPINGS}).json()["job_id"]
+    job = client.get(f"/mixes/jobs/{job_id}").json()
+
+    assert job["status"] == "failed"
+    assert "model unavailable" in job["error"]
+    assert [s["name"] for s in job["stages"]] == [
+        "mapping", "sync_rows", "tfidf_embeddings", "sentence_embeddings", "indexes"]
+    assert all(s["seconds"] >= 0 for s in job["stages"])
+    assert job["duration_seconds"] >= 0
+    # Rows and TF-IDF vectors were committed before the sentence stage failed
+    assert test_db.query(models.MixContent).filter_by(mix_id="mix-csv").count() == 3
+
+    assert client.get("/mixes/jobs/no-such-job").status_code == 404
+
+
+def test_jobs_run_in_background_pool(client, test_db, workdir, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_WORKERS", 1)
+    test_db.add(models.Mix(id="mix-csv", title="CSV", status="draft", quality_level="1"))
+    test_db.commit()
+    try:
+        response = client.post("/mixes/map-fields", json={"mix_id": "mix-csv", "mappings": MAPPINGS})
+        assert response.json()["status"] == "queued"
+    finally:
+        # Tests share one SQLite connection, so wait for the job instead of polling
+        jobs.shutdown_jobs()
+    job = client.get(f"/mixes/jobs/{response.json()['job_id']}").json()
+    assert job["status"] == "succeeded", job["error"]
+    assert job["result"]["embeddings_generated"] is True
+
+
+def test_fail_interrupted_jobs_spares_live_owners(test_db, monkeypatch):
+    import os
+    import time
+
+    me = jobs.job_owner()
+    host, pid, _ = me.rsplit(":", 2)
+    now = time.time()
+    owners = {
+        "mine": (me, now),
+        "previous-incarnation": (f"{host}:{pid}:0ldb00t", now),
+        "sibling": (f"{host}:{os.getppid()}:abc", now),
+        "other-host": ("elsewhere:1:abc", now),
+        "lease-expired": ("elsewhere:2:abc", now - settings.JOB_LEASE_SECONDS - 1),
+        "legacy": (None, None),
+    }
+    for job_id, (owner, heartbeat_at) in owners.items():
+        test_db.add(models.IngestJob(id=job_id, kind="map_fields", status="running",
+                                     owner=owner, heartbeat_at=heartbeat_at))
+    test_db.commit()
+
+    assert jobs.fail_interrupted_jobs(test_db) == 3
+    status = {j.id: j.status for j in test_db.query(models.IngestJob)}
+    assert {j for j, s in status.items() if s == "failed"} == {"previous-incarnation", "lease-expired", "legacy"}
+
+    # The heartbeat keeps this process's jobs alive
+    test_db.query(models.IngestJob).filter_by(id="mine").update({"heartbeat_at": 0.0})
+    test_db.commit()
+    assert jobs.renew_job_leases(test_db) == 1
+    assert jobs.fail_interrupted_jobs(test_db) == 0
+
+
+def test_serial_rebuild_all_takes_the_mix_lock(workdir, monkeypatch):
+    monkeypatch.setattr(map_fields, "rebuild_mix_worker",
+                        lambda mix_id, mappings: {"locked": jobs.mix_lock(mix_id).locked()})
+    results = dict(map_fields.run_rebuilds([("a", MAPPINGS), ("b", MAPPINGS)], workers=0))
+    assert results == {"a": {"locked": True}, "b": {"locked": True}}
+    assert not jobs.mix_lock("a").locked()
+
+
+def test_chunked_ingest_streams_rows_and_sparse_tfidf(client, test_db, workdir, monkeypatch):
+    monkeypatch.setattr(settings, "CSV_CHUNK_ROWS", 2)
+    test_db.add(models.Mix(id="mix-csv", title="CSV", status="draft", quality_level="1"))
+    test_db.commit()
+    csv = CSV + "007,Deep Sea,Divers find a wreck,,documentary\n"
+    (workdir / "uploads" / "mix-csv.csv").write_text(csv)
+
+    job_id = client.post("/mixes/map-fields", json={"mix_id": "mix-csv", "mappings": MAPPINGS}).json()["job_id"]
+    assert client.get(f"/mixes/jobs/{job_id}").json()["result"]["rows_inserted"] == 4
+    # Ids are read as text, never re-typed per chunk
+    assert {r.content_id for r in test_db.query(models.MixContent)} == {"1", "2", "3", "007"}
+
+    # Stored vectors are the streamed hashing TF-IDF, which matches a
+    # vocabulary TF-IDF fit on the whole catalog
+    texts = ["Space Saga Rebels fight an empire", "Star Voyage A crew explores distant stars",
+             "Laugh Out Loud A family comedy, with a wedding", "Deep Sea Divers find a wreck"]
+    expected = TfidfVectorizer().fit_transform(texts)
+    expected = (expected @ expected.T).toarray()
+    by_id = {e.content_id: sparse_vector_from_bytes(e.vector, settings.HASHING_TFIDF_FEATURES)
+             for e in test_db.query(models.Embedding).filter_by(model_name=TFIDF_MODEL_NAME)}
+    stacked = sparse.vstack([by_id[c] for c in ["1", "2", "3", "007"]])
+    np.testing.assert_allclose((stacked @ stacked.T).toarray(), expected, atol=1e-5)
+
+    # A duplicate id in a later chunk falls back to a full replace
+    (workdir / "uploads" / "mix-csv.csv").write_text(csv + "1,Space Saga II,The sequel,,sci-fi\n")
+    job_id = client.post("/mixes/map-fields", json={"mix_id": "mix-csv", "mappings": MAPPINGS}).json()["job_id"]
+    result = client.get(f"/mixes/jobs/{job_id}").json()["result"]
+    assert result["full_replace"] is True
+    assert test_db.query(models.MixContent).filter_by(mix_id="mix-csv").count() == 5
+
+
+def test_ingest_writes_versioned_catalog_snapshot(client, test_db, workdir):
+    from backend.utils.model_cache import get_content_version, invalidate_mix
+
+    test_db.add(models.Mix(id="mix-csv", title="CSV", status="draft", quality_level="1"))
+    test_db.commit()
+    client.post("/mixes/map-fields", json={"mix_id": "mix-csv", "mappings": MAPPINGS})
+
+    path = workdir / "snapshots" / "mix-csv.snapshot"
+    df, version = catalog_snapshot.read_snapshot(path)
+    assert version == get_content_version(test_db, "mix-csv")
+    assert list(df.columns) == catalog_snapshot.SNAPSHOT_COLUMNS
+    assert sorted(df["content_id"]) == ["1", "2", "3"]
+    assert df.set_index("content_id").loc["2", "text"] == featurize.build_text(df[df["content_id"] == "2"]).iloc[0]
+
+    # Served from the snapshot while current, from the DB once stale
+    test_db.query(models.MixContent).filter_by(mix_id="mix-csv", content_id="3").delete()
+    assert len(featurize.load_mix_frame(test_db, "mix-csv")) == 3
+    invalidate_mix(test_db, "mix-csv")
+    assert len(featurize.load_mix_frame(test_db, "mix-csv")) == 2
+
+
+@pytest.mark.parametrize("arrow", [True, False])
+def test_catalog_snapshot_round_trip(tmp_path, monkeypatch, arrow):
+    if arrow:
+        pytest.importorskip("pyarrow")
+    else:
+        monkeypatch.setattr(catalog_snapshot, "pa", None)
+    df = pd.DataFrame({"content_id": ["a", "b", "c"], "title": ["Café", None, ""],
+                       "description": ["x", "y", None], "tags": [None, "drama", "ü,ñ"]})
+    df["text"] = featurize.build_text(df)
+
+    catalog_snapshot.write_snapshot(tmp_path / "s" / "m.snapshot", df, 7)
+    loaded, version = catalog_snapshot.read_snapshot(tmp_path / "s" / "m.snapshot")
+    assert version == 7
+    assert loaded.where(loaded.notna(), None).to_dict("records") == df.where(df.notna(), None).to_dict("records")
+
+
+def test_copy_text_format_escaping():
+    from backend.utils.bulk_load import _copy_value
+
+    assert _copy_value(None) == "\\N"
+    assert _copy_value("a\tb\nc\\d") == "a\\tb\\nc\\\\d"
+    assert _copy_value(b"\x00\xff") == "\\\\x00ff"
@@ -0,0 +1,559 @@
+"""Tests for the recommendation pipeline."""
+
+import numpy as np
+import scipy.sparse as sp
+
+from backend import models
+from backend.utils.scoring import l2_normalize, similarity_rows, top_k_indices
+from backend.utils.model_cache import ModelCache, model_cache, invalidate_mix
+
+MOVIES = [
+    ("m1", "Space Saga", "Rebels fight an empire among the stars", "sci-fi,action"),
+    ("m2", "Star Voyage", "A crew explores distant stars and planets", "sci-fi,adventure"),
+    ("m3", "Laugh Out Loud", "A family comedy about a chaotic wedding", "comedy"),
+    ("m4", "Wedding Crashers Redux", "Two friends crash a wedding for laughs", "comedy,romance"),
+    ("m5", "Deep Space Nine Lives", "A cat survives a space station disaster", "sci-fi,comedy"),
+]
+
+
+def seed_mix(db, mix_id="mix-1", quality_level="1"):
+    db.add(models.Mix(id=mix_id, title="Movies", status="draft", quality_level=quality_level))
+    for cid, title, desc, tags in MOVIES:
+        # Row ids fix the catalog order (and so tie-breaks) to the listed order
+        db.add(models.MixContent(id=f"{mix_id}-{cid}", mix_id=mix_id, content_id=cid, title=title, description=desc,
+                                 tags=tags))
+    db.commit()
+    return mix_id
+
+
+def test_generate_recommendations_excludes_seed(client, test_db):
+    mix_id = seed_mix(test_db)
+    response = client.get("/mixes/generate-recommendations", params={"mix_id": mix_id, "content_id": "m1"})
+    assert response.status_code == 200
+    ids = [r["content_id"] for r in response.json()["recommendations"]]
+    assert "m1" not in ids
+    assert set(ids[:2]) == {"m2", "m5"}
+
+
+def test_model_cache_reused_until_invalidated(client, test_db):
+    model_cache.clear()
+    mix_id = seed_mix(test_db)
+    params = {"mix_id": mix_id, "content_id": "m1"}
+    client.get("/mixes/generate-recommendations", params=params)
+    cached = model_cache.get((mix_id, "tfidf", 0))
+    assert cached is not None
+    client.get("/mixes/generate-recommendations", params=params)
+    assert model_cache.get((mix_id, "tfidf", 0)) is cached
+
+    invalidate_mix(test_db, mix_id)
+    assert test_db.get(models.Mix, mix_id).content_version == 1
+    assert model_cache.get((mix_id, "tfidf", 0)) is None
+    client.get("/mixes/generate-recommendations", params=params)
+    assert model_cache.get((mix_id, "tfidf", 1)) is not None
+
+
+def test_model_cache_evicts_by_bytes():
+    cache = ModelCache(max_bytes=100)
+    cache.put(("a", "tfidf", 0), "A", 60)
+    cache.put(("b", "tfidf", 0), "B", 60)
+    assert cache.get(("a", "tfidf", 0)) is None
+    assert cache.get(("b", "tfidf", 0)) == "B"
+    cache.put(("c", "tfidf", 0), "C", 500)  # larger than the whole cache
+    assert cache.get(("c", "tfidf", 0)) is None
+    assert cache.invalidate("b") == 1
+
+
+def test_similarity_rows_matches_full_cosine():
+    rng = np.random.default_rng(0)
+    dense = rng.random((20, 8))
+    full = l2_normalize(dense) @ l2_normalize(dense).T
+    for matrix in (l2_normalize(dense), l2_normalize(sp.csr_matrix(dense))):
+        np.testing.assert_allclose(similarity_rows(matrix, [3, 7]), full[[3, 7]], rtol=1e-5)
+
+
+def test_top_k_indices_partial_sort():
+    scores = np.array([0.1, 0.9, 0.5, 0.9, 0.3])
+    assert top_k_indices(scores, 3).tolist() == [1, 3, 2]
+    assert top_k_indices(scores, 10, exclude=[1]).tolist() == [3, 2, 4, 0]
+
+
+def test_level2_filters_watched_items(client, test_db):
+    mix_id = seed_mix(test_db, quality_level="2")
+    test_db.add(models.UserActivity(user_id="u1", mix_id=mix_id, content_id="m2", event_type="watched"))
+    test_db.commit()
+    response = client.get("/mixes/generate-recommendations", params={"mix_id": mix_id, "user_id": "u1", "content_id": "m1"})
+    assert response.status_code == 200
+    recs = response.json()["recommendations"]
+    assert "m2" not in [r["content_id"] for r in recs]
+    assert [r["score"] for r in recs] == sorted((r["score"] for r in recs), reverse=True)
+
+
+def test_sentence_embeddings_persisted_and_reused(test_db, monkeypatch):
+    from backend.utils import embeddings
+    from backend.utils.featurize import load_mix_frame, prepare_frame
+
+    encoded = []
+
+    def fake_encode(texts):
+        texts = list(texts)
+        encoded.append(len(texts))
+        return np.array([[len(t), t.count("a"), 1.0] for t in texts], dtype=np.float32)
+
+    monkeypatch.setattr(embeddings, "encode_texts", fake_encode)
+    mix_id = seed_mix(test_db, quality_level="3")
+
+    first = embeddings.sync_sentence_embeddings(test_db, mix_id, prepare_frame(load_mix_frame(test_db, mix_id)))
+    assert first.dtype == np.float32 and first.shape == (len(MOVIES), 3)
+    assert encoded == [len(MOVIES)]
+
+    row = test_db.query(models.MixContent).filter_by(mix_id=mix_id, content_id="m3").one()
+    row.description = "A completely different plot"
+    test_db.commit()
+    stored_hash = test_db.query(models.Embedding).filter_by(mix_id=mix_id, content_id="m3").one().text_hash
+
+    # Serving encodes the stale item but leaves persisting it to ingest
+    served = embeddings.load_sentence_embeddings(test_db, mix_id, prepare_frame(load_mix_frame(test_db, mix_id)))
+    assert encoded == [len(MOVIES), 1]
+    assert test_db.query(models.Embedding).filter_by(mix_id=mix_id, content_id="m3").one().text_hash == stored_hash
+
+    second = embeddings.sync_sentence_embeddings(test_db, mix_id, prepare_frame(load_mix_frame(test_db, mix_id)))
+    assert encoded == [len(MOVIES), 1, 1]
+    np.testing.assert_array_equal(first[0], second[0])
+    np.testing.assert_array_equal(served, second)
+    assert test_db.query(models.Embedding).filter_by(mix_id=mix_id, content_id="m3").one().text_hash != stored_hash
+
+
+def test_ivf_index_recall_improves_with_nprobe():
+    from backend.utils.ann import build_ann_index
+
+    rng = np.random.default_rng(1)
+    vectors = l2_normalize(rng.normal(size=(2000, 16)))
+    index = build_ann_index(vectors, n_lists=40)
+    exact = set(top_k_indices(vectors @ vectors[5], 10).tolist())
+
+    low = set(index.search(vectors[5], 10, nprobe=1).tolist())
+    full = set(index.search(vectors[5], 10, nprobe=40).tolist())
+    assert full == exact
+    assert len(low & exact) <= len(full & exact)
+
+
+def test_ann_serving_path(client, test_db, monkeypatch, tmp_path):
+    from backend import settings
+    from backend.utils import featurize
+
+    monkeypatch.setattr(settings, "ANN_MIN_ITEMS", 1)
+    monkeypatch.setattr(featurize, "mix_ann_path", lambda mix_id, f: tmp_path / f"{mix_id}.{f}.npz")
+    mix_id = seed_mix(test_db)
+    params = {"mix_id": mix_id, "content_id": "m1"}
+    exact = client.get("/mixes/generate-recommendations", params=params).json()
+    assert featurize.cached_features(test_db, mix_id, "tfidf").ann is None  # requests never build the index
+
+    # Built at ingest; a cold process loads it instead of clustering
+    assert featurize.rebuild_ann_index(test_db, mix_id, "tfidf") == len(MOVIES)
+    model_cache.clear()
+    monkeypatch.setattr(featurize, "build_ann_index", None)
+    from backend.utils.response_cache import response_cache
+    response_cache.clear()
+    response = client.get("/mixes/generate-recommendations", params=params)
+    assert response.status_code == 200
+    assert featurize.cached_features(test_db, mix_id, "tfidf").ann is not None
+    assert "m1" not in [r["content_id"] for r in response.json()["recommendations"]]
+    assert response.json()["recommendations"][0]["content_id"] == exact["recommendations"][0]["content_id"]
+
+    # An index from an older content version is ignored
+    invalidate_mix(test_db, mix_id)
+    assert featurize.get_features(test_db, mix_id, "tfidf").ann is None
+
+
+def test_batch_matches_single_requests_in_order(client, test_db):
+    mix_id = seed_mix(test_db, quality_level="2")
+    test_db.add(models.UserActivity(user_id="u1", mix_id=mix_id, content_id="m3", event_type="watched"))
+    test_db.commit()
+    queries = [
+        {"content_id": "m1"},
+        {"user_id": "u1"},
+        {"content_id": "missing"},
+        {"user_id": "u1", "content_id": "m2"},
+    ]
+    response = client.post("/mixes/generate-recommendations/batch",
+                           json={"mix_id": mix_id, "top_k": 3, "requests": queries})
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert len(results) == len(queries)
+    assert results[2]["error"] == "Content ID not found"
+
+    for query, result in zip(queries, results):
+        if "error" in result:
+            continue
+        single = client.get("/mixes/generate-recommendations", params={"mix_id": mix_id, "top_k": 3, **query})
+        assert result == single.json()
+
+
+def test_neighbor_table_serves_seed_only_requests(client, test_db, tmp_path, monkeypatch):
+    from backend.utils import neighbors
+
+    monkeypatch.setattr(neighbors, "mix_neighbors_path", lambda mix_id, f: tmp_path / f"{mix_id}.{f}.npz")
+    mix_id = seed_mix(test_db)
+    params = {"mix_id": mix_id, "content_id": "m1", "top_k": 3}
+    computed = client.get("/mixes/generate-recommendations", params=params).json()
+
+    assert neighbors.rebuild_neighbors(test_db, mix_id, ["tfidf"]) == {"tfidf": len(MOVIES)}
+    assert neighbors.lookup_neighbors(test_db, mix_id, "tfidf", "m1", 100) is not None
+    assert client.get("/mixes/generate-recommendations", params=params).json() == computed
+
+    invalidate_mix(test_db, mix_id)  # stale tables are never served
+    assert neighbors.lookup_neighbors(test_db, mix_id, "tfidf", "m1", 100) is None
+
+
+def test_neighbor_table_incremental_update_matches_rebuild():
+    import pandas as pd
+    from backend.utils.model_cache import MixFeatures
+    from backend.utils.neighbors import build_table, update_table
+
+    rng = np.random.default_rng(2)
+    vectors = l2_normalize(rng.normal(size=(60, 8)))
+    df = pd.DataFrame({"content_id": [f"c{i}" for i in range(60)], "title": [f"t{i}" for i in range(60)]})
+    old = build_table(MixFeatures(df=df, matrix=vectors, index={}), version=1, m=5)
+
+    # c3 changes text + vector, c7 is removed, c60 is new
+    vectors2 = np.vstack([np.delete(vectors, 7, axis=0), l2_normalize(rng.normal(size=(1, 8)))])
+    vectors2[3] = l2_normalize(rng.normal(size=(1, 8)))[0]
+    df2 = pd.concat([df.drop(index=7), pd.DataFrame({"content_id": ["c60"], "title": ["t60"]})], ignore_index=True)
+    df2.loc[3, "title"] = "changed"
+    features2 = MixFeatures(df=df2, matrix=vectors2, index={})
+
+    updated = update_table(old, features2, version=2)
+    rebuilt = build_table(features2, version=2, m=5)
+    np.testing.assert_array_equal(updated.neighbors, rebuilt.neighbors)
+    np.testing.assert_allclose(updated.scores, rebuilt.scores, rtol=1e-6)
+
+
+def test_run_blocking_uses_executor_thread():
+    import asyncio
+    import threading
+    from backend.utils.executors import run_blocking
+
+    name = asyncio.run(run_blocking(lambda: threading.current_thread().name))
+    assert name.startswith("rec-db")
+
+
+def test_metrics_endpoint_reports_stage_latencies(client, test_db):
+    mix_id = seed_mix(test_db, mix_id="mix-metrics", quality_level="2")
+    client.get("/mixes/generate-recommendations", params={"mix_id": mix_id, "user_id": "u1", "content_id": "m1"})
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    for name in ("total", "load", "featurize", "similarity", "hybrid"):
+        assert f'recommendation_stage_seconds_count{{stage="{name}",mix_id="{mix_id}"' in body
+    assert 'cache="miss"' in body
+    assert "model_cache_bytes" in body
+
+
+def test_response_cache_invalidated_by_writes(client, test_db):
+    from backend.utils.response_cache import response_cache
+
+    mix_id = seed_mix(test_db, mix_id="mix-rc", quality_level="2")
+    params = {"mix_id": mix_id, "user_id": "u1", "content_id": "m1", "top_k": 3}
+    other = {"mix_id": mix_id, "user_id": "u2", "content_id": "m1", "top_k": 3}
+    hits = response_cache.stats()["hits"]
+    first = client.get("/mixes/generate-recommendations", params=params).json()
+    client.get("/mixes/generate-recommendations", params=other)
+    assert client.get("/mixes/generate-recommendations", params=params).json() == first
+    assert response_cache.stats()["hits"] == hits + 1
+
+    # Activity only drops the acting user's entries
+    client.post("/user-activity", json={"user_id": "u1", "mix_id": mix_id, "content_id": "m2", "event_type": "watched"})
+    second = client.get("/mixes/generate-recommendations", params=params).json()
+    assert "m2" not in [r["content_id"] for r in second["recommendations"]]
+    client.get("/mixes/generate-recommendations", params=other)
+    assert response_cache.stats()["hits"] == hits + 2
+
+    # Rules apply to every user of the mix
+    client.post("/mixes/set-rules", params={"mix_id": mix_id}, json={"pinned_content_ids": ["m4"]})
+    pinned = client.get("/mixes/generate-recommendations", params=other).json()
+    assert pinned["recommendations"][0]["content_id"] == "m4"
+    client.delete("/mixes/delete-rules", params={"mix_id": mix_id})
+    unpinned = client.get("/mixes/generate-recommendations", params=other).json()
+    assert unpinned["recommendations"][0]["content_id"] != "m4"
+
+    metrics = client.get("/metrics").text
+    assert f"response_cache_hits_total {hits + 2}" in metrics
+
+
+def test_response_cache_indexes_entries_and_forgets_old_versions(monkeypatch):
+    from backend.utils import response_cache as rc
+
+    clock = [100.0]
+    monkeypatch.setattr(rc.time, "monotonic", lambda: clock[0])
+    cache = rc.ResponseCache(max_entries=10, ttl_seconds=60)
+    for user_id in ("u1", "u2", None):
+        cache.put(cache.make_key("mix", "m1", user_id, 2, 5), user_id)
+    cache.put(cache.make_key("other", "m1", "u1", 2, 5), "other")
+
+    assert cache.invalidate_user("mix", "u1") == 1
+    assert cache.get(cache.make_key("mix", "m1", "u2", 2, 5)) == "u2"
+    assert cache.invalidate_content("mix") == 2
+    assert cache.get(cache.make_key("other", "m1", "u1", 2, 5)) == "other"
+
+    # Versions of users without cached entries are dropped once older than the TTL
+    for n in range(50):
+        clock[0] += 10
+        cache.invalidate_user("mix", f"user-{n}")
+    assert len(cache._activity_versions) <= 8
+
+
+def test_diversity_weight_reranks_with_mmr(client, test_db):
+    mix_id = seed_mix(test_db, mix_id="mix-mmr")
+    params = {"mix_id": mix_id, "content_id": "m1", "top_k": 4}
+    plain = [r["content_id"] for r in client.get("/mixes/generate-recommendations", params=params).json()["recommendations"]]
+
+    client.post("/mixes/set-rules", params={"mix_id": mix_id}, json={"diversity_weight": 1.0, "max_from_same_tag": 10})
+    diverse = [r["content_id"] for r in client.get("/mixes/generate-recommendations", params=params).json()["recommendations"]]
+    assert diverse[0] == plain[0]
+    assert sorted(diverse) == sorted(plain)
+    assert diverse != plain
+
+
+def test_rules_saved_before_mmr_keep_their_order(client, test_db):
+    mix_id = seed_mix(test_db, mix_id="mix-legacy-rules")
+    params = {"mix_id": mix_id, "content_id": "m1", "top_k": 4}
+    client.post("/mixes/set-rules", params={"mix_id": mix_id}, json={"max_from_same_tag": 10})
+    plain = [r["content_id"] for r in client.get("/mixes/generate-recommendations", params=params).json()["recommendations"]]
+
+    # What the UI saved from the old get-rules defaults
+    legacy = {"max_diversity": 1.0, "min_content_score": 0.0, "max_results": 10, "exclude_tags": [],
+              "include_tags": [], "boost_tags": [], "max_from_same_tag": 10, "random_sample": False,
+              "pinned_content_ids": []}
+    client.post("/mixes/set-rules", params={"mix_id": mix_id}, json=legacy)
+    assert [r["content_id"] for r in
+            client.get("/mixes/generate-recommendations", params=params).json()["recommendations"]] == plain
+
+
+def test_unseeded_random_sample_is_not_cached(client, test_db):
+    from backend.utils.response_cache import response_cache
+
+    mix_id = seed_mix(test_db, mix_id="mix-random")
+    params = {"mix_id": mix_id, "content_id": "m1", "top_k": 4}
+    client.post("/mixes/set-rules", params={"mix_id": mix_id}, json={"random_sample": True, "max_from_same_tag": 10})
+    for _ in range(2):
+        client.get("/mixes/generate-recommendations", params=params)
+    assert response_cache.stats()["entries"] == 0
+
+    client.post("/mixes/set-rules", params={"mix_id": mix_id},
+                json={"random_sample": True, "random_seed": 3, "max_from_same_tag": 10})
+    client.get("/mixes/generate-recommendations", params=params)
+    assert response_cache.stats()["entries"] == 1
+
+
+def test_include_tags_filter_before_top_k(client, test_db):
+    mix_id = "mix-filter"
+    test_db.add(models.Mix(id=mix_id, title="Big", status="draft", quality_level="1"))
+    for i in range(150):
+        test_db.add(models.MixContent(id=f"s{i:03d}", mix_id=mix_id, content_id=f"s{i}", title=f"Space battle {i}",
+                                      description="Starships fight in space", tags="sci-fi"))
+    for i in range(3):
+        test_db.add(models.MixContent(id=f"d{i}", mix_id=mix_id, content_id=f"d{i}", title=f"Bird migration {i}",
+                                      description="Birds fly south", tags="documentary"))
+    test_db.commit()
+
+    client.post("/mixes/set-rules", params={"mix_id": mix_id}, json={"include_tags": ["documentary"]})
+    response = client.get("/mixes/generate-recommendations", params={"mix_id": mix_id, "content_id": "s0", "top_k": 3})
+    assert [r["content_id"] for r in response.json()["recommendations"]] == ["d0", "d1", "d2"]
+
+
+def test_taste_fold_matches_rebuild(monkeypatch):
+    from datetime import datetime, timedelta
+
+    import pandas as pd
+
+    from backend import settings
+    from backend.utils.model_cache import MixFeatures
+    from backend.utils.taste import UserTaste, build_taste
+
+    rng = np.random.default_rng(0)
+    ids = [f"c{i}" for i in range(30)]
+    dense = l2_normalize(rng.random((30, 12)).astype(np.float32))
+    sparse = sp.csr_matrix(np.where(dense > 0.3, dense, 0))
+    start = datetime(2030, 1, 1)
+    events = [(f"c{i}", start + timedelta(hours=3 * n)) for n, i in enumerate(rng.integers(0, 30, 40))]
+    events += [("gone", start + timedelta(days=6)), (None, start + timedelta(days=7))]
+    events.insert(5, ("c29", start + timedelta(hours=1)))  # arrives late
+
+    for half_life in (0.0, 2.0):
+        monkeypatch.setattr(settings, "TASTE_HALF_LIFE_DAYS", half_life)
+        for matrix in (dense, sparse):
+            features = MixFeatures(pd.DataFrame({"content_id": ids}), matrix, {c: i for i, c in enumerate(ids)})
+            folded = UserTaste.empty(12)
+            for content_id, timestamp in events:
+                folded.fold(features, content_id, timestamp)
+            rebuilt = build_taste(features, sorted(events, key=lambda e: e[1]))
+            assert folded.items.tolist() == rebuilt.items.tolist()
+            assert np.allclose(folded.mean(), rebuilt.mean(), atol=1e-6)
+            assert np.isclose(folded.weight, rebuilt.weight)
+            assert (folded.last_content_id, folded.last_event_at) == (None, start + timedelta(days=7))
+
+    # Half-life of a day: an item watched a day before the latest counts half
+    monkeypatch.setattr(settings, "TASTE_HALF_LIFE_DAYS", 1.0)
+    features = MixFeatures(pd.DataFrame({"content_id": ids}), dense, {c: i for i, c in enumerate(ids)})
+    taste = build_taste(features, [("c0", start), ("c1", start + timedelta(days=1))])
+    assert np.isclose(taste.weight, 1.5)
+    assert np.allclose(taste.mean(), (0.5 * dense[0] + dense[1]) / 1.5, atol=1e-6)
+
+
+def test_taste_profile_follows_activity(client, test_db):
+    from backend.utils import taste
+    from backend.utils.response_cache import response_cache
+
+    mix_id = seed_mix(test_db, mix_id="mix-taste", quality_level="2")
+    test_db.add(models.UserActivity(user_id="u1", mix_id=mix_id, content_id="m2", event_type="watched"))
+    test_db.commit()
+    params = {"mix_id": mix_id, "user_id": "u1"}
+    # Requests compute a missing profile from the history without storing it
+    first = client.get("/mixes/generate-recommendations", params=params).json()
+    assert first["based_on"] == "m2"
+    assert test_db.query(models.TasteProfile).filter_by(user_id="u1", mix_id=mix_id).count() == 0
+
+    # Logged activity creates the profile from the whole history...
+    client.post("/user-activity", json={"user_id": "u1", "mix_id": mix_id, "content_id": "m3", "event_type": "watched"})
+    test_db.expire_all()
+    profile = test_db.query(models.TasteProfile).filter_by(user_id="u1", mix_id=mix_id).one()
+    assert profile.featurizer == "tfidf" and profile.weight == 2
+    # ...and folds later events into it
+    client.post("/user-activity", json={"user_id": "u1", "mix_id": mix_id, "content_id": "m4", "event_type": "watched"})
+    test_db.expire_all()
+    assert test_db.query(models.TasteProfile).filter_by(user_id="u1", mix_id=mix_id).one().weight == 3
+    second = client.get("/mixes/generate-recommendations", params=params).json()
+    assert second["based_on"] == "m4"
+    assert not {"m2", "m3", "m4"} & {r["content_id"] for r in second["recommendations"]}
+
+    # ...and matches a profile computed from the history
+    taste.drop_tastes(test_db, mix_id, "u1")
+    test_db.commit()
+    model_cache.clear()
+    response_cache.clear()
+    assert client.get("/mixes/generate-recommendations", params=params).json() == second
+
+    # Content changes make a profile stale; the ingest job (or the next activity) rebuilds it
+    client.post("/user-activity", json={"user_id": "u1", "mix_id": mix_id, "content_id": "m5", "event_type": "watched"})
+    invalidate_mix(test_db, mix_id)
+    assert taste.rebuild_tastes(test_db, mix_id) == 1
+    assert taste.rebuild_tastes(test_db, mix_id) == 0
+    test_db.expire_all()
+    profile = test_db.query(models.TasteProfile).filter_by(user_id="u1", mix_id=mix_id).one()
+    assert profile.weight == 4
+
+    # Activity never featurizes: without cached features the profile is only marked stale...
+    invalidate_mix(test_db, mix_id)
+    client.post("/user-activity", json={"user_id": "u1", "mix_id": mix_id, "content_id": "m1", "event_type": "watched"})
+    test_db.expire_all()
+    profile = test_db.query(models.TasteProfile).filter_by(user_id="u1", mix_id=mix_id).one()
+    assert profile.content_version == taste.STALE_VERSION and profile.weight == 4
+    # ...and the next write after a request cached them rebuilds it
+    assert client.get("/mixes/generate-recommendations", params=params).json()["based_on"] == "m1"
+    client.post("/user-activity", json={"user_id": "u1", "mix_id": mix_id, "content_id": "m1", "event_type": "watched"})
+    test_db.expire_all()
+    profile = test_db.query(models.TasteProfile).filter_by(user_id="u1", mix_id=mix_id).one()
+    assert profile.weight == 5
+    assert profile.content_version == test_db.get(models.Mix, mix_id).content_version
+
+    # A new quality level's feature space gets its own profile
+    from backend.utils.featurize import cached_features
+    features = cached_features(test_db, mix_id, "tfidf")
+    model_cache.put((mix_id, "sentence", profile.content_version), features, features.nbytes)
+    test_db.get(models.Mix, mix_id).quality_level = "3"
+    test_db.commit()
+    client.post("/user-activity", json={"user_id": "u1", "mix_id": mix_id, "content_id": "m2", "event_type": "watched"})
+    test_db.expire_all()
+    assert {(p.featurizer, p.weight) for p in test_db.query(models.TasteProfile).filter_by(user_id="u1", mix_id=mix_id)} == \
+        {("tfidf", 5), ("sentence", 5)}
+
+
+def test_cooccurrence_incremental_matches_full_count(monkeypatch):
+    from datetime import datetime, timedelta
+
+    from backend import settings
+    from backend.utils.cooccurrence import CoOccurrence, normalize_counts
+
+    rng = np.random.default_rng(1)
+    index = {f"c{i}": i for i in range(40)}
+    start = datetime(2030, 1, 1)
+    events = [(f"u{rng.integers(0, 15)}", f"c{rng.integers(0, 45)}", start + timedelta(seconds=n)) for n in range(300)]
+    B = np.zeros((15, 40), dtype=np.float32)
+    for user_id, content_id, _ in events:
+        if content_id in index:
+            B[int(user_id[1:]), index[content_id]] = 1
+    expected = B.T @ B
+
+    for method in ("cosine", "jaccard"):
+        monkeypatch.setattr(settings, "COOCCURRENCE_NORMALIZATION", method)
+        whole, chunked = CoOccurrence(index, 40), CoOccurrence(index, 40)
+        whole.add_events(events)
+        for n in range(0, len(events), 37):
+            chunked.add_events(events[n:n + 37])
+        chunked.add_events(events[:50])  # re-reading events is a no-op
+        assert np.array_equal(whole.counts.toarray(), expected)
+        assert np.array_equal(chunked.counts.toarray(), expected)
+        assert np.allclose(chunked.similarity.toarray(), whole.similarity.toarray())
+        assert chunked.seen_until == events[-1][2]
+
+    counts = sp.csr_matrix(np.array([[3, 2, 0], [2, 2, 1], [0, 1, 4]], dtype=np.float32))
+    assert np.allclose(normalize_counts(counts, "cosine").toarray(),
+                       [[0, 2 / np.sqrt(6), 0], [2 / np.sqrt(6), 0, 1 / np.sqrt(8)], [0, 1 / np.sqrt(8), 0]])
+    assert np.allclose(normalize_counts(counts, "jaccard").toarray(),
+                       [[0, 2 / 3, 0], [2 / 3, 0, 1 / 5], [0, 1 / 5, 0]])
+
+
+def test_cooccurrence_cold_build_runs_once(monkeypatch):
+    import threading
+    import time
+
+    import pandas as pd
+
+    from backend.utils import cooccurrence
+    from backend.utils.model_cache import MixFeatures
+
+    builds = []
+
+    def slow_refresh(self, db, mix_id):
+        builds.append(mix_id)
+        time.sleep(0.05)
+        return 0
+
+    monkeypatch.setattr(cooccurrence, "get_content_version", lambda db, mix_id: 0)
+    monkeypatch.setattr(cooccurrence.CoOccurrence, "refresh", slow_refresh)
+    model_cache.clear()
+    features = MixFeatures(df=pd.DataFrame({"content_id": ["c0", "c1"]}), matrix=np.eye(2), index={"c0": 0, "c1": 1})
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cooccurrence.get_cooccurrence(None, "mix-cold", features)))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert builds == ["mix-cold"]
+    assert len({id(result) for result in results}) == 1
+    assert not cooccurrence._build_locks
+    model_cache.clear()
+
+
+def test_level2_boosts_items_co_watched_by_others(client, test_db, monkeypatch):
+    from backend import settings
+    from backend.utils.response_cache import response_cache
+
+    monkeypatch.setattr(settings, "COOCCURRENCE_REFRESH_SECONDS", 0.0)
+    mix_id = seed_mix(test_db, mix_id="mix-cooc", quality_level="2")
+    params = {"mix_id": mix_id, "user_id": "u1", "content_id": "m1"}
+    client.post("/user-activity", json={"user_id": "u1", "mix_id": mix_id, "content_id": "m2", "event_type": "watched"})
+    before = {r["content_id"]: r["score"] for r in
+              client.get("/mixes/generate-recommendations", params=params).json()["recommendations"]}
+
+    client.post("/user-activity/batch", json=[{"user_id": u, "mix_id": mix_id, "content_id": c, "event_type": "watched"}
+                                              for u in ("u2", "u3") for c in ("m2", "m4")])
+    response_cache.clear()
+    after = {r["content_id"]: r["score"] for r in
+             client.get("/mixes/generate-recommendations", params=params).json()["recommendations"]}
+    # m2 and m4 co-occur for 2 users; m2 has 3 users, m4 has 2: cosine 2 / sqrt(6), Level 2 weight 0.5
+    assert np.isclose(after["m4"] - before["m4"], 0.5 * 2 / np.sqrt(6), atol=1e-5)
+    assert all(np.isclose(after[c], before[c]) for c in before if c != "m4")
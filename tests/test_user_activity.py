@@ -0,0 +1,147 @@
+"""Tests for user activity ingestion (batch endpoint, write-behind buffer) and paginated listings."""
+import json
+import threading
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from backend import models, settings
+from backend.utils import activity
+
+
+def add_mix(db, mix_id="mix-ua"):
+    db.add(models.Mix(id=mix_id, title="Activity", status="draft", quality_level="1"))
+    db.commit()
+    return mix_id
+
+
+def test_batch_endpoint_bulk_inserts_events(client, test_db):
+    mix_id = add_mix(test_db)
+    events = [{"user_id": f"u{i % 3}", "mix_id": mix_id, "content_id": f"c{i}", "event_type": "heartbeat"}
+              for i in range(25)]
+    response = client.post("/user-activity/batch", json=events)
+    assert response.status_code == 200
+    assert response.json() == {"inserted": 25}
+
+    rows = client.get("/user-activity/by-user/u1").json()
+    assert len(rows) == 8 and all(r["timestamp"] for r in rows)
+
+    unknown = client.post("/user-activity/batch", json=[{**events[0], "mix_id": "nope"}])
+    assert unknown.status_code == 404
+    assert test_db.query(models.UserActivity).count() == 25
+
+
+def test_batch_endpoint_rejects_oversized_batches(client, test_db, monkeypatch):
+    monkeypatch.setattr(settings, "ACTIVITY_BATCH_MAX_EVENTS", 2)
+    mix_id = add_mix(test_db)
+    event = {"user_id": "u1", "mix_id": mix_id, "event_type": "play"}
+    assert client.post("/user-activity/batch", json=[event] * 3).status_code == 413
+
+
+def test_write_behind_buffers_until_flushed(client, test_db, monkeypatch):
+    monkeypatch.setattr(settings, "ACTIVITY_FLUSH_ROWS", 100)
+    monkeypatch.setattr(settings, "ACTIVITY_FLUSH_SECONDS", 60.0)
+    monkeypatch.setattr(activity, "_closed", False)
+    mix_id = add_mix(test_db)
+    try:
+        responses = [client.post("/user-activity", json={"user_id": "u1", "mix_id": mix_id,
+                                                         "content_id": f"c{i}", "event_type": "play"})
+                     for i in range(3)]
+        assert [r.status_code for r in responses] == [202] * 3
+        assert test_db.query(models.UserActivity).count() == 0
+    finally:
+        # Shutdown flushes whatever is still queued
+        activity.shutdown_activity_buffer()
+
+    stored = {r.id: r.content_id for r in test_db.query(models.UserActivity)}
+    assert stored == {r.json()["id"]: r.json()["content_id"] for r in responses}
+
+    # Events arriving after shutdown are written synchronously, not queued on a new writer
+    late = client.post("/user-activity", json={"user_id": "u1", "mix_id": mix_id, "content_id": "late",
+                                               "event_type": "play"})
+    assert late.status_code == 200
+    assert activity._buffer is None
+    assert test_db.query(models.UserActivity).filter_by(content_id="late").count() == 1
+
+
+def test_buffer_applies_back_pressure_and_flushes_on_stop():
+    release = threading.Event()
+    written = []
+
+    def write(rows):
+        release.wait()
+        written.extend(rows)
+        return len(rows)
+
+    buffer = activity.ActivityBuffer(flush_rows=1, flush_seconds=60.0, max_events=1, write=write)
+    buffer.put({"n": 1}, timeout=1.0)
+    while buffer.queued():  # the writer takes the first row and blocks in write()
+        pass
+    buffer.put({"n": 2}, timeout=1.0)
+    with pytest.raises(HTTPException) as excinfo:
+        buffer.put({"n": 3}, timeout=0.01)
+    assert excinfo.value.status_code == 503
+
+    release.set()
+    buffer.stop()
+    assert written == [{"n": 1}, {"n": 2}]
+    assert buffer.put({"n": 4}, timeout=1.0) is False
+
+
+def collect_pages(client, url, **params):
+    """Follow X-Next-Cursor through a listing; returns the pages."""
+    pages, cursor = [], None
+    while True:
+        response = client.get(url, params={**params, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        pages.append(response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return pages
+
+
+def test_activity_listings_page_by_keyset(client, test_db):
+    mix_id = add_mix(test_db)
+    # Server-default and explicit timestamps, with ties
+    for i in range(4):
+        test_db.add(models.UserActivity(user_id="u1", mix_id=mix_id, content_id=f"d{i}", event_type="play"))
+    test_db.commit()
+    client.post("/user-activity/batch", json=[{"user_id": "u1", "mix_id": mix_id, "content_id": f"b{i}",
+                                              "event_type": "play"} for i in range(3)])
+    rows = [activity.activity_row("u1", mix_id, f"t{i}", "play", timestamp=datetime(2030, 1, 1, 0, 0, i % 2))
+            for i in range(3)]
+    activity.insert_activity(test_db, rows)
+    test_db.commit()
+
+    pages = collect_pages(client, "/user-activity/by-mix/" + mix_id, limit=3)
+    assert [len(p) for p in pages] == [3, 3, 3, 1]
+    items = [r for p in pages for r in p]
+    assert len({r["id"] for r in items}) == 10
+    assert [r["content_id"][0] for r in items[:3]] == ["t", "t", "t"]  # newest first
+    assert [r["timestamp"] for r in items] == sorted((r["timestamp"] for r in items), reverse=True)
+
+    by_user = collect_pages(client, "/user-activity/by-user/u1", mix_id=mix_id, limit=4)
+    assert [r["id"] for p in by_user for r in p] == [r["id"] for r in items]
+
+    stream = client.get(f"/user-activity/by-mix/{mix_id}", params={"format": "ndjson"})
+    assert stream.headers["content-type"].startswith("application/x-ndjson")
+    assert [json.loads(line)["id"] for line in stream.text.splitlines()] == [r["id"] for r in items]
+
+    assert client.get(f"/user-activity/by-mix/{mix_id}", params={"cursor": "garbage"}).status_code == 400
+
+
+def test_mix_and_user_listings_are_paginated(client, test_db):
+    for i in range(5):
+        test_db.add(models.Mix(id=f"mix-{i}", title=f"Mix {i}", status="live" if i % 2 else "draft",
+                               quality_level="1", created_at=datetime(2030, 1, 1 + i)))
+        test_db.add(models.User(supabase_user_id=f"s{i}", email=f"u{i}@example.com"))
+    test_db.commit()
+
+    pages = collect_pages(client, "/mixes/", limit=2)
+    assert [m["mix_id"] for p in pages for m in p] == [f"mix-{i}" for i in reversed(range(5))]
+    live = collect_pages(client, "/mixes/", status="live", limit=1)
+    assert [m["mix_id"] for p in live for m in p] == ["mix-3", "mix-1"]
+
+    users = [u["id"] for p in collect_pages(client, "/users", limit=2) for u in p]
+    assert len(users) == 5 and users == sorted(users)